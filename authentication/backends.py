@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+
+# The condition of the auth_user_email_lower_idx partial index. It is
+# spelled out literally, databases only use a partial index for queries
+# repeating its condition, and SQLite does not match bound parameters.
+HAS_EMAIL = RawSQL("\"auth_user\".\"email\" <> ''", (), output_field=BooleanField())
+
+
+def email_filter(email):
+    """
+    Filter matching users with the given email in any case. It matches the
+    ``auth_user_email_lower_idx`` index, so the lookup is a single index
+    probe however many users there are, unlike ``email__iexact``.
+    """
+    return Q(email_lower=email.lower()) & Q(HAS_EMAIL)
+
+
+def with_email_lower(queryset):
+    return queryset.alias(email_lower=Lower('email'))
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """
+    Authenticate with a username or an email address, in any case, resolved
+    with one query through the unique username index and the lower(email)
+    index. A username matching exactly wins over an email. An email shared
+    by several users does not log in, they have to use their username.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        match = Q(username=username)
+        if '@' in username:
+            match |= email_filter(username)
+        users = list(with_email_lower(UserModel._default_manager.all()).filter(match))
+        exact = [user for user in users if user.username == username]
+        if exact:
+            users = exact
+
+        if len(users) != 1:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            return None
+
+        user = users[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -2,6 +2,8 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django import forms
 
+from .backends import email_filter, with_email_lower
+
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -9,3 +11,11 @@ class CustomUserCreationForm(UserCreationForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'password1', 'password2')
+
+    def clean_email(self):
+        # New emails must be unused in any case, checked through the
+        # lower(email) index
+        email = self.cleaned_data['email']
+        if with_email_lower(User.objects.all()).filter(email_filter(email)).exists():
+            raise forms.ValidationError('A user with that email already exists.')
+        return email
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the number of iterations set by PASSWORD_PBKDF2_ITERATIONS.
+
+    Hashes made with another number of iterations still verify, and are
+    rehashed with the configured number when their user logs in.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
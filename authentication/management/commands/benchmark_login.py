@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from authentication.throttling import is_locked_out
+
+
+# Hashers of each profile, see PASSWORD_HASHER_PROFILE
+PROFILES = {
+    'pbkdf2': 'authentication.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure successful logins per second on one core with each '
+            'password hasher profile, and how fast throttled attempts are '
+            'rejected. Creates its own user and removes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20,
+                            help='Number of logins per profile.')
+        parser.add_argument('--iterations', type=int, action='append',
+                            help='PBKDF2 iterations to measure, can be repeated. '
+                                 'Defaults to PASSWORD_PBKDF2_ITERATIONS.')
+
+    def handle(self, *args, **options):
+        password = 'benchmark-login-password'
+        user = get_user_model().objects.create(username='benchmark-login')
+        request = RequestFactory().post('/auth/login/')
+
+        runs = [(f'pbkdf2 {iterations}', PROFILES['pbkdf2'], iterations)
+                for iterations in options['iterations'] or [settings.PASSWORD_PBKDF2_ITERATIONS]]
+        runs += [(profile, hasher, None) for profile, hasher in PROFILES.items() if profile != 'pbkdf2']
+
+        try:
+            for name, hasher, iterations in runs:
+                overrides = {'PASSWORD_HASHERS': [hasher]}
+                if iterations:
+                    overrides['PASSWORD_PBKDF2_ITERATIONS'] = iterations
+                with override_settings(**overrides):
+                    try:
+                        user.set_password(password)
+                    except ValueError as e:
+                        # The library of the hasher is not installed
+                        self.stdout.write(f'{name:>14}: skipped, {e}')
+                        continue
+                    user.save(update_fields=['password'])
+
+                    started = time.perf_counter()
+                    for _ in range(options['logins']):
+                        authenticate(request, username=user.username, password=password)
+                    elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{name:>14}: {options["logins"] / elapsed:8.1f} logins/sec per core, '
+                    f'{elapsed / options["logins"] * 1000:7.1f} ms per login')
+
+            # A throttled attempt only reads the failure counters
+            started = time.perf_counter()
+            for _ in range(options['logins']):
+                is_locked_out(request, user.username)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{"throttled":>14}: {options["logins"] / elapsed:8.1f} rejections/sec per core, '
+                f'{elapsed / options["logins"] * 1000:7.3f} ms per rejection')
+        finally:
+            user.delete()
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    # Build the index without locking out writes to a large user table
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f"CREATE INDEX {concurrently}auth_user_email_lower_idx ON auth_user (LOWER(email)) "
+        f"WHERE email <> ''")
+
+
+def drop_index(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'DROP INDEX {concurrently}auth_user_email_lower_idx')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    # Index the emails of auth_user in lower case, so they can be looked up in
+    # any case without scanning the table. The index is not unique, existing
+    # users may share an email, registration checks new ones instead. Users
+    # without an email are left out of the index.
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,9 +1,15 @@
-from django.contrib.auth import login
+from django.contrib.auth import authenticate, login
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
+from io import StringIO
+from unittest.mock import patch
+from .backends import email_filter, with_email_lower
 from .forms import CustomUserCreationForm
 
 
@@ -122,6 +128,180 @@ class LoginViewTests(TestCase):
         self.assertEqual(str(messages[0]), "Invalid username or password")
 
 
+@override_settings(LOGIN_THROTTLE_CACHE='default', LOGIN_USERNAME_FAILURE_LIMIT=3,
+                   LOGIN_IP_FAILURE_LIMIT=5)
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+    def _login(self, username='testuser', password='Wrongpassword!', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password},
+                                REMOTE_ADDR=ip)
+
+    def test_username_lockout(self):
+        """
+        Test that a username is rejected without hashing the password once
+        it failed too often, even with the right password and from another
+        client.
+        """
+        for _ in range(3):
+            self.assertEqual(self._login().status_code, 200)
+
+        with patch('authentication.views.authenticate') as authenticate:
+            response = self._login(password='Testpassword123!', ip='10.0.0.2')
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+        self.assertEqual(str(list(get_messages(response.wsgi_request))[-1]),
+                         'Too many failed login attempts, try again later')
+
+    def test_ip_lockout(self):
+        """
+        Test that a client trying many usernames is rejected.
+        """
+        for i in range(5):
+            self._login(username=f'user{i}')
+        self.assertEqual(self._login(username='testuser').status_code, 429)
+        self.assertEqual(self._login(username='testuser', ip='10.0.0.2').status_code, 200)
+
+    def test_success_clears_username_failures(self):
+        """
+        Test that logging in forgets the failures of the username.
+        """
+        for _ in range(2):
+            self._login()
+        self.assertEqual(self._login(password='Testpassword123!').status_code, 302)
+        self.client.logout()
+        for _ in range(2):
+            self.assertEqual(self._login().status_code, 200)
+
+
+class PasswordHasherTests(TestCase):
+
+    @override_settings(PASSWORD_HASHERS=['authentication.hashers.PBKDF2PasswordHasher'],
+                       PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_rehash_on_login_with_new_iterations(self):
+        """
+        Test that a hash made with other iterations is replaced when its user
+        logs in.
+        """
+        user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.assertIn('$1000$', user.password)
+
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.client.post(reverse('login'), {
+                'username': 'testuser', 'password': 'Testpassword123!'})
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_rehash_on_login_with_new_profile(self):
+        """
+        Test that a hash made by the hasher of a previous profile still
+        verifies and is replaced by one of the current profile.
+        """
+        with self.settings(PASSWORD_HASHERS=['authentication.hashers.PBKDF2PasswordHasher'],
+                           PASSWORD_PBKDF2_ITERATIONS=1000):
+            get_user_model().objects.create_user(
+                username='testuser', password='Testpassword123!')
+
+        with self.settings(PASSWORD_HASHERS=[
+                'django.contrib.auth.hashers.ScryptPasswordHasher',
+                'authentication.hashers.PBKDF2PasswordHasher']):
+            response = self.client.post(reverse('login'), {
+                'username': 'testuser', 'password': 'Testpassword123!'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.get(username='testuser').password.startswith('scrypt$'))
+
+    def test_benchmark_login_command(self):
+        """
+        Test that the benchmark reports a rate per profile and removes its
+        user.
+        """
+        out = StringIO()
+        call_command('benchmark_login', logins=1, iterations=[1000], stdout=out)
+
+        self.assertIn('pbkdf2 1000:', out.getvalue())
+        self.assertIn('scrypt:', out.getvalue())
+        self.assertIn('rejections/sec per core', out.getvalue())
+        self.assertFalse(User.objects.filter(username='benchmark-login').exists())
+
+
+class EmailLoginTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='testuser', email='Test.User@example.com', password='Testpassword123!')
+
+    def test_login_with_email_in_any_case(self):
+        """
+        Test that users can log in with their email in any case.
+        """
+        response = self.client.post(reverse('login'), {
+            'username': 'test.user@EXAMPLE.com', 'password': 'Testpassword123!'})
+
+        self.assertRedirects(response, reverse('home'))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_username_wins_over_email(self):
+        """
+        Test that a username equal to another user's email logs in as the
+        user with that username, resolved in one query.
+        """
+        other = get_user_model().objects.create_user(
+            username='test.user@example.com', password='Otherpassword123!')
+
+        with self.assertNumQueries(1):
+            user = authenticate(username='test.user@example.com', password='Otherpassword123!')
+        self.assertEqual(user, other)
+        self.assertIsNone(authenticate(username='test.user@example.com',
+                                       password='Testpassword123!'))
+
+    def test_register_duplicate_email(self):
+        """
+        Test that registering an email already used in another case fails.
+        """
+        response = self.client.post(reverse('register'), {
+            'username': 'newuser',
+            'email': 'TEST.USER@example.com',
+            'password1': 'Testpassword123!',
+            'password2': 'Testpassword123!',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(username='newuser').exists())
+        self.assertContains(response, 'A user with that email already exists.')
+
+    def test_shared_email_does_not_log_in(self):
+        """
+        Test that an email shared by users that registered before emails
+        were checked does not log in, while their usernames still do.
+        """
+        get_user_model().objects.create_user(
+            username='other', email='test.user@example.com', password='Testpassword123!')
+
+        self.assertIsNone(authenticate(username='test.user@example.com',
+                                       password='Testpassword123!'))
+        self.assertEqual(authenticate(username='testuser', password='Testpassword123!'),
+                         self.user)
+
+    def test_email_lookup_uses_index(self):
+        """
+        Test that looking users up by email reads the lower(email) index.
+        """
+        if connection.vendor == 'postgresql':
+            # The table is too small for the planner to prefer the index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = with_email_lower(User.objects.all()).filter(
+            email_filter('test.user@example.com')).explain()
+        self.assertIn('auth_user_email_lower_idx', plan)
+
+
 class LogoutViewTests(TestCase):
 
     def setUp(self):
@@ -0,0 +1,76 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+KEY_PREFIX = 'authentication:login_failures'
+
+
+def get_login_throttle_cache():
+    """
+    Return the cache configured by LOGIN_THROTTLE_CACHE, or None if login
+    throttling is disabled.
+    """
+    alias = getattr(settings, 'LOGIN_THROTTLE_CACHE', '')
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _user_key(username):
+    # Usernames are hashed, cache keys must not contain arbitrary characters
+    return f'{KEY_PREFIX}:user:{sha256(username.lower().encode()).hexdigest()}'
+
+
+def _limits(request, username):
+    """
+    Return the failure counter keys of a login attempt with their limits:
+    one per username, whatever the client, and one per client IP, whatever
+    the username. Limits of 0 are left out.
+    """
+    limits = [
+        (_user_key(username), settings.LOGIN_USERNAME_FAILURE_LIMIT),
+        (f'{KEY_PREFIX}:ip:{request.META.get("REMOTE_ADDR")}', settings.LOGIN_IP_FAILURE_LIMIT),
+    ]
+    return [(key, limit) for key, limit in limits if limit]
+
+
+def is_locked_out(request, username):
+    """
+    Return whether the username or the client IP have failed to log in too
+    often within LOGIN_FAILURE_WINDOW seconds. Costs one cache round trip,
+    so attempts can be rejected before the password is hashed.
+    """
+    cache = get_login_throttle_cache()
+    if cache is None:
+        return False
+    limits = _limits(request, username)
+    counts = cache.get_many([key for key, _ in limits])
+    return any(counts.get(key, 0) >= limit for key, limit in limits)
+
+
+def record_failure(request, username):
+    """
+    Count a failed login attempt. The counters expire LOGIN_FAILURE_WINDOW
+    seconds after the first failure they count.
+    """
+    cache = get_login_throttle_cache()
+    if cache is None:
+        return
+    for key, _ in _limits(request, username):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, settings.LOGIN_FAILURE_WINDOW)
+            cache.incr(key)
+
+
+def clear_failures(request, username):
+    """
+    Forget the failed attempts of a username after it logged in. Failures
+    of the client IP are kept, it may be shared with an attacker.
+    """
+    cache = get_login_throttle_cache()
+    if cache is not None:
+        cache.delete(_user_key(username))
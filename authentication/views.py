@@ -5,6 +5,7 @@ from django.contrib.auth import authenticate, login
 from django.contrib import messages
 
 from .forms import CustomUserCreationForm
+from .throttling import clear_failures, is_locked_out, record_failure
 
 
 def register_view(request):
@@ -58,6 +59,8 @@ def login_view(request):
     If the request method is POST, it validates the username and password.
     If the credentials are valid, it logs the user in and redirects to the home page.
     If the credentials are invalid, it displays an error message.
+    If the username or the client failed too often, the attempt is rejected
+    with a 429 before the password is hashed.
 
     Parameters:
     request (HttpRequest): The request object containing metadata about the request.
@@ -72,17 +75,25 @@ def login_view(request):
         username = request.POST['username']
         password = request.POST['password']
 
-        # Authenticate the user with the provided credentials
+        # Reject attempts of throttled usernames and clients without hashing
+        if is_locked_out(request, username):
+            messages.error(request, "Too many failed login attempts, try again later")
+            return render(request, 'login.html', status=429)
+
+        # Authenticate the user with the provided credentials, a hash made
+        # with an outdated hasher profile is replaced on success
         user = authenticate(request, username=username, password=password)
 
         # If the user is authenticated, log them in and redirect to the home page
         if user is not None:
+            clear_failures(request, username)
             login(request, user)
             # messages.success(request, 'You have been logged in successfully.')
             return redirect('home')  # Redirect to a success page, e.g., home
 
         # If the credentials are invalid, display an error message
         else:
+            record_failure(request, username)
             messages.error(request, "Invalid username or password")
 
     # If the request method is GET, render the login.html template
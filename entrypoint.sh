@@ -0,0 +1,21 @@
+#!/bin/sh
+# Start the web server of the profile selected by DJANGO_PROFILE
+set -e
+
+if [ "$DJANGO_PROFILE" != "production" ]; then
+    exec python manage.py runserver 0.0.0.0:8000
+fi
+
+python manage.py collectstatic --noinput
+
+# Roughly one worker per CPU core, each keeping its database connections open
+WEB_WORKERS="${WEB_WORKERS:-$(nproc)}"
+
+if [ "${DJANGO_SERVER:-gunicorn}" = "uvicorn" ]; then
+    exec uvicorn reservation_system.asgi:application \
+        --host 0.0.0.0 --port 8000 --workers "$WEB_WORKERS"
+fi
+
+exec gunicorn reservation_system.wsgi:application \
+    --bind 0.0.0.0:8000 --workers "$WEB_WORKERS" --threads "${WEB_THREADS:-4}" \
+    --max-requests 10000 --max-requests-jitter 1000
@@ -1,12 +1,218 @@
+from datetime import date, timedelta
+from itertools import chain
+
 from django.contrib import admin
-from .models import Reservation, TimeSlot
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+from django.urls import path
+from .bulk import adjust_total_capacity, bulk_insert_timeslots, clone_timeslots, close_timeslots
+from .forms import AdjustCapacityForm, CloneTimeSlotsForm, DateRangeForm, GenerateTimeSlotsForm
+from .models import (
+    ArchivedReservation, ArchivedTimeSlot, Reservation, ScheduleTemplate, TimeSlot, Waitlist,
+)
+from .signals import send_capacity_changed
 
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'timeslot', 'reserved_at')
+    list_display = ('user', 'timeslot', 'reserved_at', 'status', 'expires_at')
+    list_filter = ('status',)
+    # Fetch the user and the timeslot of every row in the changelist query,
+    # and do not render every user and timeslot as a choice on the form
+    list_select_related = ('user', 'timeslot')
+    raw_id_fields = ('user', 'timeslot')
+
+
+@admin.register(Waitlist)
+class WaitlistAdmin(admin.ModelAdmin):
+    list_display = ('user', 'timeslot', 'joined_at')
+    list_select_related = ('user', 'timeslot')
+    raw_id_fields = ('user', 'timeslot')
 
 
 @admin.register(TimeSlot)
 class TimeSlotAdmin(admin.ModelAdmin):
-    list_display = ('date', 'start_time', 'end_time', 'capacity')
+    list_display = ('date', 'start_time', 'end_time', 'remaining', 'occupancy', 'shard_count')
+    list_filter = ('date',)
+    actions = ['adjust_capacity', 'clone_timeslots', 'close_timeslots']
+    change_list_template = 'admin/reservation/timeslot/change_list.html'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_remaining().with_booked()
+
+    def get_urls(self):
+        return [
+            path('occupancy/', self.admin_site.admin_view(self.occupancy_view),
+                 name='reservation_timeslot_occupancy'),
+        ] + super().get_urls()
+
+    def occupancy_view(self, request):
+        """
+        Seats offered, booked and left per day over a date range, two weeks
+        from today by default, read with one grouped query.
+        """
+        today = date.today()
+        form = DateRangeForm(request.GET or {
+            'first_day': today, 'last_day': today + timedelta(days=13)})
+        days = []
+        if form.is_valid():
+            days = list(TimeSlot.objects.filter(date__range=(
+                form.cleaned_data['first_day'], form.cleaned_data['last_day'],
+            )).occupancy_by_date())
+            for day in days:
+                day['occupancy'] = day['booked_seats'] / day['offered'] if day['offered'] else 0
+
+        return TemplateResponse(request, 'admin/reservation/timeslot/occupancy.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Occupancy',
+            'opts': self.model._meta,
+            'form': form,
+            'days': days,
+        })
+
+    def save_model(self, request, obj, form, change):
+        # New timeslots start with all their seats left
+        if obj.capacity is None:
+            obj.capacity = obj.total_capacity
+            super().save_model(request, obj, form, change)
+        else:
+            # Only write the fields of the form, the seat counters read with
+            # it are stale once reservations came in meanwhile
+            obj.save(update_fields=list(form.fields))
+        # Derive the seats left from the total capacity and the bookings,
+        # spread over the shards when sharding is enabled
+        obj.set_total_capacity(obj.total_capacity)
+        # Include the previous date when the timeslot was moved
+        dates = {obj.date, form.initial.get('date', obj.date)}
+        send_capacity_changed([obj.id], dates)
+
+    def delete_model(self, request, obj):
+        timeslot_id = obj.id
+        super().delete_model(request, obj)
+        send_capacity_changed([timeslot_id], [obj.date])
+
+    def delete_queryset(self, request, queryset):
+        timeslots = list(queryset.values_list('id', 'date'))
+        super().delete_queryset(request, queryset)
+        send_capacity_changed(
+            [timeslot_id for timeslot_id, _ in timeslots],
+            [day for _, day in timeslots])
+
+    @admin.display(description='Capacity', ordering='remaining')
+    def remaining(self, obj):
+        return obj.remaining
+
+    @admin.display(description='Occupancy', ordering='booked')
+    def occupancy(self, obj):
+        return f'{obj.booked} of {obj.total_capacity} booked'
+
+    @admin.action(description='Add or remove seats of the selected timeslots')
+    def adjust_capacity(self, request, queryset):
+        form = AdjustCapacityForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            changed = adjust_total_capacity(queryset, form.cleaned_data['change'])
+            self.message_user(request, f'Changed the seats of {changed} timeslots.')
+            return None
+        return self._action_form(request, queryset, form, 'adjust_capacity', 'Change seats')
+
+    @admin.action(description='Copy the selected timeslots to other days')
+    def clone_timeslots(self, request, queryset):
+        form = CloneTimeSlotsForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            stats = clone_timeslots(queryset, form.cleaned_data['first_day'])
+            self.message_user(
+                request,
+                f'Processed {stats["processed"]} timeslots in {stats["elapsed"]:.2f}s, '
+                f'existing timeslots were skipped.')
+            return None
+        return self._action_form(request, queryset, form, 'clone_timeslots', 'Copy timeslots')
+
+    @admin.action(description='Close the selected timeslots to new reservations')
+    def close_timeslots(self, request, queryset):
+        closed = close_timeslots(queryset)
+        self.message_user(request, f'Closed {closed} timeslots, their reservations were kept.')
+
+    def _action_form(self, request, queryset, form, action, title):
+        """
+        Ask for the parameters of an action on the selected timeslots.
+        """
+        return TemplateResponse(request, 'admin/reservation/timeslot/action_form.html', {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'action': action,
+            'count': queryset.count(),
+            'select_across': request.POST.get('select_across', '0'),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+
+@admin.register(ScheduleTemplate)
+class ScheduleTemplateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'weekdays', 'start_time', 'end_time', 'slot_minutes', 'capacity')
+    actions = ['generate_timeslots']
+
+    @admin.action(description='Generate timeslots from the selected templates')
+    def generate_timeslots(self, request, queryset):
+        # Ask for the date range first, then expand all selected templates
+        # in one batched insert
+        form = GenerateTimeSlotsForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            first_day = form.cleaned_data['first_day']
+            last_day = form.cleaned_data['last_day']
+            stats = bulk_insert_timeslots(chain.from_iterable(
+                template.expand(first_day, last_day) for template in queryset))
+            self.message_user(
+                request,
+                f'Processed {stats["processed"]} timeslots in {stats["elapsed"]:.2f}s '
+                f'({stats["rate"]:.0f} rows/sec), existing timeslots were skipped.')
+            return None
+
+        return TemplateResponse(
+            request, 'admin/reservation/scheduletemplate/generate_timeslots.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Generate timeslots',
+                'opts': self.model._meta,
+                'form': form,
+                'templates': queryset,
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            })
+
+
+class ReadOnlyAdminMixin:
+    """
+    Let staff browse archived rows without adding, changing or deleting
+    them, archive_timeslots is the only writer.
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedReservationInline(ReadOnlyAdminMixin, admin.TabularInline):
+    model = ArchivedReservation
+    fields = ('user', 'reserved_at', 'status')
+
+
+@admin.register(ArchivedTimeSlot)
+class ArchivedTimeSlotAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ('date', 'start_time', 'end_time', 'total_capacity', 'booked', 'remaining',
+                    'archived_at')
+    date_hierarchy = 'date'
+    inlines = [ArchivedReservationInline]
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'timeslot', 'reserved_at', 'status')
+    list_filter = ('status',)
+    search_fields = ('user__username',)
+    list_select_related = ('user', 'timeslot')
@@ -0,0 +1,137 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import TimeSlot
+from .signals import RESERVATION, UPDATE
+
+
+class AdmissionStore:
+    """
+    Remaining seats per timeslot kept in a cache with atomic counters, so
+    sold-out requests can be rejected before the database is touched.
+
+    The database stays authoritative: the store only filters requests, and
+    a timeslot missing from the store is loaded from the database on first
+    use. Any Django cache backend with atomic incr/decr works, e.g. locmem
+    for tests and single-node setups or Redis for a cluster.
+    """
+
+    key_prefix = 'reservation:admission'
+
+    # Keys expire so stale timeslots do not pile up, they are reloaded on
+    # the next request
+    timeout = 60 * 60 * 24
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def key(self, timeslot_id):
+        return f'{self.key_prefix}:{timeslot_id}'
+
+    def acquire(self, timeslot_id):
+        """
+        Take one seat of a timeslot from the store.
+
+        Returns:
+            True if a seat was taken, False if the timeslot is sold out.
+        """
+        try:
+            remaining = self.cache.decr(self.key(timeslot_id))
+        except ValueError:
+            # Not in the store yet, load it without overwriting a value
+            # another worker may have added in the meantime
+            self.load(TimeSlot.objects.filter(id=timeslot_id), overwrite=False)
+            try:
+                remaining = self.cache.decr(self.key(timeslot_id))
+            except ValueError:
+                # The timeslot does not exist, let the database decide
+                return True
+
+        if remaining < 0:
+            # Sold out, undo the decrement
+            self.release(timeslot_id)
+            return False
+        return True
+
+    def release(self, timeslot_id):
+        """
+        Give a seat taken with acquire() back to the store.
+        """
+        try:
+            self.cache.incr(self.key(timeslot_id))
+        except ValueError:
+            pass
+
+    def mark_full(self, timeslot_id):
+        """
+        Record that the database has no seat left for a timeslot.
+        """
+        self.cache.set(self.key(timeslot_id), 0, self.timeout)
+
+    def load(self, timeslots, overwrite=True):
+        """
+        Load the remaining seats of timeslots from the database.
+
+        Args:
+            timeslots: A TimeSlot queryset selecting the timeslots to load.
+            overwrite: Whether to replace values already in the store.
+
+        Returns:
+            The IDs of the timeslots that were loaded.
+        """
+        values = dict(timeslots.with_remaining().values_list('id', 'remaining'))
+        if overwrite:
+            self.cache.set_many(
+                {self.key(timeslot_id): remaining for timeslot_id, remaining in values.items()},
+                self.timeout)
+        else:
+            for timeslot_id, remaining in values.items():
+                self.cache.add(self.key(timeslot_id), remaining, self.timeout)
+        return list(values)
+
+    def rebuild(self, batch_size=1000):
+        """
+        Reload every upcoming timeslot from the database, e.g. after the
+        cache was restarted.
+
+        Returns:
+            The number of timeslots loaded.
+        """
+        upcoming = TimeSlot.objects.filter(date__gte=date.today()).order_by('id')
+        loaded = 0
+        last_id = 0
+        while True:
+            batch = list(upcoming.filter(id__gt=last_id).values_list(
+                'id', flat=True)[:batch_size])
+            if not batch:
+                return loaded
+            loaded += len(self.load(TimeSlot.objects.filter(id__in=batch)))
+            last_id = batch[-1]
+
+
+def get_admission_store():
+    """
+    Return the admission store configured by RESERVATION_ADMISSION_CACHE,
+    or None if it is disabled.
+    """
+    alias = getattr(settings, 'RESERVATION_ADMISSION_CACHE', '')
+    if not alias:
+        return None
+    return AdmissionStore(caches[alias])
+
+
+def sync_admission_store(sender, timeslot_ids, source=UPDATE, **kwargs):
+    """
+    Write changed capacities through to the admission store. Seats taken by
+    reservations already went through the store and are skipped.
+    """
+    store = get_admission_store()
+    if store is None or source == RESERVATION:
+        return
+    loaded = store.load(TimeSlot.objects.filter(id__in=timeslot_ids))
+
+    # Drop timeslots that no longer exist
+    store.cache.delete_many([
+        store.key(timeslot_id) for timeslot_id in set(timeslot_ids) - set(loaded)])
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ReservationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reservation'
+
+    def ready(self):
+        from .admission import sync_admission_store
+        from .availability import invalidate_on_capacity_changed
+        from .events import publish_capacity_changed
+        from .metrics import install_sql_instrumentation
+        from .services import promote_on_capacity_changed
+        from .signals import capacity_changed
+
+        capacity_changed.connect(sync_admission_store)
+        capacity_changed.connect(invalidate_on_capacity_changed)
+        capacity_changed.connect(publish_capacity_changed)
+        capacity_changed.connect(promote_on_capacity_changed)
+
+        # Count the SQL queries of every request for the metrics
+        connection_created.connect(install_sql_instrumentation)
@@ -0,0 +1,40 @@
+from django.db import transaction
+
+from .models import ArchivedReservation, ArchivedTimeSlot, Reservation, TimeSlot
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move up to ``batch_size`` of the oldest timeslots dated before
+    ``cutoff``, and their reservations, into the archive tables in one
+    transaction. Their shards and waitlist entries are deleted.
+
+    A batch is archived completely or not at all, so an interrupted run
+    is resumed by running again. Timeslots locked by a concurrent
+    transaction are left for a later batch.
+
+    Returns:
+        The numbers of archived timeslots and reservations.
+    """
+    with transaction.atomic():
+        ids = list(TimeSlot.objects.select_for_update(skip_locked=True).filter(
+            date__lt=cutoff).order_by('date', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+
+        # Keep the seats as they were, with the bookings counted on shards
+        ArchivedTimeSlot.objects.bulk_create(
+            ArchivedTimeSlot(id=timeslot.id, date=timeslot.date, start_time=timeslot.start_time,
+                             end_time=timeslot.end_time, total_capacity=timeslot.total_capacity,
+                             remaining=timeslot.remaining, booked=timeslot.booked)
+            for timeslot in TimeSlot.objects.filter(id__in=ids).with_remaining().with_booked())
+        reservations = ArchivedReservation.objects.bulk_create(
+            ArchivedReservation(id=reservation.id, user_id=reservation.user_id,
+                                timeslot_id=reservation.timeslot_id,
+                                reserved_at=reservation.reserved_at, status=reservation.status)
+            for reservation in Reservation.objects.filter(timeslot__in=ids))
+
+        # Reservations, shards and waitlist entries go with their timeslots.
+        # Past dates are not shown, so no capacity change is sent.
+        TimeSlot.objects.filter(id__in=ids).delete()
+    return len(ids), len(reservations)
@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Reservation, TimeSlot
+
+
+KEY_PREFIX = 'reservation:availability'
+
+
+def get_availability_cache():
+    """
+    Return the cache configured by RESERVATION_AVAILABILITY_CACHE, or None
+    if availability caching is disabled.
+    """
+    alias = getattr(settings, 'RESERVATION_AVAILABILITY_CACHE', '')
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _version_key(day):
+    return f'{KEY_PREFIX}:version:{day.isoformat()}'
+
+
+def _count(cache, name):
+    """
+    Increment a hit/miss counter, creating it on first use.
+    """
+    key = f'{KEY_PREFIX}:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_available_timeslots(day, now=None):
+    """
+    Return the bookable timeslots of one day sorted by start time.
+
+    The list of timeslots with seats left is cached per date under the
+    date's current version, so readers switch to fresh data as soon as the
+    version is bumped by invalidate_dates(). Entries expire after
+    RESERVATION_AVAILABILITY_CACHE_TIMEOUT seconds, which bounds staleness
+    for changes made outside of the reservation app. Timeslots of today
+    that have already started are filtered out on every read.
+
+    Args:
+        day: The date to get the timeslots for.
+        now: The current local time, defaults to datetime.now().
+
+    Returns:
+        A list of TimeSlot instances annotated with ``remaining``.
+    """
+    now = now or datetime.now()
+    cache = get_availability_cache()
+    if cache is None:
+        return list(TimeSlot.objects.available_on(day, now).order_by('start_time'))
+
+    version = cache.get_or_set(_version_key(day), 1, None)
+    key = f'{KEY_PREFIX}:{day.isoformat()}:{version}'
+    timeslots = cache.get(key)
+    if timeslots is None:
+        _count(cache, 'misses')
+        # Cache the whole day, start times are filtered below. Read it from
+        # the primary, rows from a lagging replica would be cached under the
+        # new version and outlive the lag.
+        timeslots = list(TimeSlot.objects.using(DEFAULT_DB_ALIAS).available_on(
+            day, now.replace(hour=0, minute=0, second=0, microsecond=0))
+            .order_by('start_time'))
+        cache.set(key, timeslots, settings.RESERVATION_AVAILABILITY_CACHE_TIMEOUT)
+    else:
+        _count(cache, 'hits')
+
+    if day == now.date():
+        timeslots = [timeslot for timeslot in timeslots
+                     if timeslot.start_time >= now.time()]
+    return timeslots
+
+
+def mark_reserved(timeslots, user):
+    """
+    Set ``reserved_by_me`` on timeslots with one query for the user's
+    reservations among them.
+    """
+    reserved = set(Reservation.objects.filter(
+        user=user, timeslot__in=[timeslot.id for timeslot in timeslots])
+        .values_list('timeslot_id', flat=True))
+    for timeslot in timeslots:
+        timeslot.reserved_by_me = timeslot.id in reserved
+
+
+def invalidate_dates(dates):
+    """
+    Bump the cached availability version of the given dates.
+    """
+    cache = get_availability_cache()
+    if cache is None:
+        return
+    for day in set(dates):
+        try:
+            cache.incr(_version_key(day))
+        except ValueError:
+            # No reader has cached this date yet
+            pass
+
+
+def get_stats():
+    """
+    Return the availability cache hit and miss counters.
+    """
+    cache = get_availability_cache()
+    if cache is None:
+        return {'hits': 0, 'misses': 0}
+    return {
+        name: cache.get(f'{KEY_PREFIX}:{name}', 0)
+        for name in ('hits', 'misses')
+    }
+
+
+def invalidate_on_capacity_changed(sender, dates=(), **kwargs):
+    """
+    Bump the cached availability of the dates of changed timeslots.
+    """
+    invalidate_dates(dates)
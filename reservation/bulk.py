@@ -0,0 +1,182 @@
+import csv
+import time
+from datetime import date, time as dt_time
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import CapacityShard, TimeSlot
+from .signals import send_capacity_changed
+
+
+# Columns expected in timeslot CSV files
+CSV_FIELDS = ('date', 'start_time', 'end_time', 'capacity')
+
+
+def read_timeslots_csv(lines):
+    """
+    Yield unsaved timeslots from CSV lines with a header row naming the
+    ``date``, ``start_time``, ``end_time`` and ``capacity`` columns. Rows
+    are read one at a time, so files of any size use constant memory.
+
+    Raises:
+        ValueError: If a column is missing or a row is malformed, with the
+            line number of the row.
+    """
+    reader = csv.DictReader(lines)
+    missing = set(CSV_FIELDS) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f'Missing CSV columns: {", ".join(sorted(missing))}')
+
+    for row in reader:
+        try:
+            capacity = int(row['capacity'])
+            yield TimeSlot(
+                date=date.fromisoformat(row['date']),
+                start_time=dt_time.fromisoformat(row['start_time']),
+                end_time=dt_time.fromisoformat(row['end_time']),
+                capacity=capacity,
+                total_capacity=capacity,
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Line {reader.line_num}: {e}')
+
+
+def bulk_insert_timeslots(timeslots, batch_size=1000):
+    """
+    Insert timeslots in batches with bulk_create, skipping timeslots that
+    already exist so imports can be re-run. Only one batch is held in
+    memory at a time.
+
+    Args:
+        timeslots: An iterable of unsaved TimeSlot instances.
+        batch_size: Number of timeslots per INSERT.
+
+    Returns:
+        A dict with the number of ``processed`` timeslots, including
+        skipped duplicates, the ``elapsed`` seconds and the ``rate`` in
+        rows per second.
+    """
+    started = time.perf_counter()
+    timeslots = iter(timeslots)
+    processed = 0
+    dates = set()
+
+    while True:
+        batch = list(islice(timeslots, batch_size))
+        if not batch:
+            break
+        TimeSlot.objects.bulk_create(batch, ignore_conflicts=True)
+        processed += len(batch)
+        dates.update(timeslot.date for timeslot in batch)
+
+    if dates:
+        send_capacity_changed([], dates)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'processed': processed,
+        'elapsed': elapsed,
+        'rate': processed / elapsed if elapsed else 0,
+    }
+
+
+def adjust_total_capacity(queryset, change):
+    """
+    Add ``change`` seats, or remove them if negative, to the seats offered
+    by the given timeslots. The seats left follow and bookings are kept,
+    like TimeSlot.set_total_capacity().
+
+    Unsharded timeslots are changed by a single UPDATE, which takes each
+    row lock once, so concurrent bookings are never lost. Sharded timeslots
+    have to respread their seats and are changed one at a time.
+
+    Returns:
+        The number of changed timeslots.
+    """
+    timeslots = list(queryset.values_list('id', 'date', 'shard_count'))
+    ids = [timeslot_id for timeslot_id, _, shard_count in timeslots if not shard_count]
+
+    # SET expressions all read the old row, seats left never go below 0
+    changed = TimeSlot.objects.filter(id__in=ids).update(
+        total_capacity=Greatest(F('total_capacity') + change, 0),
+        capacity=Greatest(F('total_capacity') + change - F('booked_count'), 0))
+    for timeslot in TimeSlot.objects.filter(
+            id__in=[timeslot_id for timeslot_id, _, shard_count in timeslots if shard_count]):
+        timeslot.set_total_capacity(max(timeslot.total_capacity + change, 0))
+        changed += 1
+
+    send_capacity_changed([timeslot_id for timeslot_id, _, _ in timeslots],
+                          {day for _, day, _ in timeslots})
+    return changed
+
+
+def close_timeslots(queryset):
+    """
+    Take the seats left of the given timeslots off sale: the seats offered
+    shrink to the seats booked. Reservations are kept.
+
+    Returns:
+        The number of closed timeslots.
+    """
+    timeslots = list(queryset.values_list('id', 'date'))
+    ids = [timeslot_id for timeslot_id, _ in timeslots]
+    shard_booked = CapacityShard.objects.filter(timeslot=OuterRef('pk')).values(
+        'timeslot').annotate(total=Sum('booked_count')).values('total')
+
+    with transaction.atomic():
+        # Empty the shards first, so no seat is taken from them once the
+        # bookings counted on them are read below
+        CapacityShard.objects.filter(timeslot__in=ids).update(capacity=0)
+        closed = TimeSlot.objects.filter(id__in=ids).update(
+            capacity=0,
+            total_capacity=F('booked_count') + Coalesce(Subquery(shard_booked), 0))
+
+    send_capacity_changed(ids, {day for _, day in timeslots})
+    return closed
+
+
+def clone_timeslots(queryset, first_day, batch_size=1000):
+    """
+    Copy the given timeslots to the days starting at ``first_day``. The
+    earliest date of the timeslots is copied to ``first_day`` and the others
+    keep their distance to it, so a selected week is copied to the week
+    starting at ``first_day``. The copies offer the same seats, none booked,
+    and timeslots that already exist are skipped.
+
+    The copies are inserted in batches by bulk_insert_timeslots(), and the
+    shards of sharded copies with one more bulk insert.
+
+    Returns:
+        The result of bulk_insert_timeslots().
+    """
+    span = queryset.aggregate(first=Min('date'), last=Max('date'))
+    if span['first'] is None:
+        return {'processed': 0, 'elapsed': 0, 'rate': 0}
+    shift = first_day - span['first']
+
+    # The copies of sharded timeslots keep their seats in shards
+    copies = (
+        TimeSlot(date=day + shift, start_time=start_time, end_time=end_time,
+                 capacity=0 if shard_count else total_capacity,
+                 total_capacity=total_capacity, shard_count=shard_count)
+        for day, start_time, end_time, total_capacity, shard_count in queryset.values_list(
+            'date', 'start_time', 'end_time', 'total_capacity', 'shard_count').iterator())
+    stats = bulk_insert_timeslots(copies, batch_size=batch_size)
+
+    without_shards = TimeSlot.objects.filter(
+        date__range=(first_day, span['last'] + shift), shard_count__gt=0,
+    ).annotate(shards_created=Count('shards')).filter(shards_created=0)
+    shards = []
+    for timeslot in without_shards.iterator():
+        base, extra = divmod(timeslot.total_capacity, timeslot.shard_count)
+        shards.extend(
+            CapacityShard(timeslot=timeslot, index=index, capacity=base + (index < extra))
+            for index in range(timeslot.shard_count))
+    if shards:
+        CapacityShard.objects.bulk_create(shards, batch_size=batch_size)
+        send_capacity_changed([], {shard.timeslot.date for shard in shards})
+
+    return stats
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .models import TimeSlot
+
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel capacity changes are published on, so every process
+# serving event streams hears about changes made by any other process
+CHANNEL = 'reservation_capacity'
+
+# NOTIFY payloads are limited to 8000 bytes, large changes are split
+NOTIFY_CHUNK_SIZE = 100
+
+
+class Broadcaster:
+    """
+    Fan out capacity changes to the event streams of this process.
+
+    Subscribers are grouped by date and by the event loop they run on. A
+    message for a date is handed to each loop once, which then puts it on
+    the queues of all its subscribers of that date, so one change reaches
+    every subscriber without any per-client database query.
+    """
+
+    # Messages kept per subscriber before the oldest ones are dropped, so
+    # a stalled client cannot grow memory without bound
+    max_queued = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # date -> event loop -> subscriber queues
+        self.subscribers = defaultdict(lambda: defaultdict(set))
+
+    def subscribe(self, day):
+        """
+        Subscribe to the capacity changes of a date from the running event
+        loop, and return the queue the messages are put on.
+        """
+        queue = asyncio.Queue(self.max_queued)
+        with self.lock:
+            self.subscribers[day][asyncio.get_running_loop()].add(queue)
+        return queue
+
+    def unsubscribe(self, day, queue):
+        with self.lock:
+            loops = self.subscribers.get(day, {})
+            for loop, queues in list(loops.items()):
+                queues.discard(queue)
+                if not queues:
+                    del loops[loop]
+            if not loops:
+                self.subscribers.pop(day, None)
+
+    def subscriber_count(self, day=None):
+        with self.lock:
+            days = [day] if day is not None else list(self.subscribers)
+            return sum(len(queues) for day in days
+                       for queues in self.subscribers.get(day, {}).values())
+
+    def publish(self, day, message):
+        """
+        Put a message on the queues of every subscriber of a date. Safe to
+        call from any thread.
+        """
+        with self.lock:
+            loops = [(loop, list(queues))
+                     for loop, queues in self.subscribers.get(day, {}).items()]
+
+        for loop, queues in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queues, message)
+            except RuntimeError:
+                # The loop was closed, its subscribers are gone
+                pass
+
+    @staticmethod
+    def _deliver(queues, message):
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+broadcaster = Broadcaster()
+
+
+def capacity_messages(timeslot_ids, dates):
+    """
+    Build the JSON messages describing the current remaining seats of the
+    given timeslots, grouped by date. Timeslots that were deleted or moved
+    away from one of the given dates are reported there with no seats.
+    """
+    timeslots = defaultdict(list)
+    for timeslot_id, day, remaining in TimeSlot.objects.filter(
+            id__in=timeslot_ids).with_remaining().values_list('id', 'date', 'remaining'):
+        timeslots[day].append({'id': timeslot_id, 'capacity': remaining})
+    for day in dates:
+        present = {change['id'] for change in timeslots[day]}
+        timeslots[day].extend(
+            {'id': timeslot_id, 'capacity': 0}
+            for timeslot_id in timeslot_ids if timeslot_id not in present)
+
+    messages = []
+    for day, changes in timeslots.items():
+        if not changes:
+            continue
+        for start in range(0, len(changes), NOTIFY_CHUNK_SIZE):
+            messages.append(json.dumps({
+                'date': day.isoformat(),
+                'timeslots': changes[start:start + NOTIFY_CHUNK_SIZE],
+            }))
+    return messages
+
+
+def publish_capacity_changed(sender, timeslot_ids, dates=(), **kwargs):
+    """
+    Publish the new capacities of changed timeslots to the event streams.
+
+    On Postgres the messages go out with NOTIFY and every process fans them
+    out to its own subscribers. Other databases only reach the subscribers
+    of this process.
+    """
+    if not timeslot_ids:
+        return
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for message in capacity_messages(timeslot_ids, dates):
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, message])
+    elif any(broadcaster.subscriber_count(day) for day in dates):
+        for message in capacity_messages(timeslot_ids, dates):
+            _publish_message(message)
+
+
+def _publish_message(message):
+    broadcaster.publish(date.fromisoformat(json.loads(message)['date']), message)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+_listening = threading.Event()
+
+
+async def start_listener():
+    """
+    Start the thread relaying Postgres notifications to the subscribers of
+    this process, once per process. Does nothing on other databases.
+
+    The first call waits briefly until the thread is listening, so changes
+    made right after the first subscription are not missed. The wait runs
+    in a thread, so the event loop keeps serving other connections while
+    the listener (re)connects.
+    """
+    global _listener
+    if connection.vendor != 'postgresql' or _listening.is_set():
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(
+                target=_listen, name='reservation-events', daemon=True)
+            _listener.start()
+    await sync_to_async(_listening.wait, thread_sensitive=False)(5)
+
+
+def _listen():
+    """
+    LISTEN on the capacity channel with a dedicated connection and relay
+    every notification, reconnecting after errors.
+    """
+    while True:
+        wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            wrapper.ensure_connection()
+            raw = wrapper.connection
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            _listening.set()
+
+            while True:
+                if select.select([raw], [], [], 60) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    _publish_message(raw.notifies.pop(0).payload)
+        except Exception:
+            _listening.clear()
+            logger.exception('Capacity event listener failed, reconnecting')
+            time.sleep(1)
+        finally:
+            wrapper.close()
@@ -0,0 +1,30 @@
+from django import forms
+
+
+class DateRangeForm(forms.Form):
+    first_day = forms.DateField(help_text='YYYY-MM-DD')
+    last_day = forms.DateField(help_text='YYYY-MM-DD')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first_day = cleaned_data.get('first_day')
+        last_day = cleaned_data.get('last_day')
+        if first_day and last_day and first_day > last_day:
+            raise forms.ValidationError('The last day must not be before the first day.')
+        return cleaned_data
+
+
+class GenerateTimeSlotsForm(DateRangeForm):
+    pass
+
+
+class AdjustCapacityForm(forms.Form):
+    change = forms.IntegerField(
+        help_text='Seats to add to each timeslot, negative to remove seats. '
+                  'Booked seats are kept.')
+
+
+class CloneTimeSlotsForm(forms.Form):
+    first_day = forms.DateField(
+        help_text='YYYY-MM-DD. The earliest selected day is copied to this day, '
+                  'the others keep their distance to it.')
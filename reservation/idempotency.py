@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+# Keys longer than this are ignored
+MAX_KEY_LENGTH = 100
+
+
+def get_idempotency_key(request):
+    """
+    Return the idempotency key sent with a request in the Idempotency-Key
+    header or the ``idempotency_key`` form field, or None.
+    """
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def lookup(user, path, key):
+    """
+    Return the stored outcome of an earlier request with the same key, or
+    None if there is none or it has expired. Reads a single row through the
+    unique (user, path, key) index.
+    """
+    return IdempotencyKey.objects.filter(
+        user=user, path=path, key=key, expires_at__gt=timezone.now(),
+    ).values_list('outcome', flat=True).first()
+
+
+def remember(user, path, key, outcome):
+    """
+    Store the outcome of a request for RESERVATION_IDEMPOTENCY_TTL seconds.
+
+    Every key is its own row, so concurrent requests with different keys
+    never contend. When two requests with the same key race, the first one
+    stored wins.
+
+    Returns:
+        The outcome to answer with: the stored one if another request with
+        the same key got there first, otherwise ``outcome``.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.RESERVATION_IDEMPOTENCY_TTL)
+    record, created = IdempotencyKey.objects.get_or_create(
+        user=user, path=path, key=key,
+        defaults={'outcome': outcome, 'expires_at': expires_at})
+    if created:
+        return outcome
+
+    # Reuse a row that expired but was not purged yet
+    if record.expires_at <= now:
+        IdempotencyKey.objects.filter(id=record.id, expires_at__lte=now).update(
+            outcome=outcome, expires_at=expires_at)
+        return outcome
+    return record.outcome
+
+
+def purge_expired(batch_size=10000):
+    """
+    Delete expired keys in batches found through the ``expires_at`` index,
+    each batch in its own short statement.
+
+    Returns:
+        The number of deleted keys.
+    """
+    now = timezone.now()
+    purged = 0
+    while True:
+        batch = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list(
+            'id', flat=True)[:batch_size])
+        if not batch:
+            break
+        purged += IdempotencyKey.objects.filter(id__in=batch).delete()[0]
+        if len(batch) < batch_size:
+            break
+    return purged
@@ -0,0 +1,107 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from reservation.models import TimeSlot
+
+
+# Days ahead the seeded timeslots start from, far enough not to be browsed
+SEED_DAYS_AHEAD = 3650
+
+
+def seed_users(prefix, count):
+    """
+    Create ``count`` users named ``<prefix>-<n>`` and return them. Users
+    left behind by a run that crashed before its cleanup are reused.
+
+    Not every database returns the primary keys of bulk inserts, so seeded
+    rows are read back.
+    """
+    User = get_user_model()
+    usernames = [f'{prefix}-{i}' for i in range(count)]
+    User.objects.bulk_create(
+        (User(username=username) for username in usernames), ignore_conflicts=True)
+    return list(User.objects.filter(username__in=usernames).order_by('id'))
+
+
+def delete_users(users):
+    """
+    Delete seeded users, their reservations are removed along with them.
+    """
+    get_user_model().objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def free_day(days=1):
+    """
+    Return the first of ``days`` consecutive days without timeslots, far
+    enough ahead not to clash with real ones.
+    """
+    day = date.today() + timedelta(days=SEED_DAYS_AHEAD)
+    while TimeSlot.objects.filter(date__gte=day, date__lt=day + timedelta(days=days)).exists():
+        day += timedelta(days=days)
+    return day
+
+
+def seed_timeslots(timeslots):
+    """
+    Insert timeslots dated on days from free_day() and return them read
+    back, as seed_users() does, sorted by date and start time.
+    """
+    timeslots = list(timeslots)
+    TimeSlot.objects.bulk_create(timeslots)
+    return list(TimeSlot.objects.filter(
+        date__in={timeslot.date for timeslot in timeslots}).order_by('date', 'start_time'))
+
+
+def delete_timeslots(timeslots):
+    """
+    Delete seeded timeslots with their shards, reservations and waitlists.
+    """
+    TimeSlot.objects.filter(id__in=[timeslot.id for timeslot in timeslots]).delete()
+
+
+def run_in_threads(work, items, workers):
+    """
+    Split the items over ``workers`` threads and call ``work`` on each.
+    Every thread uses one database connection and closes it when done.
+
+    Returns:
+        The results of all calls, in no particular order, and the elapsed
+        seconds.
+    """
+    def run(chunk):
+        try:
+            return [work(item) for item in chunk]
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(run, (items[i::workers] for i in range(workers))))
+    elapsed = time.perf_counter() - started
+    return [result for chunk in chunks for result in chunk], elapsed
+
+
+def timed(func, *args):
+    """
+    Call ``func`` and return its result with the latency in ms.
+    """
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def percentiles(values):
+    """
+    Return the p50, p95 and p99 and the maximum of latencies in ms.
+    """
+    if len(values) > 1:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+    else:
+        cuts = values * 99
+    return {'p50': round(cuts[49], 2), 'p95': round(cuts[94], 2),
+            'p99': round(cuts[98], 2), 'max': round(max(values), 2)}
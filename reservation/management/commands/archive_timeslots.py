@@ -0,0 +1,61 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = ('Move timeslots older than a cutoff, and their reservations, from '
+            'the timeslot and reservation tables into the archive tables, in '
+            'batches of bounded size each in its own transaction. An '
+            'interrupted run is resumed by running it again. Run it '
+            'periodically, e.g. from cron, or keep it running with --every.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Archive timeslots dated more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of timeslots archived per transaction.')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches, the next run resumes.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches, to leave the database '
+                                 'time for other work.')
+        parser.add_argument('--every', type=float,
+                            help='Keep running and archive every this many seconds.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days must not be negative and --batch-size must be positive.')
+
+        while True:
+            started = time.perf_counter()
+            timeslots, reservations, batches = self._archive(options)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {timeslots} timeslots and {reservations} reservations '
+                f'in {batches} batches in {elapsed:.2f}s.'))
+
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def _archive(self, options):
+        cutoff = date.today() - timedelta(days=options['days'])
+        timeslots = reservations = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            archived, archived_reservations = archive_batch(cutoff, options['batch_size'])
+            if not archived:
+                break
+            timeslots += archived
+            reservations += archived_reservations
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Batch {batches}: {archived} timeslots, '
+                                  f'{archived_reservations} reservations.')
+            if archived < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        return timeslots, reservations, batches
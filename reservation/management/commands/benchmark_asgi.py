@@ -0,0 +1,81 @@
+import asyncio
+import time
+from datetime import datetime
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.urls import reverse
+
+from reservation.management.benchmark import (
+    delete_timeslots, delete_users, free_day, percentiles, seed_timeslots, seed_users,
+)
+from reservation.models import ScheduleTemplate
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync and async home pages served through the ASGI '
+            'handler of one process with many concurrent connections. '
+            'Creates its own user and timeslots and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=100,
+                            help='Number of concurrent connections.')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Number of requests per page.')
+
+    def handle(self, *args, **options):
+        user = seed_users('benchmark-asgi', 1)[0]
+        # Seed a day of timeslots
+        day = free_day()
+        template = ScheduleTemplate(
+            weekdays=str(day.weekday()), start_time=datetime.min.time(),
+            end_time=datetime.max.time(), slot_minutes=30, capacity=10)
+        timeslots = seed_timeslots(template.expand(day, day))
+
+        try:
+            # The client talks to the ASGI handler in this process
+            client = AsyncClient(server=('localhost', '80'))
+            client.force_login(user)
+
+            for name in ('home', 'home_async'):
+                result = async_to_sync(self._run)(
+                    client, f'{reverse(name)}?date={day.isoformat()}', options)
+                self.stdout.write(
+                    f'{name:>10}: {result["rate"]:8.1f} requests/sec, '
+                    f'p50 {result["p50"]:7.1f} ms, p99 {result["p99"]:7.1f} ms, '
+                    f'{result["peak"]} connections in flight at peak')
+        finally:
+            delete_timeslots(timeslots)
+            delete_users([user])
+
+    async def _run(self, client, url, options):
+        """
+        Send ``requests`` GET requests to a URL with at most ``connections``
+        of them in flight, and return throughput and latency figures.
+        """
+        semaphore = asyncio.Semaphore(options['connections'])
+        latencies = []
+        in_flight = peak = 0
+
+        async def request():
+            nonlocal in_flight, peak
+            async with semaphore:
+                in_flight += 1
+                peak = max(peak, in_flight)
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+                in_flight -= 1
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} returned {response.status_code}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'rate': len(latencies) / elapsed,
+            **percentiles(latencies),
+            'peak': peak,
+        }
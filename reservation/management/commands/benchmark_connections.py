@@ -0,0 +1,113 @@
+import time
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from reservation.management.benchmark import delete_timeslots, delete_users, free_day, seed_users
+from reservation.models import TimeSlot
+
+
+# Database connection settings of each profile, see POSTGRES_CONN_MAX_AGE
+PROFILES = {
+    'per-request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': False},
+    'health-checked': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True},
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure the home page requests per second served by one worker '
+            'with each database connection profile, and the time spent '
+            'opening database connections. Requests go through the WSGI '
+            'handler, so connections are closed or kept between requests as '
+            'under a real server. Creates its own user and timeslot and '
+            'removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Number of home page requests per profile.')
+
+    def handle(self, *args, **options):
+        user = seed_users('benchmark-connections', 1)[0]
+        day = free_day()
+        timeslot = TimeSlot.objects.create(
+            date=day, start_time=dt_time(0), end_time=dt_time(23, 59), capacity=1)
+
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+        environ = RequestFactory(SERVER_NAME='localhost').get(
+            reverse('home'), {'date': day.isoformat()},
+            HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}',
+        ).environ
+
+        # Replicas serve the reads of the home page when configured
+        originals = {alias: dict(connections[alias].settings_dict) for alias in connections}
+        try:
+            results = {}
+            for profile, overrides in PROFILES.items():
+                for alias in connections:
+                    connections[alias].settings_dict.update(overrides)
+                results[profile] = self._run(environ, options['requests'])
+
+            baseline = results['per-request']
+            self.stdout.write(f'{"profile":>14}  {"req/sec":>8}  {"connects":>8}  {"setup ms/req":>12}')
+            for profile, (rate, connects, setup) in results.items():
+                self.stdout.write(
+                    f'{profile:>14}  {rate:8.1f}  {connects:8d}  {setup:12.3f}'
+                    f'  ({baseline[2] - setup:+.3f} ms/req saved)')
+            self.stdout.write('Setup is the time spent opening database connections, '
+                              'averaged over all requests.')
+        finally:
+            for alias, original in originals.items():
+                connections[alias].close()
+                connections[alias].settings_dict.update(original)
+            delete_users([user])
+            delete_timeslots([timeslot])
+
+    @staticmethod
+    def _run(environ, requests):
+        """
+        Serve the home page ``requests`` times and return the requests per
+        second, the number of connections opened and the milliseconds spent
+        opening them per request.
+        """
+        connects = 0
+        setup = 0.0
+
+        def timed(connect):
+            def timed_connect():
+                nonlocal connects, setup
+                started = time.perf_counter()
+                connect()
+                setup += time.perf_counter() - started
+                connects += 1
+            return timed_connect
+
+        def start_response(status, headers):
+            if not status.startswith('200'):
+                raise CommandError(f'The home page answered {status}')
+
+        handler = WSGIHandler()
+        connects_of = {alias: connections[alias].connect for alias in connections}
+        for alias, connect in connects_of.items():
+            # Start without connections, as a freshly started worker
+            connections[alias].close()
+            connections[alias].connect = timed(connect)
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                response = handler(dict(environ), start_response)
+                b''.join(response)
+                # Closing the response ends the request, which closes the
+                # connections unless they are persistent
+                response.close()
+            elapsed = time.perf_counter() - started
+        finally:
+            for alias, connect in connects_of.items():
+                connections[alias].connect = connect
+        return requests / elapsed, connects, setup / requests * 1000
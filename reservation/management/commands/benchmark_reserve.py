@@ -0,0 +1,80 @@
+from datetime import time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from reservation.management.benchmark import (
+    delete_timeslots, delete_users, free_day, run_in_threads, seed_users,
+)
+from reservation.models import Reservation, TimeSlot
+from reservation.services import CREATED, DUPLICATE, FULL, reserve_timeslot
+
+
+def locked_reserve(user, timeslot):
+    """
+    The previous reserve path: lock the timeslot row, then get_or_create
+    the reservation, then save the timeslot.
+    """
+    with transaction.atomic():
+        timeslot = TimeSlot.objects.select_for_update().get(id=timeslot.id)
+        if timeslot.capacity == 0:
+            return FULL
+        _, created = Reservation.objects.get_or_create(user=user, timeslot=timeslot)
+        if not created:
+            return DUPLICATE
+        timeslot.capacity -= 1
+        timeslot.save(update_fields=['capacity'])
+        return CREATED
+
+
+# Reserve paths compared, in the order they are run
+PATHS = {
+    'row lock': locked_reserve,
+    'conditional update': reserve_timeslot,
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare bookings/sec of one hot timeslot booked through the '
+            'previous SELECT ... FOR UPDATE path and through the conditional '
+            'UPDATE of reserve_timeslot(). Each worker thread books on its own '
+            'connection. Creates its own users and timeslots and removes them '
+            'afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500,
+                            help='Number of users competing for the timeslot.')
+        parser.add_argument('--workers', type=int, default=16,
+                            help='Number of concurrent threads.')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Runs per path, the best one is reported.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['workers'] < 1 or options['runs'] < 1:
+            raise CommandError('--users, --workers and --runs must be positive.')
+
+        users = seed_users('benchmark-reserve', options['users'])
+        try:
+            for name, reserve in PATHS.items():
+                # Take the best of a few runs to smooth out scheduling noise
+                rate = max(self._run(reserve, users, options) for _ in range(options['runs']))
+                self.stdout.write(f'{name:>18}: {rate:10.1f} bookings/sec')
+        finally:
+            delete_users(users)
+
+    @staticmethod
+    def _run(reserve, users, options):
+        """
+        Book one timeslot with a seat for every user concurrently and return
+        the number of successful bookings per second.
+        """
+        timeslot = TimeSlot.objects.create(
+            date=free_day(), start_time=dt_time(0), end_time=dt_time(23, 59),
+            capacity=len(users), total_capacity=len(users))
+        try:
+            outcomes, elapsed = run_in_threads(
+                lambda user: reserve(user, timeslot), users, options['workers'])
+        finally:
+            delete_timeslots([timeslot])
+
+        return outcomes.count(CREATED) / elapsed
@@ -0,0 +1,78 @@
+from datetime import time as dt_time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from reservation.management.benchmark import delete_timeslots, delete_users, free_day, seed_users
+from reservation.models import TimeSlot
+
+
+# Session and message storage of each profile, see SESSION_STORAGE
+PROFILES = {
+    'db': ('django.contrib.sessions.backends.db',
+           'django.contrib.messages.storage.fallback.FallbackStorage'),
+    'cached_db': ('django.contrib.sessions.backends.cached_db',
+                  'django.contrib.messages.storage.cookie.CookieStorage'),
+    'signed_cookies': ('django.contrib.sessions.backends.signed_cookies',
+                       'django.contrib.messages.storage.cookie.CookieStorage'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Count the SQL queries per request of the home page and of a '
+            'reservation with each session storage profile, and how many of '
+            'them go to the session table. Creates its own user and timeslot '
+            'and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Number of home page requests per profile.')
+
+    def handle(self, *args, **options):
+        user = seed_users('benchmark-sessions', 1)[0]
+        timeslot = TimeSlot.objects.create(
+            date=free_day(), start_time=dt_time(0), end_time=dt_time(23, 59), capacity=1)
+
+        try:
+            self.stdout.write(f'{"profile":>14}  {"home":>12}  {"reserve":>12}')
+            for profile, (engine, storage) in PROFILES.items():
+                with override_settings(SESSION_ENGINE=engine, MESSAGE_STORAGE=storage):
+                    home, reserve = self._run(user, timeslot, options)
+                self.stdout.write(
+                    f'{profile:>14}  {home[0]:5.1f} ({home[1]:3.1f})  '
+                    f'{reserve[0]:5.1f} ({reserve[1]:3.1f})')
+            self.stdout.write('Queries per request, in brackets those on the session table. '
+                              'A reservation includes the home page it redirects to.')
+        finally:
+            delete_users([user])
+            delete_timeslots([timeslot])
+
+    def _run(self, user, timeslot, options):
+        """
+        Return the queries per request and the session queries per request
+        of the home page, and of a reservation followed by the home page
+        showing its message.
+        """
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+        home = f'{reverse("home")}?date={timeslot.date.isoformat()}'
+
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(options['requests']):
+                client.get(home)
+        home_counts = self._per_request(queries, options['requests'])
+
+        with CaptureQueriesContext(connection) as queries:
+            client.post(reverse('reserve', args=[timeslot.id]), follow=True)
+        reserve_counts = self._per_request(queries, 1)
+
+        client.post(reverse('cancel', args=[timeslot.id]))
+        return home_counts, reserve_counts
+
+    @staticmethod
+    def _per_request(queries, requests):
+        session = sum('django_session' in query['sql'] for query in queries.captured_queries)
+        return len(queries) / requests, session / requests
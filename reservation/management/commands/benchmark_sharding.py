@@ -0,0 +1,52 @@
+from datetime import time as dt_time
+
+from django.core.management.base import BaseCommand
+
+from reservation.management.benchmark import (
+    delete_timeslots, delete_users, free_day, run_in_threads, seed_users,
+)
+from reservation.models import TimeSlot
+from reservation.services import CREATED, reserve_timeslot
+
+
+class Command(BaseCommand):
+    help = ('Compare bookings/sec of sharded and unsharded timeslots under '
+            'concurrent reserve requests. Creates its own users and '
+            'timeslots and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500,
+                            help='Number of users competing for the timeslot.')
+        parser.add_argument('--capacity', type=int, default=400,
+                            help='Capacity of the benchmarked timeslot.')
+        parser.add_argument('--shards', type=int, default=8,
+                            help='Number of shards for the sharded run.')
+        parser.add_argument('--workers', type=int, default=32,
+                            help='Number of concurrent threads.')
+
+    def handle(self, *args, **options):
+        users = seed_users('benchmark-sharding', options['users'])
+        try:
+            for shard_count in (0, options['shards']):
+                rate = self._run(users, shard_count, options)
+                mode = f'{shard_count} shards' if shard_count else 'unsharded'
+                self.stdout.write(f'{mode:>12}: {rate:10.1f} bookings/sec')
+        finally:
+            delete_users(users)
+
+    def _run(self, users, shard_count, options):
+        """
+        Book one timeslot concurrently with every user and return the
+        number of successful bookings per second.
+        """
+        timeslot = TimeSlot.objects.create(
+            date=free_day(), start_time=dt_time(0), end_time=dt_time(23, 59),
+            capacity=0, shard_count=shard_count)
+        try:
+            timeslot.set_total_capacity(options['capacity'])
+            outcomes, elapsed = run_in_threads(
+                lambda user: reserve_timeslot(user, timeslot), users, options['workers'])
+        finally:
+            delete_timeslots([timeslot])
+
+        return outcomes.count(CREATED) / elapsed
@@ -0,0 +1,73 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from reservation.models import TimeSlot
+
+
+class Command(BaseCommand):
+    help = ('Print the query plan of the home page query. With --seed-days '
+            'the plan is taken on a seeded dataset that is rolled back '
+            'afterwards, so it can be checked for regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-days', type=int, default=0,
+                            help='Seed this many days of history and future '
+                                 'timeslots before explaining.')
+        parser.add_argument('--slots-per-day', type=int, default=48,
+                            help='Number of timeslots seeded per day.')
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='Date to explain the query for, defaults to today.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed_days']:
+                self._seed(options['seed_days'], options['slots_per_day'])
+
+            day = options['date'] or date.today()
+            for sort_by in ('start_time', '-start_time', 'end_time', '-end_time'):
+                timeslots = TimeSlot.objects.available_on(day).order_by(sort_by)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'Home query for {day} sorted by {sort_by}'))
+                self.stdout.write(str(timeslots.query))
+                self.stdout.write(self._explain(timeslots))
+                self.stdout.write('')
+
+            # Never keep the seeded rows
+            transaction.set_rollback(True)
+
+    def _seed(self, days, slots_per_day):
+        """
+        Insert timeslots for ``days`` days around today, a third of them
+        fully booked, and refresh the planner statistics.
+        """
+        start = date.today() - timedelta(days=days // 2)
+        minutes = 24 * 60 // slots_per_day
+        batch = []
+        for day_offset in range(days):
+            day = start + timedelta(days=day_offset)
+            for slot in range(slots_per_day):
+                start_time = datetime.combine(day, time()) + timedelta(minutes=slot * minutes)
+                capacity = (day_offset + slot) % 3 * 5
+                batch.append(TimeSlot(
+                    date=day,
+                    start_time=start_time.time(),
+                    end_time=(start_time + timedelta(minutes=minutes - 1)).time(),
+                    capacity=capacity,
+                    total_capacity=capacity,
+                ))
+            if len(batch) >= 5000:
+                TimeSlot.objects.bulk_create(batch)
+                batch = []
+        TimeSlot.objects.bulk_create(batch)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {TimeSlot._meta.db_table}')
+        self.stdout.write(f'Seeded {days * slots_per_day} timeslots.\n\n')
+
+    def _explain(self, timeslots):
+        if connection.vendor == 'postgresql':
+            return timeslots.explain(analyze=True, buffers=True)
+        return timeslots.explain()
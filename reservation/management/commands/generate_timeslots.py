@@ -0,0 +1,60 @@
+from datetime import date, time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.bulk import bulk_insert_timeslots
+from reservation.models import ScheduleTemplate
+
+
+class Command(BaseCommand):
+    help = ('Expand a recurring schedule into timeslots between two dates, '
+            'e.g. weekdays 09:00-17:00 in 30 minute slots with capacity 10. '
+            'Existing timeslots are skipped, so the command can be re-run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('first_day', type=date.fromisoformat,
+                            help='First date to generate timeslots for (YYYY-MM-DD).')
+        parser.add_argument('last_day', type=date.fromisoformat,
+                            help='Last date to generate timeslots for (YYYY-MM-DD).')
+        parser.add_argument('--template',
+                            help='Name of a saved schedule template to expand.')
+        parser.add_argument('--weekdays', default='0,1,2,3,4',
+                            help='Comma separated weekdays, 0 is Monday.')
+        parser.add_argument('--start', type=time.fromisoformat, default=time(9),
+                            help='Start time of the first timeslot of a day.')
+        parser.add_argument('--end', type=time.fromisoformat, default=time(17),
+                            help='Time the last timeslot of a day ends by.')
+        parser.add_argument('--minutes', type=int, default=30,
+                            help='Length of a timeslot in minutes.')
+        parser.add_argument('--capacity', type=int, default=10,
+                            help='Capacity of each timeslot.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of timeslots per INSERT.')
+
+    def handle(self, *args, **options):
+        if options['template']:
+            try:
+                template = ScheduleTemplate.objects.get(name=options['template'])
+            except ScheduleTemplate.DoesNotExist:
+                raise CommandError(f'Unknown schedule template "{options["template"]}".')
+        else:
+            template = ScheduleTemplate(
+                name='command line',
+                weekdays=options['weekdays'],
+                start_time=options['start'],
+                end_time=options['end'],
+                slot_minutes=options['minutes'],
+                capacity=options['capacity'],
+            )
+            try:
+                template.full_clean(exclude=['name'])
+            except ValidationError as e:
+                raise CommandError(e)
+
+        stats = bulk_insert_timeslots(
+            template.expand(options['first_day'], options['last_day']),
+            batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {stats["processed"]} timeslots in {stats["elapsed"]:.2f}s '
+            f'({stats["rate"]:.0f} rows/sec), existing timeslots were skipped.'))
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.bulk import bulk_insert_timeslots, read_timeslots_csv
+
+
+class Command(BaseCommand):
+    help = ('Stream timeslots from a CSV file with date, start_time, end_time '
+            'and capacity columns. Existing timeslots are skipped, so the '
+            'command can be re-run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV file, - for stdin.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of timeslots per INSERT.')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            stats = self._import(sys.stdin, options)
+        else:
+            try:
+                with open(options['path'], newline='') as lines:
+                    stats = self._import(lines, options)
+            except OSError as e:
+                raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {stats["processed"]} timeslots in {stats["elapsed"]:.2f}s '
+            f'({stats["rate"]:.0f} rows/sec), existing timeslots were skipped.'))
+
+    def _import(self, lines, options):
+        try:
+            return bulk_insert_timeslots(
+                read_timeslots_csv(lines), batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from datetime import time as dtime
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.test import AsyncClient
+from django.urls import reverse
+
+from reservation.events import broadcaster
+from reservation.management.benchmark import delete_timeslots, free_day, percentiles
+from reservation.models import TimeSlot
+from reservation.signals import send_capacity_changed
+
+
+class Command(BaseCommand):
+    help = ('Open many idle capacity event streams for one date through the '
+            'ASGI handler of this process, publish capacity changes and '
+            'report how long each change takes to reach every subscriber. '
+            'Creates its own timeslot and removes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000,
+                            help='Number of event streams to open.')
+        parser.add_argument('--changes', type=int, default=10,
+                            help='Number of capacity changes to publish.')
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds between two changes.')
+
+    def handle(self, *args, **options):
+        timeslot = TimeSlot.objects.create(
+            date=free_day(), start_time=dtime(9), end_time=dtime(10),
+            capacity=options['changes'])
+
+        try:
+            result = async_to_sync(self._run)(timeslot, options)
+        finally:
+            delete_timeslots([timeslot])
+
+        self.stdout.write(
+            f'{result["registered"]} of {options["subscribers"]} subscribers '
+            f'registered in {result["subscribe"]:.2f} s, {result["delivered"]} of '
+            f'{result["expected"]} messages delivered')
+        if result['latencies']:
+            latency = percentiles(result['latencies'])
+            self.stdout.write(
+                f'fan-out latency: p50 {latency["p50"]:.1f} ms, '
+                f'p95 {latency["p95"]:.1f} ms, p99 {latency["p99"]:.1f} ms, '
+                f'max {latency["max"]:.1f} ms')
+
+    async def _run(self, timeslot, options):
+        """
+        Subscribe ``subscribers`` streams, publish ``changes`` changes and
+        collect the delay between each change and its arrival per stream.
+        """
+        client = AsyncClient(server=('localhost', '80'))
+        url = reverse('capacity_events', args=[timeslot.date.isoformat()])
+
+        # Open the streams and wait for their first frame, by then they
+        # are subscribed
+        started = time.perf_counter()
+        streams = []
+        for _ in range(options['subscribers']):
+            response = await client.get(url)
+            streams.append(response.streaming_content)
+        await asyncio.gather(*(anext(stream) for stream in streams))
+        subscribe = time.perf_counter() - started
+        registered = broadcaster.subscriber_count(timeslot.date)
+
+        sent_at = []
+        latencies = []
+
+        async def receive(stream):
+            for index in range(options['changes']):
+                while not (await anext(stream)).startswith(b'event: capacity'):
+                    pass
+                latencies.append((time.perf_counter() - sent_at[index]) * 1000)
+
+        receivers = [asyncio.create_task(receive(stream)) for stream in streams]
+        try:
+            for _ in range(options['changes']):
+                sent_at.append(time.perf_counter())
+                await sync_to_async(self._change)(timeslot)
+                await asyncio.sleep(options['interval'])
+
+            # Give slow receivers a moment before counting what arrived
+            await asyncio.wait(receivers, timeout=5)
+        finally:
+            for receiver in receivers:
+                receiver.cancel()
+            await asyncio.gather(*receivers, return_exceptions=True)
+            for stream in streams:
+                await stream.aclose()
+
+        return {
+            'subscribe': subscribe,
+            'registered': registered,
+            'delivered': len(latencies),
+            'expected': options['subscribers'] * options['changes'],
+            'latencies': latencies,
+        }
+
+    @staticmethod
+    def _change(timeslot):
+        """
+        Take a seat from the timeslot and announce the new capacity, the
+        way a reservation does.
+        """
+        TimeSlot.objects.filter(id=timeslot.id).update(capacity=F('capacity') - 1)
+        send_capacity_changed([timeslot.id], [timeslot.date])
@@ -0,0 +1,197 @@
+import json
+import random
+from collections import Counter
+from datetime import time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F, Q
+
+from reservation.availability import get_available_timeslots, mark_reserved
+from reservation.management.benchmark import (
+    delete_timeslots, delete_users, free_day, percentiles, run_in_threads, seed_timeslots,
+    seed_users, timed,
+)
+from reservation.models import Reservation, TimeSlot
+from reservation.services import CREATED, reserve_timeslot
+
+
+# Scenarios run by default, in this order
+SCENARIOS = ('hot', 'uniform', 'mixed')
+
+# Operation kinds, reported separately
+RESERVE = 'reserve'
+READ = 'read'
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent reservation attempts from a thread pool against '
+            'the configured database, report throughput and latency '
+            'percentiles, and check that no timeslot was oversold and no user '
+            'holds duplicate reservations. Scenarios: "hot" sends every '
+            'attempt to one timeslot, "uniform" spreads them over all '
+            'timeslots, "mixed" interleaves them with home page reads. '
+            'Creates its own users and timeslots and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                            help='Scenario to run, can be repeated. Defaults to all.')
+        parser.add_argument('--timeslots', type=int, default=50,
+                            help='Number of timeslots seeded per scenario.')
+        parser.add_argument('--users', type=int, default=500,
+                            help='Number of users making attempts.')
+        parser.add_argument('--capacity', type=int, default=20,
+                            help='Seats offered per timeslot.')
+        parser.add_argument('--attempts', type=int, default=2,
+                            help='Reservation attempts per user.')
+        parser.add_argument('--reads', type=int, default=4,
+                            help='Home page reads per attempt in the mixed scenario.')
+        parser.add_argument('--workers', type=int, default=32,
+                            help='Number of concurrent threads.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random timeslot choices, so runs are comparable.')
+        parser.add_argument('--json', metavar='PATH',
+                            help='Write the results as JSON to this file, "-" for stdout.')
+
+    def handle(self, *args, **options):
+        if options['timeslots'] < 1 or options['users'] < 1 or options['workers'] < 1:
+            raise CommandError('--timeslots, --users and --workers must be positive.')
+
+        users = seed_users('loadtest-reservations', options['users'])
+        results = []
+        try:
+            for scenario in options['scenario'] or SCENARIOS:
+                results.append(self._run(scenario, users, options))
+        finally:
+            delete_users(users)
+
+        report = {
+            'database': connection.vendor,
+            'options': {name: options[name] for name in (
+                'timeslots', 'users', 'capacity', 'attempts', 'reads', 'workers', 'seed')},
+            'scenarios': results,
+        }
+        if options['json'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            if options['json']:
+                with open(options['json'], 'w') as f:
+                    json.dump(report, f, indent=2)
+            for result in results:
+                self._write(result)
+
+        failed = [result['scenario'] for result in results if not result['consistent']]
+        if failed:
+            raise CommandError(f'Inconsistent bookings in scenarios: {", ".join(failed)}')
+
+    def _run(self, scenario, users, options):
+        """
+        Seed the timeslots of one scenario, run its operations concurrently,
+        verify the bookings and remove the timeslots again.
+        """
+        # Seed 24 hourly timeslots per day on days without real timeslots
+        first_day = free_day(days=(options['timeslots'] - 1) // 24 + 1)
+        timeslots = seed_timeslots(
+            TimeSlot(date=first_day + timedelta(days=i // 24),
+                     start_time=dt_time(i % 24), end_time=dt_time(i % 24, 59),
+                     capacity=options['capacity'], total_capacity=options['capacity'])
+            for i in range(options['timeslots']))
+
+        try:
+            operations = self._operations(scenario, users, timeslots, options)
+            results, elapsed = run_in_threads(self._execute, operations, options['workers'])
+
+            outcomes = Counter()
+            latencies = {RESERVE: [], READ: []}
+            for kind, outcome, latency in results:
+                latencies[kind].append(latency)
+                if kind == RESERVE:
+                    outcomes[outcome] += 1
+
+            violations = self._verify(timeslots, outcomes)
+        finally:
+            delete_timeslots(timeslots)
+
+        return {
+            'scenario': scenario,
+            'operations': len(operations),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(len(operations) / elapsed, 1),
+            'bookings_per_second': round(outcomes[CREATED] / elapsed, 1),
+            'outcomes': dict(sorted(outcomes.items())),
+            'latency_ms': {kind: percentiles(values)
+                           for kind, values in latencies.items() if values},
+            'violations': violations,
+            'consistent': not any(violations.values()),
+        }
+
+    @staticmethod
+    def _operations(scenario, users, timeslots, options):
+        """
+        Return the shuffled list of ``(kind, user, timeslot)`` operations of
+        a scenario. Every user makes ``attempts`` reservation attempts.
+        """
+        rng = random.Random(options['seed'])
+        operations = []
+        for user in users:
+            for _ in range(options['attempts']):
+                timeslot = timeslots[0] if scenario == 'hot' else rng.choice(timeslots)
+                operations.append((RESERVE, user, timeslot))
+                if scenario == 'mixed':
+                    operations.extend(
+                        (READ, user, rng.choice(timeslots)) for _ in range(options['reads']))
+        rng.shuffle(operations)
+        return operations
+
+    @staticmethod
+    def _execute(operation):
+        """
+        Run one operation and return ``(kind, outcome, latency in ms)``.
+        """
+        kind, user, timeslot = operation
+        if kind == RESERVE:
+            outcome, latency = timed(reserve_timeslot, user, timeslot)
+        else:
+            # What the home page reads for the timeslot's date
+            _, latency = timed(
+                lambda: mark_reserved(get_available_timeslots(timeslot.date), user))
+            outcome = None
+        return kind, outcome, latency
+
+    @staticmethod
+    def _verify(timeslots, outcomes):
+        """
+        Count the timeslots with more reservations than seats offered or
+        whose counters disagree with their reservations, and the duplicate
+        reservations of a user for one timeslot.
+        """
+        ids = [timeslot.id for timeslot in timeslots]
+        checked = TimeSlot.objects.filter(id__in=ids).with_remaining().with_booked().annotate(
+            reserved=Count('reservations'))
+        reservations = Reservation.objects.filter(timeslot__in=ids)
+        return {
+            'oversold': checked.filter(reserved__gt=F('total_capacity')).count(),
+            'drifted': checked.filter(
+                ~Q(booked=F('reserved')) | ~Q(remaining=F('total_capacity') - F('reserved'))).count(),
+            'duplicates': reservations.values('user', 'timeslot').annotate(
+                copies=Count('id')).filter(copies__gt=1).count(),
+            'unaccounted': abs(reservations.count() - outcomes[CREATED]),
+        }
+
+    def _write(self, result):
+        self.stdout.write(
+            f'{result["scenario"]:>8}: {result["operations"]} operations in '
+            f'{result["elapsed"]:.2f} s, {result["throughput"]:.1f} ops/sec, '
+            f'{result["bookings_per_second"]:.1f} bookings/sec')
+        for kind, latency in result['latency_ms'].items():
+            self.stdout.write(
+                f'{kind:>18}: p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, '
+                f'p99 {latency["p99"]:.1f} ms, max {latency["max"]:.1f} ms')
+        self.stdout.write(f'{"outcomes":>18}: ' + ', '.join(
+            f'{count} {outcome}' for outcome, count in result['outcomes'].items()))
+        if result['consistent']:
+            self.stdout.write(self.style.SUCCESS(f'{"":>10}no overselling or duplicates'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{"":>10}violations: ' + ', '.join(
+                f'{count} {name}' for name, count in result['violations'].items() if count)))
+
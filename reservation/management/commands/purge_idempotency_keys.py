@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reservation.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of keys deleted per statement.')
+
+    def handle(self, *args, **options):
+        purged = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired idempotency keys.'))
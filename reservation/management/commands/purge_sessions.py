@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Delete expired sessions from the session table in batches found '
+            'through the expire_date index, each batch in its own short '
+            'statement, unlike clearsessions which deletes them all at once. '
+            'Run it periodically, e.g. from cron, or keep it running with --every.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of sessions deleted per statement.')
+        parser.add_argument('--every', type=float,
+                            help='Keep running and purge every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            purged = self._purge(options['batch_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Purged {purged} expired sessions in {elapsed:.2f}s.'))
+
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    @staticmethod
+    def _purge(batch_size):
+        now = timezone.now()
+        purged = 0
+        while True:
+            batch = list(Session.objects.filter(expire_date__lt=now).values_list(
+                'session_key', flat=True)[:batch_size])
+            if not batch:
+                break
+            purged += Session.objects.filter(session_key__in=batch).delete()[0]
+            if len(batch) < batch_size:
+                break
+        return purged
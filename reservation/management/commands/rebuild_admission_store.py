@@ -0,0 +1,28 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.admission import get_admission_store
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the admission store from the database, e.g. after the '
+            'cache was restarted or has drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of timeslots loaded per query.')
+
+    def handle(self, *args, **options):
+        store = get_admission_store()
+        if store is None:
+            raise CommandError(
+                'The admission store is disabled, set RESERVATION_ADMISSION_CACHE.')
+        if isinstance(store.cache, LocMemCache):
+            # Each process has its own copy, the workers would not see this one
+            raise CommandError(
+                'RESERVATION_ADMISSION_CACHE is a local memory cache, which this command '
+                'cannot rebuild for the workers. Use a shared cache such as Redis.')
+
+        loaded = store.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {loaded} upcoming timeslots into the admission store.'))
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.services import find_capacity_drift, reconcile_capacity
+
+
+class Command(BaseCommand):
+    help = ('Recount the reservations of the timeslots between two dates and '
+            'fix the booked and remaining seats of those that have drifted. '
+            'Drift is found with one grouped query over the date range.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('first_day', type=date.fromisoformat,
+                            help='First date to check (YYYY-MM-DD).')
+        parser.add_argument('last_day', type=date.fromisoformat,
+                            help='Last date to check (YYYY-MM-DD).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the drifted timeslots without fixing them.')
+
+    def handle(self, *args, **options):
+        if options['first_day'] > options['last_day']:
+            raise CommandError('The first day must not be after the last day.')
+
+        drifted = list(find_capacity_drift(options['first_day'], options['last_day']))
+        for timeslot in drifted:
+            self.stdout.write(
+                f'{timeslot.date} {timeslot.start_time}-{timeslot.end_time} (#{timeslot.id}): '
+                f'{timeslot.booked} booked and {timeslot.remaining} left of '
+                f'{timeslot.total_capacity}, {timeslot.reserved} reservations')
+            if not options['dry_run']:
+                reconcile_capacity(timeslot)
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drifted)} drifted timeslots.'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reservation.services import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = ('Release expired seat holds and give their seats back, in batches '
+            'of set-based statements. Run it periodically, e.g. from cron, or '
+            'keep it running with --every.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of holds released per transaction.')
+        parser.add_argument('--every', type=float,
+                            help='Keep running and sweep every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            released = release_expired_holds(batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Released {released} expired holds in {elapsed:.2f}s.'))
+
+            if not options['every']:
+                break
+            time.sleep(options['every'])
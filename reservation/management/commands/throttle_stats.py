@@ -0,0 +1,39 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.throttling import get_shed_stats, get_throttle_cache, reset_shed_stats
+
+
+class Command(BaseCommand):
+    help = ('Show how many reservation requests were admitted and how many '
+            'were shed with a 429, per reason. Needs a cache shared by the '
+            'workers, such as Redis. The counters are also served by the '
+            'metrics endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset the counters after showing them.')
+
+    def handle(self, *args, **options):
+        cache = get_throttle_cache()
+        if cache is None:
+            raise CommandError('Throttling is disabled, set RESERVATION_THROTTLE_CACHE.')
+        if isinstance(cache, LocMemCache):
+            # Each process has its own copy, this one never counted a request
+            raise CommandError(
+                'RESERVATION_THROTTLE_CACHE is a local memory cache, which this command '
+                'cannot read from the workers. Use a shared cache such as Redis, or '
+                'read the counters from the metrics endpoint.')
+
+        stats = get_shed_stats()
+        admitted = stats.pop('admitted')
+        shed = sum(stats.values())
+        total = admitted + shed
+        self.stdout.write(f'admitted: {admitted}')
+        for reason, count in stats.items():
+            self.stdout.write(f'shed ({reason}): {count}')
+        if total:
+            self.stdout.write(f'shed share: {shed / total:.1%}')
+
+        if options['reset']:
+            reset_shed_stats()
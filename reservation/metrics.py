@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .throttling import get_shed_stats, get_throttle_cache
+
+KEY_PREFIX = 'reservation:metrics'
+
+# Cache key listing every series flushed by any process
+SERIES_KEY = f'{KEY_PREFIX}:series'
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Metric families with their type and help text, in exposition order
+METRICS = {
+    'reservation_request_duration_seconds': (
+        'histogram', 'Time taken to respond to a request, per view.'),
+    'reservation_responses_total': (
+        'counter', 'Responses sent, per view and status class.'),
+    'reservation_db_queries_total': (
+        'counter', 'SQL queries executed while handling a request, per view.'),
+    'reservation_db_query_seconds_total': (
+        'counter', 'Time spent in SQL queries while handling a request, per view and '
+                   'statement kind. Writes include SELECT ... FOR UPDATE, so lock waits '
+                   'show up there.'),
+    'reservation_outcomes_total': (
+        'counter', 'Outcomes of reservation attempts.'),
+    'reservation_throttle_admitted_total': (
+        'counter', 'Requests to the views that take seats admitted by the throttle.'),
+    'reservation_throttle_shed_total': (
+        'counter', 'Requests to the views that take seats shed with a 429, per reason.'),
+}
+
+# Seconds are kept as whole microseconds, cache counters are integers
+MICROSECONDS = 1_000_000
+
+# Statistics of the request being handled in the current thread or task
+_request_stats = ContextVar('reservation_request_stats', default=None)
+
+# Counts of this process not flushed to the cache yet
+_pending = defaultdict(int)
+_pending_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def get_metrics_cache():
+    """
+    Return the cache configured by RESERVATION_METRICS_CACHE, or None if
+    metrics are disabled.
+    """
+    alias = getattr(settings, 'RESERVATION_METRICS_CACHE', '')
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _series(name, **labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels.items()) + '}'
+
+
+def _add(counts):
+    """
+    Add counts to the pending counts of this process, and flush them to the
+    cache once RESERVATION_METRICS_FLUSH_INTERVAL seconds have passed since
+    the last flush.
+    """
+    with _pending_lock:
+        for series, value in counts:
+            _pending[series] += value
+    if time.monotonic() - _last_flush >= settings.RESERVATION_METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """
+    Add the pending counts of this process to the shared counters in the
+    cache, so the metrics of every worker process add up.
+    """
+    global _last_flush
+    cache = get_metrics_cache()
+    with _pending_lock:
+        _last_flush = time.monotonic()
+        pending = dict(_pending)
+        _pending.clear()
+    if cache is None or not pending:
+        return
+
+    for series, value in pending.items():
+        key = f'{KEY_PREFIX}:{series}'
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+
+    # Register new series. A registration lost to a concurrent flush of
+    # another process is repeated on the next flush.
+    known = cache.get(SERIES_KEY, set())
+    if not known.issuperset(pending):
+        cache.set(SERIES_KEY, known | set(pending), None)
+
+
+class RequestStats:
+    """
+    SQL queries and time spent in them while handling one request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.read_time = 0.0
+        self.write_time = 0.0
+
+
+def start_request():
+    """
+    Start collecting SQL statistics for the request handled in the current
+    thread or task, and return a token for finish_request().
+    """
+    return _request_stats.set(RequestStats())
+
+
+def finish_request(token, view, status, duration):
+    """
+    Stop collecting SQL statistics for a request and record them together
+    with the request latency and the response status.
+    """
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+
+    name = 'reservation_request_duration_seconds'
+    counts = [
+        (_series(f'{name}_bucket', view=view, le=bound), 1)
+        for bound in LATENCY_BUCKETS if duration <= bound
+    ]
+    counts += [
+        (_series(f'{name}_bucket', view=view, le='+Inf'), 1),
+        (_series(f'{name}_sum', view=view), round(duration * MICROSECONDS)),
+        (_series(f'{name}_count', view=view), 1),
+        (_series('reservation_responses_total', view=view, status=f'{status // 100}xx'), 1),
+        (_series('reservation_db_queries_total', view=view), stats.queries),
+        (_series('reservation_db_query_seconds_total', view=view, statement='read'),
+         round(stats.read_time * MICROSECONDS)),
+        (_series('reservation_db_query_seconds_total', view=view, statement='write'),
+         round(stats.write_time * MICROSECONDS)),
+    ]
+    _add(counts)
+
+
+def count_outcomes(outcomes):
+    """
+    Count the outcomes of reservation attempts.
+    """
+    if get_metrics_cache() is not None:
+        _add((_series('reservation_outcomes_total', outcome=outcome), 1) for outcome in outcomes)
+
+
+def instrument_sql(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the statistics of the
+    request being handled. Queries made outside of a request are not
+    counted.
+    """
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        if sql.lstrip()[:6].upper() == 'SELECT' and 'FOR UPDATE' not in sql:
+            stats.read_time += elapsed
+        else:
+            stats.write_time += elapsed
+
+
+def install_sql_instrumentation(sender, connection, **kwargs):
+    """
+    Add the execute wrapper to every new database connection. The wrapper
+    only reads a context variable while metrics are disabled.
+    """
+    if instrument_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_sql)
+
+
+def render():
+    """
+    Flush the counts of this process and return all metrics in the
+    Prometheus text format.
+    """
+    flush()
+    cache = get_metrics_cache()
+    series = sorted(cache.get(SERIES_KEY, set())) if cache is not None else []
+    values = cache.get_many([f'{KEY_PREFIX}:{name}' for name in series]) if series else {}
+
+    families = defaultdict(list)
+    for name in series:
+        value = values.get(f'{KEY_PREFIX}:{name}', 0)
+        metric = name.split('{')[0]
+        if metric.endswith('_seconds_total') or metric.endswith('_seconds_sum'):
+            value = value / MICROSECONDS
+        family = metric.removesuffix('_bucket').removesuffix('_sum').removesuffix('_count')
+        families[family if family in METRICS else metric].append(f'{name} {value}')
+
+    # The throttle keeps its own counters in its cache
+    if get_throttle_cache() is not None:
+        stats = get_shed_stats()
+        families['reservation_throttle_admitted_total'].append(
+            f'reservation_throttle_admitted_total {stats.pop("admitted")}')
+        families['reservation_throttle_shed_total'] += [
+            f'reservation_throttle_shed_total{{reason="{reason}"}} {count}'
+            for reason, count in stats.items()]
+
+    lines = []
+    for family, (kind, help_text) in METRICS.items():
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} {kind}']
+        lines += _sorted_samples(families.get(family, []))
+    return '\n'.join(lines) + '\n'
+
+
+def _sorted_samples(samples):
+    """
+    Keep histogram buckets of one view in increasing order, as Prometheus
+    expects, with the other samples sorted by name.
+    """
+    def key(sample):
+        name = sample.split(' ')[0]
+        if '_bucket{' not in name:
+            return (name, 0.0)
+        labels, bound = name.rsplit(',le="', 1)
+        bound = bound.split('"')[0]
+        return (labels, float('inf') if bound == '+Inf' else float(bound))
+    return sorted(samples, key=key)
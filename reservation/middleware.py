@@ -0,0 +1,192 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from . import routers
+from .metrics import finish_request, get_metrics_cache, start_request
+from .throttling import (
+    TIMESLOT_CONCURRENCY, TIMESLOT_RATE, USER_CONCURRENCY, USER_RATE, acquire, count_admitted,
+    count_shed, get_throttle_cache, release, within_rate,
+)
+
+
+# URL names of the views that take seats
+THROTTLED_VIEWS = {'reserve', 'reserve_async', 'reserve_batch', 'hold', 'join_waitlist'}
+
+# Cookie pinning the reads of a client to the primary after it wrote
+PRIMARY_COOKIE = 'reservation_primary'
+
+# Methods whose requests read from the primary
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class ThrottleMiddleware(MiddlewareMixin):
+    """
+    Shed excess requests to the views that take seats with a 429 before
+    they open a transaction.
+
+    Every user and every timeslot gets a sliding window rate limit and a
+    cap on concurrent requests, configured in settings. The counters live
+    in the cache named by RESERVATION_THROTTLE_CACHE, so they are shared by
+    all workers with Redis. Admitted and shed requests are counted, see
+    throttling.get_shed_stats().
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cache = get_throttle_cache()
+        if (cache is None or request.method != 'POST'
+                or request.resolver_match.url_name not in THROTTLED_VIEWS):
+            return None
+
+        window = settings.RESERVATION_THROTTLE_WINDOW
+        user = request.user
+        scopes = [(
+            f'user:{user.pk}' if user.is_authenticated else f'ip:{request.META.get("REMOTE_ADDR")}',
+            settings.RESERVATION_USER_RATE_LIMIT, USER_RATE,
+            settings.RESERVATION_USER_CONCURRENCY, USER_CONCURRENCY,
+        )]
+        if 'timeslot_id' in view_kwargs:
+            scopes.append((
+                f'timeslot:{view_kwargs["timeslot_id"]}',
+                settings.RESERVATION_TIMESLOT_RATE_LIMIT, TIMESLOT_RATE,
+                settings.RESERVATION_TIMESLOT_CONCURRENCY, TIMESLOT_CONCURRENCY,
+            ))
+
+        # Check the rates first, they are cheaper to reject on
+        for scope, limit, reason, _, _ in scopes:
+            if limit and not within_rate(cache, scope, limit, window):
+                return self._shed(cache, reason, window)
+
+        request._throttle_slots = []
+        for scope, _, _, limit, reason in scopes:
+            if not limit:
+                continue
+            key = acquire(cache, scope, limit)
+            if key is None:
+                return self._shed(cache, reason, 1)
+            request._throttle_slots.append(key)
+
+        count_admitted(cache)
+        return None
+
+    def process_response(self, request, response):
+        # Give back the concurrent request slots taken for this request
+        slots = getattr(request, '_throttle_slots', ())
+        if slots:
+            cache = get_throttle_cache()
+            for key in slots:
+                release(cache, key)
+        return response
+
+    def _shed(self, cache, reason, retry_after):
+        count_shed(cache, reason)
+        response = JsonResponse(
+            {'error': 'Too many requests, try again later.', 'reason': reason}, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, the response status and the SQL queries of every
+    request per view, see metrics.render().
+
+    Counts are added up in memory and flushed to the cache named by
+    RESERVATION_METRICS_CACHE every RESERVATION_METRICS_FLUSH_INTERVAL
+    seconds, so recording a request costs no round trip. Put it first in
+    MIDDLEWARE to time the whole request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if get_metrics_cache() is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        token = start_request()
+        response = self.get_response(request)
+        self._finish(request, response, token, started)
+        return response
+
+    async def __acall__(self, request):
+        if get_metrics_cache() is None:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        token = start_request()
+        response = await self.get_response(request)
+        self._finish(request, response, token, started)
+        return response
+
+    @staticmethod
+    def _finish(request, response, token, started):
+        match = request.resolver_match
+        finish_request(token, match.view_name if match else 'unmatched',
+                       response.status_code, time.perf_counter() - started)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of safe requests to a read replica, see
+    routers.PrimaryReplicaRouter.
+
+    A request that wrote to the primary sets a cookie that pins the reads
+    of its client to the primary for RESERVATION_REPLICA_STICKY_SECONDS,
+    so a user sees their own reservation before it reaches the replicas.
+    Does nothing without REPLICA_DATABASES.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        token = routers.start_request(self._pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish_request(token)
+        return self._stick(response, wrote)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+
+        token = routers.start_request(self._pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = routers.finish_request(token)
+        return self._stick(response, wrote)
+
+    @staticmethod
+    def _pinned(request):
+        return request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES
+
+    @staticmethod
+    def _stick(response, wrote):
+        if wrote:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.RESERVATION_REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
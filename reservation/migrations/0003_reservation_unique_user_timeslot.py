@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0002_alter_reservation_timeslot'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(fields=('user', 'timeslot'), name='unique_user_timeslot'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-17 03:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0003_reservation_unique_user_timeslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Split the capacity across this many counter rows so concurrent bookings do not all update the same row. 0 disables sharding.'),
+        ),
+        migrations.CreateModel(
+            name='CapacityShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('timeslot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='reservation.timeslot')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='capacityshard',
+            constraint=models.UniqueConstraint(fields=('timeslot', 'index'), name='unique_timeslot_shard'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0004_timeslot_shard_count_capacityshard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['date', 'start_time'], name='timeslot_date_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(condition=models.Q(('capacity__gt', 0), ('shard_count__gt', 0), _connector='OR'), fields=['date', 'start_time'], include=('id', 'end_time', 'capacity', 'shard_count'), name='timeslot_available_idx'),
+        ),
+    ]
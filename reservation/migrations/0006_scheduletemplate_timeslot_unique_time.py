@@ -0,0 +1,55 @@
+# Generated by Django 4.2.14 on 2026-10-17 04:01
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+import re
+
+
+def check_duplicate_timeslots(apps, schema_editor):
+    """
+    Refuse to add ``unique_timeslot_time`` while timeslots share a date,
+    start and end time. Bulk imports rely on the constraint to skip the
+    timeslots that already exist, and duplicates cannot be merged for the
+    operator: each copy may hold its own seats and reservations.
+    """
+    TimeSlot = apps.get_model('reservation', 'TimeSlot')
+    duplicates = list(TimeSlot.objects.values('date', 'start_time', 'end_time').annotate(
+        copies=Count('id')).filter(copies__gt=1).order_by('date', 'start_time')[:10])
+    if duplicates:
+        raise RuntimeError(
+            'Timeslots share a date, start and end time, merge or delete the '
+            'copies and run migrate again: ' + ', '.join(
+                f'{row["date"]} {row["start_time"]}-{row["end_time"]} ({row["copies"]} copies)'
+                for row in duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0005_timeslot_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('weekdays', models.CharField(default='0,1,2,3,4', help_text='Comma separated weekdays the schedule runs on, 0 is Monday.', max_length=13, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)])),
+                ('capacity', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.RunPython(check_duplicate_timeslots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='timeslot',
+            constraint=models.UniqueConstraint(fields=('date', 'start_time', 'end_time'), name='unique_timeslot_time'),
+        ),
+        migrations.RemoveIndex(
+            model_name='timeslot',
+            name='timeslot_date_start_idx',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.14 on 2026-10-17 04:30
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_bookings(apps, schema_editor):
+    """
+    Count the existing reservations into ``booked_count`` and derive the
+    seats offered from the seats left plus the seats booked.
+    """
+    TimeSlot = apps.get_model('reservation', 'TimeSlot')
+    Reservation = apps.get_model('reservation', 'Reservation')
+    CapacityShard = apps.get_model('reservation', 'CapacityShard')
+
+    reservations = Reservation.objects.filter(timeslot=OuterRef('pk')).values(
+        'timeslot').annotate(total=Count('id')).values('total')
+    shard_seats = CapacityShard.objects.filter(timeslot=OuterRef('pk')).values(
+        'timeslot').annotate(total=Sum('capacity')).values('total')
+
+    TimeSlot.objects.update(booked_count=Coalesce(Subquery(reservations), 0))
+    TimeSlot.objects.update(total_capacity=F('capacity') + F('booked_count'))
+    TimeSlot.objects.filter(shard_count__gt=0).update(
+        total_capacity=Coalesce(Subquery(shard_seats), 0) + F('booked_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0007_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='capacityshard',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='total_capacity',
+            field=models.PositiveIntegerField(default=0, help_text='Seats offered. Reservations and cancellations do not change it.'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='timeslot',
+            name='capacity',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.RunPython(count_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0008_timeslot_total_capacity_booked_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed')], default='confirmed', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status', 'held')), fields=['expires_at'], name='reservation_hold_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.14 on 2026-10-17 04:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reservation', '0010_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTimeSlot',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField(db_index=True)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('total_capacity', models.PositiveIntegerField()),
+                ('remaining', models.PositiveIntegerField()),
+                ('booked', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('reserved_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed')], max_length=10)),
+                ('timeslot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='reservation.archivedtimeslot')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-17 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0011_archivedtimeslot_archivedreservation'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timeslot',
+            name='timeslot_available_idx',
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(condition=models.Q(('capacity__gt', 0), ('shard_count__gt', 0), _connector='OR'), fields=['date', 'start_time'], include=('id', 'end_time', 'capacity', 'total_capacity', 'booked_count', 'shard_count'), name='timeslot_available_idx'),
+        ),
+    ]
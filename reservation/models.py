@@ -1,21 +1,358 @@
+from datetime import datetime, timedelta
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator, validate_comma_separated_integer_list
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+
+class TimeSlotQuerySet(models.QuerySet):
+
+    def with_remaining(self):
+        """
+        Annotate each timeslot with its remaining seats as ``remaining``.
+        Sharded timeslots sum their shards, others read ``capacity``.
+        """
+        shard_total = CapacityShard.objects.filter(
+            timeslot=OuterRef('pk')).values('timeslot').annotate(
+            total=Sum('capacity')).values('total')
+        return self.annotate(remaining=Case(
+            When(shard_count=0, then=F('capacity')),
+            default=Coalesce(Subquery(shard_total), 0),
+            output_field=models.PositiveIntegerField(),
+        ))
+
+    def with_booked(self):
+        """
+        Annotate each timeslot with its booked seats as ``booked``, read
+        from the ``booked_count`` counters instead of counting reservations.
+        Sharded timeslots add the bookings counted on their shards.
+        """
+        shard_total = CapacityShard.objects.filter(
+            timeslot=OuterRef('pk')).values('timeslot').annotate(
+            total=Sum('booked_count')).values('total')
+        return self.annotate(booked=Case(
+            When(shard_count=0, then=F('booked_count')),
+            default=F('booked_count') + Coalesce(Subquery(shard_total), 0),
+            output_field=models.PositiveIntegerField(),
+        ))
+
+    def occupancy_by_date(self):
+        """
+        Seats offered, booked and left per date, with the number of
+        timeslots, in one grouped query.
+        """
+        return self.with_remaining().with_booked().order_by('date').values('date').annotate(
+            timeslots=Count('id'), offered=Sum('total_capacity'),
+            booked_seats=Sum('booked'), remaining_seats=Sum('remaining'))
+
+    def with_reserved_by(self, user):
+        """
+        Annotate each timeslot with whether the user has reserved it as
+        ``reserved_by_me``, checked per row through the (user, timeslot)
+        unique index.
+        """
+        return self.annotate(reserved_by_me=Exists(Reservation.objects.filter(
+            timeslot=OuterRef('pk'), user=user)))
+
+    def available_on(self, day, now=None):
+        """
+        Bookable timeslots of one day: none for past days, only those that
+        have not started yet for today, and only those with seats left.
+
+        The filters line up with the ``timeslot_available_idx`` partial
+        index, so the day's rows are read from it in start time order.
+        """
+        now = now or datetime.now()
+        if day < now.date():
+            return self.none()
+
+        timeslots = self.filter(HAS_SEATS, date=day)
+        if day == now.date():
+            timeslots = timeslots.filter(start_time__gte=now.time())
+        return timeslots.with_remaining().filter(remaining__gt=0)
+
+    def full_on(self, day, now=None):
+        """
+        Fully booked timeslots of one day that have not started yet, the
+        ones available_on() leaves out. Users can join their waitlist.
+        """
+        now = now or datetime.now()
+        if day < now.date():
+            return self.none()
+
+        timeslots = self.filter(date=day)
+        if day == now.date():
+            timeslots = timeslots.filter(start_time__gte=now.time())
+        return timeslots.with_remaining().filter(remaining=0)
+
+    def available_between(self, first_day, last_day, now=None):
+        """
+        Bookable timeslots of a date range, following the same rules as
+        available_on(): past days and timeslots of today that have started
+        are left out, as are timeslots without seats left.
+        """
+        now = now or datetime.now()
+        first_day = max(first_day, now.date())
+        if first_day > last_day:
+            return self.none()
+
+        timeslots = self.filter(HAS_SEATS, date__gte=first_day, date__lte=last_day)
+        if first_day == now.date():
+            timeslots = timeslots.exclude(date=first_day, start_time__lt=now.time())
+        return timeslots.with_remaining().filter(remaining__gt=0)
+
+
+# Timeslots that may have seats left, sharded timeslots keep their seats in
+# shards and are checked through ``remaining``
+HAS_SEATS = Q(capacity__gt=0) | Q(shard_count__gt=0)
 
 
 class TimeSlot(models.Model):
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
-    capacity = models.PositiveIntegerField()
+    # Seats left, sharded timeslots keep them in their shards instead
+    capacity = models.PositiveIntegerField(editable=False)
+    total_capacity = models.PositiveIntegerField(
+        help_text='Seats offered. Reservations and cancellations do not change it.')
+    # Seats taken, kept next to the seats left so occupancy needs no count
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+    shard_count = models.PositiveSmallIntegerField(
+        default=0,
+        help_text='Split the capacity across this many counter rows so '
+                  'concurrent bookings do not all update the same row. '
+                  '0 disables sharding.')
+
+    objects = TimeSlotQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Lets bulk imports skip timeslots that already exist. Migration
+            # 0006 stops when existing timeslots would violate it. Its index
+            # also serves lookups by date and start time.
+            models.UniqueConstraint(
+                fields=['date', 'start_time', 'end_time'], name='unique_timeslot_time'),
+        ]
+        indexes = [
+            # Includes every column the home page query selects, so it can
+            # be answered from the index
+            models.Index(
+                fields=['date', 'start_time'],
+                include=['id', 'end_time', 'capacity', 'total_capacity', 'booked_count',
+                         'shard_count'],
+                condition=HAS_SEATS,
+                name='timeslot_available_idx'),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.start_time} - {self.end_time} (Capacity: {self.capacity})"
 
+    def save(self, *args, **kwargs):
+        # Timeslots created with seats left only offer those seats
+        if self.total_capacity is None:
+            self.total_capacity = self.capacity + self.booked_count
+        super().save(*args, **kwargs)
+
+    def set_total_capacity(self, total_capacity):
+        """
+        Change the seats offered by the timeslot. The seats left follow and
+        the bookings are kept, so a total below the booked seats leaves no
+        seat.
+        """
+        with transaction.atomic():
+            # Lock the timeslot and its shards so no seat is taken meanwhile
+            booked = TimeSlot.objects.select_for_update().get(pk=self.pk).booked_count
+            booked += sum(CapacityShard.objects.select_for_update().filter(
+                timeslot=self).values_list('booked_count', flat=True))
+
+            self.total_capacity = total_capacity
+            TimeSlot.objects.filter(pk=self.pk).update(total_capacity=total_capacity)
+            self.reshard(max(total_capacity - booked, 0))
+
+    def reshard(self, capacity):
+        """
+        Store the seats left for the timeslot. Sharded timeslots spread them
+        evenly across ``shard_count`` shards and keep ``capacity`` at 0,
+        other timeslots store them in ``capacity`` directly. Bookings
+        counted on the old shards move to ``booked_count``.
+        """
+        with transaction.atomic():
+            # Lock the timeslot so concurrent reshards do not interleave
+            locked = TimeSlot.objects.select_for_update().get(pk=self.pk)
+            self.booked_count = locked.booked_count + sum(
+                self.shards.values_list('booked_count', flat=True))
+            self.shards.all().delete()
+
+            if self.shard_count:
+                base, extra = divmod(capacity, self.shard_count)
+                CapacityShard.objects.bulk_create(
+                    CapacityShard(timeslot=self, index=index,
+                                  capacity=base + (index < extra))
+                    for index in range(self.shard_count))
+                capacity = 0
+
+            self.capacity = capacity
+            TimeSlot.objects.filter(pk=self.pk).update(
+                capacity=capacity, booked_count=self.booked_count,
+                shard_count=self.shard_count)
+
+
+class CapacityShard(models.Model):
+    timeslot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField()
+    booked_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['timeslot', 'index'], name='unique_timeslot_shard'),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.index} of {self.timeslot_id} (Capacity: {self.capacity})"
+
+
+class ScheduleTemplate(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    weekdays = models.CharField(
+        max_length=13, default='0,1,2,3,4',
+        validators=[validate_comma_separated_integer_list],
+        help_text='Comma separated weekdays the schedule runs on, 0 is Monday.')
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30, validators=[MinValueValidator(1)])
+    capacity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if any(int(weekday) > 6 for weekday in self.weekdays.split(',') if weekday.isdigit()):
+            raise ValidationError({'weekdays': 'Weekdays must be between 0 and 6.'})
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError({'end_time': 'The end time must be after the start time.'})
+
+    def expand(self, first_day, last_day):
+        """
+        Yield the unsaved timeslots of the schedule between two dates,
+        inclusive. Timeslots that would run past ``end_time`` are skipped.
+        """
+        weekdays = {int(weekday) for weekday in self.weekdays.split(',')}
+        length = timedelta(minutes=self.slot_minutes)
+
+        day = first_day
+        while day <= last_day:
+            if day.weekday() in weekdays:
+                start = datetime.combine(day, self.start_time)
+                end = datetime.combine(day, self.end_time)
+                while start + length <= end:
+                    yield TimeSlot(date=day, start_time=start.time(),
+                                   end_time=(start + length).time(),
+                                   capacity=self.capacity,
+                                   total_capacity=self.capacity)
+                    start += length
+            day += timedelta(days=1)
+
 
 class Reservation(models.Model):
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     timeslot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='reservations')
     reserved_at = models.DateTimeField(auto_now_add=True)
+    # Held reservations take a seat until they are confirmed, released or
+    # expire at ``expires_at``
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=CONFIRMED)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'timeslot'], name='unique_user_timeslot'),
+        ]
+        indexes = [
+            # Lets the sweeper find expired holds without reading confirmed
+            # reservations
+            models.Index(
+                fields=['expires_at'], condition=Q(status='held'),
+                name='reservation_hold_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reservation by {self.user.username} for {self.timeslot}"
+
+
+class Waitlist(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    timeslot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='waitlist')
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'timeslot'], name='unique_user_waitlist'),
+        ]
+        indexes = [
+            # Lets promotion read the first waiters of a timeslot in order
+            models.Index(fields=['timeslot', 'joined_at', 'id'], name='waitlist_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.timeslot}"
+
+
+# The first outcome of a request sent with an Idempotency-Key, replayed to
+# retries of the same request until it expires
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    path = models.CharField(max_length=255)
+    key = models.CharField(max_length=100)
+    outcome = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'path', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.path} by {self.user_id}"
+
+
+# Timeslots moved out of the hot table by the archive_timeslots command,
+# keeping their original id and their seats as they were when archived
+class ArchivedTimeSlot(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    date = models.DateField(db_index=True)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    total_capacity = models.PositiveIntegerField()
+    remaining = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.date} {self.start_time} - {self.end_time} (Booked: {self.booked})"
+
+
+class ArchivedReservation(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    timeslot = models.ForeignKey(
+        ArchivedTimeSlot, on_delete=models.CASCADE, related_name='reservations')
+    reserved_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Reservation.STATUS_CHOICES)
 
     def __str__(self):
         return f"Reservation by {self.user.username} for {self.timeslot}"
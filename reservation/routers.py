@@ -0,0 +1,72 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Routing of the request being handled in the current thread or task
+_request_routing = ContextVar('reservation_request_routing', default=None)
+
+
+class RequestRouting:
+    """
+    The replica the reads of one request go to, and whether they have to go
+    to the primary instead.
+    """
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+def start_request(pinned):
+    """
+    Pick a replica for the reads of the request handled in the current
+    thread or task, and return a token for finish_request(). Reads of a
+    pinned request go to the primary.
+    """
+    replicas = settings.REPLICA_DATABASES
+    replica = random.choice(replicas) if replicas else None
+    return _request_routing.set(RequestRouting(replica, pinned))
+
+
+def finish_request(token):
+    """
+    Stop routing the reads of a request and return whether it wrote to the
+    primary.
+    """
+    routing = _request_routing.get()
+    _request_routing.reset(token)
+    return routing.wrote
+
+
+class PrimaryReplicaRouter:
+    """
+    Send the reads of requests to a read replica and everything else to
+    the primary.
+
+    Reads go to the primary outside of requests, in requests that are
+    pinned to it, once the request wrote, and inside transactions on the
+    primary, so rows read to be updated and SELECT ... FOR UPDATE locks are
+    always taken on current data. See ReplicaRoutingMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _request_routing.get()
+        if (routing is None or routing.replica is None or routing.pinned or routing.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _request_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the rows of the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        return obj1._state.db in databases and obj2._state.db in databases
@@ -0,0 +1,504 @@
+import random
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .admission import get_admission_store
+from .metrics import count_outcomes
+from .models import CapacityShard, Reservation, TimeSlot, Waitlist
+from .signals import PROMOTION, RESERVATION, UPDATE, send_capacity_changed
+
+
+# Possible outcomes of a reservation attempt
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+ROLLED_BACK = 'rolled_back'
+WAITLISTED = 'waitlisted'
+
+
+class SlotFull(Exception):
+    """
+    Raised inside a reservation transaction when no seat is left, so the
+    transaction is rolled back.
+    """
+
+
+def take_seat(timeslot):
+    """
+    Take one seat from a timeslot with a single conditional UPDATE.
+
+    The row is only touched if a seat is left, so concurrent writers never
+    wait on a lock taken by a preceding SELECT. Sharded timeslots take the
+    seat from a random shard that still has stock.
+
+    Args:
+        timeslot: The timeslot to take a seat from.
+
+    Returns:
+        True if a seat was taken, False if the timeslot is fully booked.
+    """
+    if timeslot.shard_count:
+        return _take_shard_seat(timeslot)
+
+    updated = TimeSlot.objects.filter(id=timeslot.id, capacity__gt=0).update(
+        capacity=F('capacity') - 1, booked_count=F('booked_count') + 1)
+    return updated == 1
+
+
+def _take_shard_seat(timeslot):
+    """
+    Take one seat from a random shard of a sharded timeslot, moving on to
+    the next shard if another writer emptied it in the meantime.
+    """
+    shard_ids = list(CapacityShard.objects.filter(
+        timeslot=timeslot, capacity__gt=0).values_list('id', flat=True))
+    random.shuffle(shard_ids)
+
+    for shard_id in shard_ids:
+        updated = CapacityShard.objects.filter(id=shard_id, capacity__gt=0).update(
+            capacity=F('capacity') - 1, booked_count=F('booked_count') + 1)
+        if updated:
+            return True
+    return False
+
+
+def release_seat(timeslot):
+    """
+    Give one seat back to a timeslot with a single UPDATE. Sharded
+    timeslots give it to a random shard, preferring one that counted the
+    booking.
+
+    Args:
+        timeslot: The timeslot to give a seat back to.
+    """
+    if not timeslot.shard_count:
+        TimeSlot.objects.filter(id=timeslot.id).update(
+            capacity=F('capacity') + 1, booked_count=Greatest(F('booked_count') - 1, 0))
+        return
+
+    shard_ids = list(CapacityShard.objects.filter(
+        timeslot=timeslot, booked_count__gt=0).values_list('id', flat=True))
+    if shard_ids:
+        CapacityShard.objects.filter(id=random.choice(shard_ids)).update(
+            capacity=F('capacity') + 1, booked_count=Greatest(F('booked_count') - 1, 0))
+        return
+
+    # The booking was counted on the timeslot when the shards were rebuilt
+    TimeSlot.objects.filter(id=timeslot.id).update(
+        booked_count=Greatest(F('booked_count') - 1, 0))
+    CapacityShard.objects.filter(
+        timeslot=timeslot, index=random.randrange(timeslot.shard_count)).update(
+        capacity=F('capacity') + 1)
+
+
+def reserve_timeslot(user, timeslot):
+    """
+    Reserve a seat in a timeslot for a user.
+
+    When an admission store is configured, a seat is taken from it first
+    and sold-out timeslots are rejected without opening a transaction.
+
+    The reservation row is then inserted so the unique constraint on
+    (user, timeslot) rejects duplicates, and a seat is taken. If no seat
+    is left the whole transaction, including the insert, is rolled back.
+
+    Args:
+        user: The user making the reservation.
+        timeslot: The timeslot to reserve.
+
+    Returns:
+        CREATED, DUPLICATE or FULL.
+    """
+    return reserve_timeslots(user, [timeslot])[timeslot.id]
+
+
+def reserve_timeslots(user, timeslots, all_or_nothing=True, expires_at=None):
+    """
+    Reserve a seat in several timeslots for a user in one transaction.
+
+    Timeslots are booked in ascending ID order, so concurrent batches take
+    their row locks in the same order and cannot deadlock each other.
+
+    Args:
+        user: The user making the reservations.
+        timeslots: The timeslots to reserve.
+        all_or_nothing: If True, nothing is reserved unless every timeslot
+            can be reserved. Otherwise each timeslot that can be reserved
+            is, and the others are skipped.
+        expires_at: If given, the seats are only held until then and have
+            to be confirmed with confirm_hold().
+
+    Returns:
+        A dict mapping each timeslot ID to CREATED, DUPLICATE or FULL, or to
+        ROLLED_BACK for timeslots that were not reserved because another
+        timeslot of an all-or-nothing batch failed.
+    """
+    timeslots = sorted({timeslot.id: timeslot for timeslot in timeslots}.values(),
+                       key=attrgetter('id'))
+    results = {}
+
+    # Take the seats from the admission store first
+    store = get_admission_store()
+    admitted = []
+    for timeslot in timeslots:
+        if store is not None and not store.acquire(timeslot.id):
+            results[timeslot.id] = FULL
+        else:
+            admitted.append(timeslot)
+
+    if not (all_or_nothing and results):
+        try:
+            with transaction.atomic():
+                for timeslot in admitted:
+                    results[timeslot.id] = _reserve_one(
+                        user, timeslot, expires_at, savepoint=not all_or_nothing)
+                    if all_or_nothing and results[timeslot.id] != CREATED:
+                        raise SlotFull
+        except SlotFull:
+            pass
+
+    if all_or_nothing and any(outcome != CREATED for outcome in results.values()):
+        # Everything was rolled back, report the timeslots that did not fail
+        # themselves as such
+        for timeslot in timeslots:
+            if results.get(timeslot.id, CREATED) == CREATED:
+                results[timeslot.id] = ROLLED_BACK
+
+    # Keep the admission store in line with the database
+    if store is not None:
+        for timeslot in admitted:
+            if results[timeslot.id] in (DUPLICATE, ROLLED_BACK):
+                store.release(timeslot.id)
+            elif results[timeslot.id] == FULL:
+                store.mark_full(timeslot.id)
+
+    # Readers of the cached availability and live subscribers must see the
+    # new capacity
+    changed = [timeslot for timeslot in admitted
+               if results[timeslot.id] in (CREATED, FULL)]
+    if changed:
+        send_capacity_changed([timeslot.id for timeslot in changed],
+                              [timeslot.date for timeslot in changed],
+                              source=RESERVATION)
+
+    count_outcomes(results.values())
+    return {timeslot.id: results[timeslot.id] for timeslot in timeslots}
+
+
+def _reserve_one(user, timeslot, expires_at, savepoint):
+    """
+    Insert a reservation, held if it expires, and take a seat inside the
+    current transaction. With a savepoint a failure only undoes this
+    timeslot, without one the caller must roll back the whole transaction.
+    """
+    status = Reservation.CONFIRMED if expires_at is None else Reservation.HELD
+    try:
+        with transaction.atomic(savepoint=savepoint):
+            # Take the seat before inserting, in the order promote_waitlist()
+            # locks in, so the two cannot deadlock on the (user, timeslot)
+            # index. A duplicate gives the seat back with the rollback.
+            if not take_seat(timeslot):
+                # A user holding one of the seats is told so
+                if Reservation.objects.filter(user=user, timeslot=timeslot).exists():
+                    return DUPLICATE
+                raise SlotFull
+            Reservation.objects.create(
+                user=user, timeslot=timeslot, status=status, expires_at=expires_at)
+    except IntegrityError:
+        return DUPLICATE
+    except SlotFull:
+        return FULL
+    return CREATED
+
+
+def cancel_reservation(user, timeslot, status=None):
+    """
+    Cancel the reservation of a user for a timeslot and give the seat back
+    in the same transaction. The freed seat goes to the waitlist first.
+
+    Args:
+        user: The user cancelling the reservation.
+        timeslot: The reserved timeslot.
+        status: If given, only a reservation with this status is cancelled.
+
+    Returns:
+        True if a reservation was cancelled, False if there was none.
+    """
+    reservations = Reservation.objects.filter(user=user, timeslot=timeslot)
+    if status is not None:
+        reservations = reservations.filter(status=status)
+
+    with transaction.atomic():
+        deleted, _ = reservations.delete()
+        if not deleted:
+            return False
+        release_seat(timeslot)
+        send_capacity_changed([timeslot.id], [timeslot.date])
+    return True
+
+
+def hold_timeslot(user, timeslot, ttl=None):
+    """
+    Hold a seat in a timeslot for a user. The seat counts against the
+    capacity like a reservation, but is given back unless the hold is
+    confirmed within ``ttl`` seconds.
+
+    Args:
+        user: The user holding the seat.
+        timeslot: The timeslot to hold a seat in.
+        ttl: Seconds until the hold expires, RESERVATION_HOLD_TTL by default.
+
+    Returns:
+        The outcome, CREATED, DUPLICATE or FULL, and the expiry time.
+    """
+    if ttl is None:
+        ttl = settings.RESERVATION_HOLD_TTL
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    outcome = reserve_timeslots(user, [timeslot], expires_at=expires_at)[timeslot.id]
+    return outcome, expires_at
+
+
+def confirm_hold(user, timeslot):
+    """
+    Turn a hold that has not expired into a confirmed reservation with one
+    UPDATE. The seat was taken when the hold was made.
+
+    Returns:
+        True if the hold was confirmed, False if there was no hold or it
+        has expired.
+    """
+    return Reservation.objects.filter(
+        user=user, timeslot=timeslot, status=Reservation.HELD,
+        expires_at__gt=timezone.now(),
+    ).update(status=Reservation.CONFIRMED, expires_at=None) == 1
+
+
+def release_hold(user, timeslot):
+    """
+    Release a hold before it expires and give the seat back.
+
+    Returns:
+        True if a hold was released, False if there was none.
+    """
+    return cancel_reservation(user, timeslot, status=Reservation.HELD)
+
+
+def release_expired_holds(now=None, batch_size=5000):
+    """
+    Delete expired holds and give their seats back, one batch per
+    transaction.
+
+    Each batch is locked with SKIP LOCKED so concurrent sweepers split the
+    work, and a hold being confirmed is either confirmed first or found
+    expired. The seats of all timeslots in a batch go back with a single
+    UPDATE; sharded timeslots have their counters rebuilt instead, as the
+    shards that took the seats are not recorded.
+
+    Args:
+        now: Holds that expired by then are released, defaults to now.
+        batch_size: Number of holds per transaction.
+
+    Returns:
+        The number of released holds.
+    """
+    now = now or timezone.now()
+    released = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(Reservation.objects.select_for_update(skip_locked=True).filter(
+                status=Reservation.HELD, expires_at__lte=now,
+            ).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+
+            holds = Reservation.objects.filter(id__in=batch)
+            freed = holds.filter(timeslot=OuterRef('pk')).values('timeslot').annotate(
+                seats=Count('id')).values('seats')
+            timeslots = TimeSlot.objects.filter(id__in=holds.values('timeslot'))
+            changed = list(timeslots.values_list('id', 'date', 'shard_count'))
+
+            timeslots.filter(shard_count=0).update(
+                capacity=F('capacity') + Subquery(freed),
+                booked_count=Greatest(F('booked_count') - Subquery(freed), 0))
+            holds.delete()
+
+            for timeslot in TimeSlot.objects.filter(
+                    id__in=[timeslot_id for timeslot_id, _, shard_count in changed if shard_count]):
+                reconcile_capacity(timeslot)
+            unsharded = [(timeslot_id, day) for timeslot_id, day, shard_count in changed
+                         if not shard_count]
+            if unsharded:
+                send_capacity_changed(
+                    [timeslot_id for timeslot_id, _ in unsharded],
+                    [day for _, day in unsharded])
+
+        released += len(batch)
+        if len(batch) < batch_size:
+            break
+    return released
+
+
+def find_capacity_drift(first_day, last_day):
+    """
+    Find the timeslots of a date range whose counters do not match their
+    reservations, with one grouped query.
+
+    A timeslot has drifted when its booked seats differ from its number of
+    reservations, or when its seats left and booked seats do not add up to
+    its total capacity.
+
+    Returns:
+        The drifted timeslots, annotated with ``remaining``, ``booked`` and
+        the number of ``reserved`` seats.
+    """
+    return TimeSlot.objects.filter(
+        date__gte=first_day, date__lte=last_day,
+    ).with_remaining().with_booked().annotate(
+        reserved=Count('reservations'),
+    ).exclude(
+        booked=F('reserved'), total_capacity=F('remaining') + F('reserved'),
+    ).order_by('date', 'start_time', 'id')
+
+
+def reconcile_capacity(timeslot):
+    """
+    Recount the reservations of a timeslot and rewrite its counters from
+    them, keeping its total capacity.
+
+    Returns:
+        The number of booked seats.
+    """
+    with transaction.atomic():
+        # Lock the timeslot and its shards so no seat is taken meanwhile
+        TimeSlot.objects.select_for_update().filter(id=timeslot.id).exists()
+        list(CapacityShard.objects.select_for_update().filter(timeslot=timeslot))
+
+        booked = Reservation.objects.filter(timeslot=timeslot).count()
+        CapacityShard.objects.filter(timeslot=timeslot).update(booked_count=0)
+        TimeSlot.objects.filter(id=timeslot.id).update(booked_count=booked)
+        timeslot.reshard(max(timeslot.total_capacity - booked, 0))
+        send_capacity_changed([timeslot.id], [timeslot.date])
+    return booked
+
+
+def join_waitlist(user, timeslot):
+    """
+    Reserve a seat in a timeslot for a user, or put the user on its
+    waitlist if it is fully booked.
+
+    Args:
+        user: The user making the reservation.
+        timeslot: The timeslot to reserve.
+
+    Returns:
+        CREATED, DUPLICATE, or WAITLISTED if the user is on the waitlist,
+        including when they already were.
+    """
+    outcome = reserve_timeslot(user, timeslot)
+    if outcome != FULL:
+        return outcome
+
+    Waitlist.objects.get_or_create(user=user, timeslot=timeslot)
+
+    # Seats may have been freed between the failed attempt and joining
+    promote_waitlist(timeslot)
+    if Reservation.objects.filter(user=user, timeslot=timeslot).exists():
+        return CREATED
+    count_outcomes([WAITLISTED])
+    return WAITLISTED
+
+
+def promote_waitlist(timeslot):
+    """
+    Give the free seats of a timeslot to the first users on its waitlist in
+    one transaction.
+
+    Only as many waiters as there are free seats are read, through the
+    ``waitlist_queue_idx`` index, so the cost follows the number of seats
+    freed and not the length of the waitlist. Waiters who reserved a seat
+    themselves in the meantime are dropped from the waitlist.
+
+    Args:
+        timeslot: The timeslot to promote waiters into.
+
+    Returns:
+        The IDs of the promoted users.
+    """
+    promoted = []
+    with transaction.atomic():
+        # Lock the timeslot, and the shards holding the seats of a sharded
+        # one, so reservations and other promotions wait for this one. The
+        # lock leaves out the key, so reservations of sharded timeslots can
+        # still check their foreign key and release the shard they hold.
+        locked = TimeSlot.objects.select_for_update(no_key=True).filter(
+            id=timeslot.id).values_list('shard_count', 'capacity').first()
+        if locked is None:
+            return promoted
+        shard_count, seats = locked
+        shards = []
+        if shard_count:
+            shards = list(CapacityShard.objects.select_for_update().filter(
+                timeslot=timeslot, capacity__gt=0).order_by('index'))
+            seats = sum(shard.capacity for shard in shards)
+
+        while seats:
+            waiters = list(Waitlist.objects.filter(timeslot=timeslot).order_by(
+                'joined_at', 'id').values_list('id', 'user_id')[:seats])
+            if not waiters:
+                break
+
+            # Skip the waiters who already hold a reservation
+            reserved = set(Reservation.objects.filter(
+                timeslot=timeslot, user_id__in=[user_id for _, user_id in waiters]
+            ).values_list('user_id', flat=True))
+            batch = [user_id for _, user_id in waiters if user_id not in reserved]
+
+            Reservation.objects.bulk_create(
+                Reservation(user_id=user_id, timeslot=timeslot) for user_id in batch)
+            Waitlist.objects.filter(id__in=[waitlist_id for waitlist_id, _ in waiters]).delete()
+            promoted.extend(batch)
+            seats -= len(batch)
+
+        if promoted:
+            _take_seats(timeslot, shard_count, shards, len(promoted))
+            send_capacity_changed([timeslot.id], [timeslot.date], source=PROMOTION)
+    return promoted
+
+
+def _take_seats(timeslot, shard_count, shards, count):
+    """
+    Take several seats from a timeslot whose row and shards are locked by
+    the current transaction and that is known to have them.
+    """
+    if not shard_count:
+        TimeSlot.objects.filter(id=timeslot.id).update(
+            capacity=F('capacity') - count, booked_count=F('booked_count') + count)
+        return
+
+    for shard in shards:
+        taken = min(shard.capacity, count)
+        CapacityShard.objects.filter(id=shard.id).update(
+            capacity=F('capacity') - taken, booked_count=F('booked_count') + taken)
+        count -= taken
+        if not count:
+            break
+
+
+def promote_on_capacity_changed(sender, timeslot_ids, source=UPDATE, **kwargs):
+    """
+    Promote waiters of timeslots whose capacity was changed by an update,
+    which is how freed seats show up.
+    """
+    if source != UPDATE:
+        return
+    waiting = Waitlist.objects.filter(timeslot_id__in=timeslot_ids).values_list(
+        'timeslot_id', flat=True).distinct()
+    for timeslot in TimeSlot.objects.filter(id__in=waiting).only('id', 'date', 'shard_count'):
+        promote_waitlist(timeslot)
@@ -0,0 +1,45 @@
+import logging
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import TimeSlot
+
+
+# Sent after a transaction that changed the capacity of timeslots has
+# committed. Receivers get the affected ``timeslot_ids``, the ``dates`` they
+# were or are now on, and the ``source`` of the change: RESERVATION for
+# seats taken by reservations, PROMOTION for seats given to waitlisted
+# users, UPDATE for admin edits, bulk updates and deletes.
+capacity_changed = Signal()
+
+logger = logging.getLogger(__name__)
+
+RESERVATION = 'reservation'
+PROMOTION = 'promotion'
+UPDATE = 'update'
+
+
+def send_capacity_changed(timeslot_ids, dates, source=UPDATE):
+    """
+    Send capacity_changed for the given timeslots once the current
+    transaction commits, so receivers read the committed state. Errors of
+    receivers are logged.
+
+    Args:
+        timeslot_ids: IDs of the timeslots whose capacity changed.
+        dates: Dates of the timeslots, including dates they moved away from.
+        source: RESERVATION, PROMOTION or UPDATE.
+    """
+    timeslot_ids = list(timeslot_ids)
+    dates = set(dates)
+
+    def send():
+        # The change is committed already, so a failing receiver must not
+        # fail the request that made it
+        for receiver, result in capacity_changed.send_robust(
+                sender=TimeSlot, timeslot_ids=timeslot_ids, dates=dates, source=source):
+            if isinstance(result, Exception):
+                logger.error('capacity_changed receiver %r failed', receiver, exc_info=result)
+
+    transaction.on_commit(send)
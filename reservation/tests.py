@@ -1,9 +1,44 @@
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import DatabaseError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
 from datetime import datetime, timedelta
-from .models import TimeSlot, Reservation
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+import asyncio
+import json
+import os
+import time
+from .admin import TimeSlotAdmin
+from .admission import get_admission_store
+from .availability import get_available_timeslots, get_stats
+from .events import broadcaster, capacity_messages
+from .management.benchmark import run_in_threads
+from .middleware import PRIMARY_COOKIE, ReplicaRoutingMiddleware
+from .models import (
+    ArchivedReservation, ArchivedTimeSlot, IdempotencyKey, ScheduleTemplate, TimeSlot, Reservation,
+    Waitlist,
+)
+from .services import (
+    CREATED, DUPLICATE, FULL, ROLLED_BACK, cancel_reservation, find_capacity_drift, hold_timeslot,
+    join_waitlist, promote_waitlist, release_expired_holds, reserve_timeslot, reserve_timeslots,
+)
+from .signals import capacity_changed, send_capacity_changed
+from .throttling import TIMESLOT_CONCURRENCY, USER_RATE, acquire, get_shed_stats, release, within_rate
 
 
 class HomeViewTests(TestCase):
@@ -38,7 +73,7 @@ class HomeViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'home.html')
         self.assertIn('timeslots', response.context)
-        self.assertIn('user_timeslots', response.context)
+        self.assertFalse(response.context['timeslots'][0].reserved_by_me)
         # Only timeslot1 is for today
         self.assertEqual(len(response.context['timeslots']), 1)
         self.assertEqual(response.context['timeslots'][0], self.timeslot1)
@@ -54,7 +89,6 @@ class HomeViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'home.html')
         self.assertNotIn('timeslots', response.context)
-        self.assertNotIn('user_timeslots', response.context)
 
     def test_home_view_with_sorting(self):
         """
@@ -91,6 +125,64 @@ class HomeViewTests(TestCase):
         self.assertEqual(response.context['timeslots'][0], self.timeslot2)
         self.assertEqual(response.context['selected_date'], selected_date)
 
+    def test_home_view_marks_reserved_timeslots(self):
+        """
+        Test that the home view flags the user's reservations in the same
+        query, however many past reservations the user has.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        Reservation.objects.create(user=self.user, timeslot=self.timeslot1)
+
+        # Past reservations should not be loaded by the home view
+        past = [TimeSlot(date=datetime.today() - timedelta(days=day),
+                         start_time=self.timeslot1.start_time,
+                         end_time=self.timeslot1.end_time, capacity=1,
+                         total_capacity=1)
+                for day in range(1, 51)]
+        TimeSlot.objects.bulk_create(past)
+        Reservation.objects.bulk_create(
+            Reservation(user=self.user, timeslot=timeslot)
+            for timeslot in TimeSlot.objects.filter(date__lt=datetime.today()))
+
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['timeslots'][0].reserved_by_me)
+        self.assertContains(response, 'Reserved by you', count=1)
+
+    def test_home_view_with_past_or_invalid_date(self):
+        """
+        Test the home view with a past or malformed date.
+        It should display no timeslots.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        yesterday = (datetime.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+        for selected_date in (yesterday, 'not-a-date'):
+            response = self.client.get(reverse('home'), {'date': selected_date})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['timeslots']), 0)
+
+    def test_home_view_with_unknown_sort_field(self):
+        """
+        Test the home view with a sort field that is not allowed.
+        It should fall back to sorting by start time.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        response = self.client.get(reverse('home'), {'sort_by': 'user__password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['sort_by'], 'start_time')
+
+    def test_explain_home_query_command(self):
+        """
+        Test that the explain command prints a plan and rolls back the
+        seeded timeslots.
+        """
+        out = StringIO()
+        call_command('explain_home_query', seed_days=4, slots_per_day=4, stdout=out)
+
+        self.assertIn('Home query for', out.getvalue())
+        self.assertEqual(TimeSlot.objects.count(), 2)
+
 
 class ReserveViewTests(TestCase):
 
@@ -107,6 +199,25 @@ class ReserveViewTests(TestCase):
             capacity=5
         )
 
+    def test_failing_receiver_does_not_fail_reservation(self):
+        """
+        Test that a capacity_changed receiver raising after the reservation
+        committed is logged instead of failing the request.
+        """
+        def failing_receiver(**kwargs):
+            raise RuntimeError('receiver failed')
+
+        capacity_changed.connect(failing_receiver)
+        self.addCleanup(capacity_changed.disconnect, failing_receiver)
+        self.client.force_login(self.user)
+
+        with self.assertLogs('reservation.signals', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertTrue(Reservation.objects.filter(user=self.user, timeslot=self.timeslot).exists())
+
     def test_reserve_view_success(self):
         """
         Test reserving a timeslot successfully.
@@ -155,7 +266,9 @@ class ReserveViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse('home'))
 
-        # Check that an error message is displayed
+        # Check that an error message is displayed and the user is not put
+        # on the waitlist without asking
+        self.assertFalse(Waitlist.objects.exists())
         messages = list(get_messages(response.wsgi_request))
         self.assertEqual(len(messages), 1)
         self.assertEqual(
@@ -186,3 +299,1872 @@ class ReserveViewTests(TestCase):
         self.assertEqual(len(messages), 1)
         self.assertEqual(
             str(messages[0]), f'Reservation already exists for you on {self.timeslot.date.strftime("%Y-%m-%d")} at {self.timeslot.start_time}')
+
+    def test_reserve_view_missing_timeslot(self):
+        """
+        Test attempting to reserve a timeslot that does not exist.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        response = self.client.post(reverse('reserve', args=[0]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Reservation.objects.exists())
+
+
+class ShardedTimeSlotTests(TestCase):
+
+    def setUp(self):
+        # Create a test user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+        # Create a timeslot with its capacity split across three shards
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=0,
+            shard_count=3
+        )
+        self.timeslot.reshard(5)
+
+    def test_reshard_spreads_capacity(self):
+        """
+        Test that resharding spreads the capacity evenly over the shards.
+        """
+        self.assertEqual(
+            sorted(self.timeslot.shards.values_list('capacity', flat=True)),
+            [1, 2, 2])
+        self.assertEqual(self.timeslot.capacity, 0)
+        self.assertEqual(
+            TimeSlot.objects.with_remaining().get(id=self.timeslot.id).remaining, 5)
+
+    def test_reserve_takes_seat_from_a_shard(self):
+        """
+        Test that reserving a sharded timeslot decrements one shard and the
+        home page shows the summed capacity.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        self.assertTrue(Reservation.objects.filter(
+            user=self.user, timeslot=self.timeslot).exists())
+        response = self.client.get(reverse('home'), {
+            'date': self.timeslot.date.strftime('%Y-%m-%d')})
+        self.assertEqual(response.context['timeslots'][0].remaining, 4)
+
+    def test_reserve_fully_booked_shards(self):
+        """
+        Test that a sharded timeslot with empty shards is fully booked and
+        hidden from the home page.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        self.timeslot.shards.update(capacity=0)
+
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        self.assertFalse(Reservation.objects.exists())
+        response = self.client.get(reverse('home'), {
+            'date': self.timeslot.date.strftime('%Y-%m-%d')})
+        self.assertEqual(len(response.context['timeslots']), 0)
+
+    def test_reshard_back_to_single_counter(self):
+        """
+        Test that disabling sharding moves the capacity back to the timeslot.
+        """
+        self.timeslot.shard_count = 0
+        self.timeslot.reshard(4)
+
+        self.timeslot.refresh_from_db()
+        self.assertEqual(self.timeslot.capacity, 4)
+        self.assertFalse(self.timeslot.shards.exists())
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        # Create a test user and log in the async client
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.async_client.force_login(self.user)
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=5
+        )
+        self.selected_date = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    async def test_home_async_view(self):
+        """
+        Test that the async home view lists the timeslots and links them to
+        the async reserve view.
+        """
+        response = await self.async_client.get(
+            reverse('home_async'), {'date': self.selected_date})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['timeslots'], [self.timeslot])
+        self.assertContains(response, reverse('reserve_async', args=[self.timeslot.id]))
+
+    async def test_home_view_follows_changes_only_under_asgi(self):
+        """
+        Test that the home page long-polls for capacity changes when served
+        under ASGI, and not under WSGI where a poll holds a worker thread.
+        """
+        poll_url = reverse('capacity_poll', args=[self.selected_date])
+        response = await self.async_client.get(reverse('home'), {'date': self.selected_date})
+        self.assertContains(response, poll_url)
+
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await sync_to_async(self.client.get)(reverse('home'), {'date': self.selected_date})
+        self.assertNotContains(response, poll_url)
+
+    def test_benchmark_asgi_command(self):
+        """
+        Test that the benchmark serves both home pages, and removes only the
+        user and timeslots it created, even after a crashed run.
+        """
+        day = datetime.today().date() + timedelta(days=3650)
+        existing = TimeSlot.objects.create(
+            date=day, start_time='09:00', end_time='10:00', capacity=1)
+        get_user_model().objects.create(username='benchmark-asgi-0')
+
+        out = StringIO()
+        call_command('benchmark_asgi', connections=2, requests=4, stdout=out)
+
+        self.assertIn('home_async', out.getvalue())
+        self.assertEqual(set(TimeSlot.objects.all()), {self.timeslot, existing})
+        self.assertFalse(get_user_model().objects.filter(username='benchmark-asgi-0').exists())
+
+    async def test_reserve_async_view(self):
+        """
+        Test reserving a timeslot through the async reserve view.
+        """
+        response = await self.async_client.post(
+            reverse('reserve_async', args=[self.timeslot.id]))
+
+        self.assertRedirects(response, reverse('home_async'), fetch_redirect_response=False)
+        self.assertTrue(await Reservation.objects.filter(
+            user=self.user, timeslot=self.timeslot).aexists())
+        timeslot = await TimeSlot.objects.aget(id=self.timeslot.id)
+        self.assertEqual(timeslot.capacity, 4)
+
+    async def test_reserve_async_view_anonymous(self):
+        """
+        Test that anonymous users are sent to the login page.
+        """
+        response = await AsyncClient().post(
+            reverse('reserve_async', args=[self.timeslot.id]))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+
+class ReserveBatchViewTests(TestCase):
+
+    def setUp(self):
+        # Create a test user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+        # Create three test timeslots, the last one fully booked
+        self.timeslots = [
+            TimeSlot.objects.create(
+                date=datetime.today() + timedelta(days=day),
+                start_time=(datetime.now() + timedelta(hours=2)).time(),
+                end_time=(datetime.now() + timedelta(hours=3)).time(),
+                capacity=capacity)
+            for day, capacity in ((1, 2), (2, 2), (3, 0))
+        ]
+        self.client.login(username='testuser', password='Testpassword123!')
+
+    def _reserve(self, timeslots, **data):
+        return self.client.post(reverse('reserve_batch'), {
+            'timeslot_ids': [timeslot.id for timeslot in timeslots], **data})
+
+    def test_reserve_batch_success(self):
+        """
+        Test reserving several timeslots at once.
+        """
+        response = self._reserve(self.timeslots[:2])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['reserved'])
+        self.assertEqual(
+            [result['outcome'] for result in response.json()['results']],
+            [CREATED, CREATED])
+        self.assertEqual(Reservation.objects.filter(user=self.user).count(), 2)
+
+    def test_reserve_batch_all_or_nothing(self):
+        """
+        Test that a batch with a fully booked timeslot reserves nothing.
+        """
+        response = self._reserve(self.timeslots)
+
+        self.assertFalse(response.json()['reserved'])
+        self.assertEqual(
+            [result['outcome'] for result in response.json()['results']],
+            [ROLLED_BACK, ROLLED_BACK, FULL])
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(
+            sorted(TimeSlot.objects.values_list('capacity', flat=True)), [0, 2, 2])
+
+    def test_reserve_batch_best_effort(self):
+        """
+        Test that a best effort batch reserves every timeslot it can.
+        """
+        Reservation.objects.create(user=self.user, timeslot=self.timeslots[1])
+
+        response = self._reserve(self.timeslots, best_effort='true')
+
+        self.assertEqual(
+            [result['outcome'] for result in response.json()['results']],
+            [CREATED, DUPLICATE, FULL])
+        self.assertEqual(Reservation.objects.filter(user=self.user).count(), 2)
+        self.timeslots[0].refresh_from_db()
+        self.assertEqual(self.timeslots[0].capacity, 1)
+
+    def test_reserve_batch_invalid(self):
+        """
+        Test that empty, malformed and unknown timeslot IDs are rejected.
+        """
+        self.assertEqual(self._reserve([]).status_code, 400)
+        self.assertEqual(
+            self.client.post(reverse('reserve_batch'), {'timeslot_ids': 'x'}).status_code, 400)
+        response = self.client.post(reverse('reserve_batch'), {'timeslot_ids': [0]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [0])
+
+
+@override_settings(RESERVATION_ADMISSION_CACHE='default')
+class AdmissionStoreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.store = get_admission_store()
+
+        # Create a test user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=1
+        )
+
+    def test_store_is_loaded_on_first_reservation(self):
+        """
+        Test that a timeslot missing from the store is loaded from the
+        database and its seat is taken from both.
+        """
+        self.assertEqual(reserve_timeslot(self.user, self.timeslot), CREATED)
+
+        self.assertEqual(cache.get(self.store.key(self.timeslot.id)), 0)
+        self.timeslot.refresh_from_db()
+        self.assertEqual(self.timeslot.capacity, 0)
+
+    def test_sold_out_is_rejected_without_database(self):
+        """
+        Test that a timeslot sold out in the store is rejected without any
+        database query.
+        """
+        self.store.mark_full(self.timeslot.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(reserve_timeslot(self.user, self.timeslot), FULL)
+
+    def test_duplicate_gives_seat_back(self):
+        """
+        Test that a seat taken from the store is given back when the
+        database rejects a duplicate reservation.
+        """
+        Reservation.objects.create(user=self.user, timeslot=self.timeslot)
+        self.store.load(TimeSlot.objects.all())
+
+        self.assertEqual(reserve_timeslot(self.user, self.timeslot), DUPLICATE)
+        self.assertEqual(cache.get(self.store.key(self.timeslot.id)), 1)
+
+    def test_capacity_change_writes_through(self):
+        """
+        Test that capacity changes are written through to the store and
+        deleted timeslots are dropped from it.
+        """
+        self.store.load(TimeSlot.objects.all())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=7)
+            send_capacity_changed([self.timeslot.id], [self.timeslot.date])
+        self.assertEqual(cache.get(self.store.key(self.timeslot.id)), 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            timeslot_id = self.timeslot.id
+            self.timeslot.delete()
+            send_capacity_changed([timeslot_id], [self.timeslot.date])
+        self.assertIsNone(cache.get(self.store.key(timeslot_id)))
+
+    def test_rebuild_command(self):
+        """
+        Test that the rebuild command reloads upcoming timeslots into a
+        shared cache, and refuses a local memory cache it cannot share.
+        """
+        with self.assertRaisesMessage(CommandError, 'local memory cache'):
+            call_command('rebuild_admission_store', stdout=StringIO())
+
+        with TemporaryDirectory() as location, override_settings(
+                CACHES={**settings.CACHES, 'shared': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location}},
+                RESERVATION_ADMISSION_CACHE='shared'):
+            store = get_admission_store()
+            store.cache.set(store.key(self.timeslot.id), 0)
+
+            call_command('rebuild_admission_store', stdout=StringIO())
+
+            self.assertEqual(store.cache.get(store.key(self.timeslot.id)), 1)
+
+
+@override_settings(RESERVATION_AVAILABILITY_CACHE='default')
+class AvailabilityCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # Create a test user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=(datetime.today() + timedelta(days=1)).date(),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=5
+        )
+        self.selected_date = self.timeslot.date.strftime('%Y-%m-%d')
+
+    def test_availability_is_cached_per_date(self):
+        """
+        Test that the second read of a date is served from the cache and
+        counted as a hit.
+        """
+        with self.assertNumQueries(1):
+            get_available_timeslots(self.timeslot.date)
+        with self.assertNumQueries(0):
+            timeslots = get_available_timeslots(self.timeslot.date)
+
+        self.assertEqual(timeslots, [self.timeslot])
+        self.assertEqual(get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_reserve_invalidates_cached_date(self):
+        """
+        Test that a reservation bumps the cached date so the home page shows
+        the new capacity and the user's reservation right away.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        self.client.get(reverse('home'), {'date': self.selected_date})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        response = self.client.get(reverse('home'), {'date': self.selected_date})
+        self.assertEqual(response.context['timeslots'][0].remaining, 4)
+        self.assertTrue(response.context['timeslots'][0].reserved_by_me)
+
+    def test_capacity_change_invalidates_cached_date(self):
+        """
+        Test that capacity changes made outside the reservation path bump
+        the cached date.
+        """
+        get_available_timeslots(self.timeslot.date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=0)
+            send_capacity_changed([self.timeslot.id], [self.timeslot.date])
+
+        self.assertEqual(get_available_timeslots(self.timeslot.date), [])
+
+    def test_started_timeslots_are_filtered_on_read(self):
+        """
+        Test that timeslots of today that have started are not returned from
+        the cached day.
+        """
+        now = datetime.now()
+        started = TimeSlot.objects.create(
+            date=now.date(), start_time=now.replace(hour=0, minute=0).time(),
+            end_time=now.replace(hour=0, minute=30).time(), capacity=1)
+
+        self.assertEqual(get_available_timeslots(now.date(), now), [])
+        self.assertEqual(
+            get_available_timeslots(now.date(), now.replace(hour=0, minute=0)),
+            [started])
+
+
+class AvailabilityApiTests(TestCase):
+
+    def setUp(self):
+        # Create two days of timeslots starting tomorrow
+        tomorrow = (datetime.today() + timedelta(days=1)).date()
+        self.timeslots = [
+            TimeSlot.objects.create(
+                date=tomorrow + timedelta(days=day),
+                start_time=datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0).time(),
+                end_time=datetime.now().replace(hour=hour, minute=30, second=0, microsecond=0).time(),
+                capacity=hour % 3)
+            for day in range(2) for hour in (9, 10, 11)
+        ]
+        # Timeslots with capacity 0 are not bookable
+        self.bookable = [timeslot for timeslot in self.timeslots if timeslot.capacity]
+        self.first_day = tomorrow.isoformat()
+        self.last_day = (tomorrow + timedelta(days=1)).isoformat()
+
+    def test_availability_for_a_date(self):
+        """
+        Test that a single date lists its bookable timeslots.
+        """
+        response = self.client.get(reverse('availability'), {'date': self.first_day})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['id'] for result in response.json()['results']],
+            [timeslot.id for timeslot in self.bookable[:2]])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_availability_keyset_pagination(self):
+        """
+        Test that following next_cursor walks a date range page by page.
+        """
+        ids = []
+        params = {'start': self.first_day, 'end': self.last_day, 'limit': 3}
+        while True:
+            data = self.client.get(reverse('availability'), params).json()
+            ids += [result['id'] for result in data['results']]
+            if data['next_cursor'] is None:
+                break
+            params['cursor'] = data['next_cursor']
+
+        self.assertEqual(ids, [timeslot.id for timeslot in self.bookable])
+
+    def test_availability_conditional_get(self):
+        """
+        Test that a poll with the current ETag gets a 304 without using the
+        session, and a changed timeslot changes the ETag.
+        """
+        response = self.client.get(reverse('availability'), {'date': self.first_day})
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('availability'), {'date': self.first_day},
+                HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        TimeSlot.objects.filter(id=self.bookable[0].id).update(capacity=7)
+        response = self.client.get(
+            reverse('availability'), {'date': self.first_day},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_availability_invalid_parameters(self):
+        """
+        Test that malformed parameters are rejected.
+        """
+        for params in ({'date': 'tomorrow'}, {'start': self.first_day},
+                       {'limit': 0}, {'cursor': 'not-a-cursor'}):
+            response = self.client.get(reverse('availability'), params)
+            self.assertEqual(response.status_code, 400)
+
+
+class BulkTimeSlotTests(TestCase):
+
+    def setUp(self):
+        # A Monday to start the schedules on
+        self.monday = (datetime.today() + timedelta(days=7 - datetime.today().weekday())).date()
+
+    def test_generate_timeslots_command(self):
+        """
+        Test that a weekday schedule is expanded into timeslots and that
+        running it again skips the existing timeslots.
+        """
+        last_day = self.monday + timedelta(days=6)
+        for _ in range(2):
+            call_command(
+                'generate_timeslots', self.monday.isoformat(), last_day.isoformat(),
+                '--start', '09:00', '--end', '17:00', '--minutes', '30',
+                '--capacity', '10', '--batch-size', '7', stdout=StringIO())
+
+        # 5 weekdays of 16 half hour timeslots
+        self.assertEqual(TimeSlot.objects.count(), 80)
+        self.assertFalse(TimeSlot.objects.filter(date__gt=self.monday + timedelta(days=4)).exists())
+        self.assertEqual(
+            TimeSlot.objects.filter(date=self.monday).order_by('start_time').last().end_time.isoformat(),
+            '17:00:00')
+
+    def test_import_timeslots_command(self):
+        """
+        Test that timeslots are imported from a CSV file and duplicates are
+        skipped.
+        """
+        day = self.monday.isoformat()
+        path = self._write_csv(
+            'date,start_time,end_time,capacity\n'
+            f'{day},09:00,10:00,5\n'
+            f'{day},10:00,11:00,5\n'
+            f'{day},09:00,10:00,5\n')
+
+        out = StringIO()
+        call_command('import_timeslots', path, stdout=out)
+
+        self.assertEqual(TimeSlot.objects.count(), 2)
+        self.assertIn('Processed 3 timeslots', out.getvalue())
+
+    def test_import_timeslots_malformed_row(self):
+        """
+        Test that a malformed row is reported with its line number.
+        """
+        path = self._write_csv(
+            'date,start_time,end_time,capacity\n'
+            f'{self.monday.isoformat()},09:00,10:00,many\n')
+
+        with self.assertRaisesMessage(CommandError, 'Line 2'):
+            call_command('import_timeslots', path, stdout=StringIO())
+
+    def test_generate_timeslots_admin_action(self):
+        """
+        Test that the admin action expands the selected schedule templates.
+        """
+        admin_user = get_user_model().objects.create_superuser(
+            username='admin', password='Testpassword123!')
+        self.client.force_login(admin_user)
+        template = ScheduleTemplate.objects.create(
+            name='Mornings', weekdays='0', start_time='09:00',
+            end_time='12:00', slot_minutes=60, capacity=3)
+
+        response = self.client.post(
+            reverse('admin:reservation_scheduletemplate_changelist'), {
+                'action': 'generate_timeslots',
+                '_selected_action': [template.id],
+                'apply': 'Generate timeslots',
+                'first_day': self.monday.isoformat(),
+                'last_day': (self.monday + timedelta(days=13)).isoformat(),
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TimeSlot.objects.count(), 6)
+
+    def _write_csv(self, content):
+        with NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(content)
+        self.addCleanup(os.remove, csv_file.name)
+        return csv_file.name
+
+
+class TimeSlotAdminTests(TestCase):
+
+    def setUp(self):
+        admin_user = get_user_model().objects.create_superuser(
+            username='admin', password='Testpassword123!')
+        self.client.force_login(admin_user)
+        self.users = get_user_model().objects.bulk_create(
+            get_user_model()(username=f'user{i}') for i in range(4))
+
+        # Two timeslots a day apart, the second one sharded
+        self.day = (datetime.today() + timedelta(days=1)).date()
+        self.timeslots = [
+            TimeSlot.objects.create(
+                date=self.day + timedelta(days=offset), start_time='09:00',
+                end_time='10:00', capacity=4, shard_count=shard_count)
+            for offset, shard_count in ((0, 0), (1, 2))
+        ]
+        self.timeslots[1].reshard(4)
+        for timeslot in self.timeslots:
+            for user in self.users[:3]:
+                reserve_timeslot(user, timeslot)
+
+    def _action(self, action, **data):
+        return self.client.post(reverse('admin:reservation_timeslot_changelist'), {
+            'action': action,
+            '_selected_action': [timeslot.id for timeslot in self.timeslots],
+            **data,
+        })
+
+    def _seats(self, timeslot):
+        timeslot = TimeSlot.objects.with_remaining().with_booked().get(id=timeslot.id)
+        return timeslot.total_capacity, timeslot.booked, timeslot.remaining
+
+    def test_changelists_use_joined_fetching(self):
+        """
+        Test that the reservation changelist takes as many queries for many
+        rows as for a few.
+        """
+        url = reverse('admin:reservation_reservation_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        for user in self.users[3:]:
+            for timeslot in self.timeslots:
+                reserve_timeslot(user, timeslot)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+    def test_occupancy_dashboard(self):
+        """
+        Test that the dashboard shows the seats per day.
+        """
+        response = self.client.get(reverse('admin:reservation_timeslot_occupancy'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(day['date'], day['timeslots'], day['offered'], day['booked_seats'],
+              day['remaining_seats']) for day in response.context['days']],
+            [(self.day, 1, 4, 3, 1), (self.day + timedelta(days=1), 1, 4, 3, 1)])
+        self.assertContains(response, '75%')
+
+    def test_adjust_capacity_action(self):
+        """
+        Test that seats are added and removed while bookings are kept.
+        """
+        # The number of seats is asked for first
+        response = self._action('adjust_capacity')
+        self.assertContains(response, 'Change seats for 2 selected timeslots')
+
+        response = self._action('adjust_capacity', apply='Change seats', change='2')
+        self.assertEqual(response.status_code, 302)
+        for timeslot in self.timeslots:
+            self.assertEqual(self._seats(timeslot), (6, 3, 3))
+
+        self._action('adjust_capacity', apply='Change seats', change='-5')
+        for timeslot in self.timeslots:
+            self.assertEqual(self._seats(timeslot), (1, 3, 0))
+
+    def test_change_keeps_concurrent_bookings(self):
+        """
+        Test that saving a timeslot keeps the seats booked after its change
+        form was loaded.
+        """
+        timeslot = self.timeslots[0]
+        url = reverse('admin:reservation_timeslot_change', args=[timeslot.id])
+        data = {'date': timeslot.date.isoformat(), 'start_time': '09:00', 'end_time': '10:00',
+                'total_capacity': 4, 'shard_count': 0}
+        loaded = TimeSlot.objects.get(id=timeslot.id)
+
+        def get_object(*args):
+            # The last seat is booked while the change is being made
+            reserve_timeslot(self.users[3], timeslot)
+            return loaded
+
+        with patch.object(TimeSlotAdmin, 'get_object', side_effect=get_object):
+            response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._seats(timeslot), (4, 4, 0))
+        late_user = get_user_model().objects.create(username='user4')
+        self.assertEqual(reserve_timeslot(late_user, timeslot), FULL)
+
+    def test_close_timeslots_action(self):
+        """
+        Test that closed timeslots have no seats left and keep their
+        reservations.
+        """
+        self._action('close_timeslots')
+
+        for timeslot in self.timeslots:
+            self.assertEqual(self._seats(timeslot), (3, 3, 0))
+        self.assertEqual(Reservation.objects.count(), 6)
+        self.assertEqual(reserve_timeslot(self.users[3], self.timeslots[1]), FULL)
+
+    def test_clone_timeslots_action(self):
+        """
+        Test that the selected days are copied with all seats left, sharded
+        timeslots with their shards, and that existing copies are skipped.
+        """
+        first_day = self.day + timedelta(days=7)
+        for _ in range(2):
+            response = self._action(
+                'clone_timeslots', apply='Copy timeslots', first_day=first_day.isoformat())
+            self.assertEqual(response.status_code, 302)
+
+        copies = TimeSlot.objects.filter(date__gte=first_day).order_by('date')
+        self.assertEqual([copy.date for copy in copies],
+                         [first_day, first_day + timedelta(days=1)])
+        for copy in copies:
+            self.assertEqual(self._seats(copy), (4, 0, 4))
+        self.assertEqual(copies[1].shards.count(), 2)
+
+
+class SessionStorageTests(TestCase):
+
+    def test_purge_sessions_command(self):
+        """
+        Test that only expired sessions are deleted, in batches.
+        """
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(session_key=f'key{i}', session_data='',
+                    expire_date=now + timedelta(days=1 if i < 2 else -1))
+            for i in range(5))
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+
+        self.assertIn('Purged 3 expired sessions', out.getvalue())
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)),
+                         ['key0', 'key1'])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+                       MESSAGE_STORAGE='django.contrib.messages.storage.cookie.CookieStorage')
+    def test_cookie_storage_profile(self):
+        """
+        Test that with sessions and messages in cookies, reserving and
+        showing the outcome never touches the session table.
+        """
+        user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=1
+        )
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('reserve', args=[timeslot.id]), follow=True)
+        self.assertContains(response, 'Reservation created successfully')
+        self.assertFalse(any('django_session' in query['sql'] for query in queries))
+
+    def test_benchmark_sessions_command(self):
+        """
+        Test that the benchmark reports fewer queries per home page request
+        without database sessions.
+        """
+        out = StringIO()
+        call_command('benchmark_sessions', requests=2, stdout=out)
+
+        rows = {line.split()[0]: line.split()[1:] for line in out.getvalue().splitlines()[1:4]}
+        self.assertEqual(rows['db'][1], '(1.0)')
+        self.assertEqual(rows['signed_cookies'][1], '(0.0)')
+        self.assertLess(float(rows['signed_cookies'][0]), float(rows['db'][0]))
+        self.assertFalse(TimeSlot.objects.exists())
+
+
+class WaitlistTests(TestCase):
+
+    def setUp(self):
+        # Create a test user and a fully booked test timeslot
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=0
+        )
+        self.waiters = get_user_model().objects.bulk_create(
+            get_user_model()(username=f'waiter{i}') for i in range(20))
+
+    def test_join_waitlist_view(self):
+        """
+        Test that a user asking for a fully booked timeslot is put on its
+        waitlist once, however often they ask.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        for _ in range(2):
+            response = self.client.post(reverse('join_waitlist', args=[self.timeslot.id]))
+            self.assertRedirects(response, reverse('home'))
+
+        self.assertEqual(Waitlist.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertIn('waitlist', str(list(get_messages(response.wsgi_request))[-1]))
+
+    def test_home_view_offers_waitlist_of_full_timeslots(self):
+        """
+        Test that fully booked timeslots are listed on the home page with a
+        button to join their waitlist instead of reserving.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        for url_name in ('home', 'home_async'):
+            response = self.client.get(reverse(url_name), {
+                'date': self.timeslot.date.strftime('%Y-%m-%d')})
+
+            self.assertEqual(len(response.context['timeslots']), 0)
+            self.assertEqual(list(response.context['full_timeslots']), [self.timeslot])
+            self.assertContains(response, reverse('join_waitlist', args=[self.timeslot.id]))
+            self.assertNotContains(response, 'No timeslots available')
+            self.assertNotContains(response, reverse('reserve', args=[self.timeslot.id]))
+
+    def test_join_waitlist_with_seats_left_reserves(self):
+        """
+        Test that joining the waitlist of a timeslot with seats left reserves
+        a seat right away.
+        """
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=1)
+
+        self.assertEqual(join_waitlist(self.user, self.timeslot), CREATED)
+        self.assertFalse(Waitlist.objects.exists())
+
+    def test_capacity_increase_promotes_first_waiters(self):
+        """
+        Test that raising the capacity promotes as many waiters as seats were
+        freed, in the order they joined.
+        """
+        for waiter in self.waiters:
+            join_waitlist(waiter, self.timeslot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=3)
+            send_capacity_changed([self.timeslot.id], [self.timeslot.date])
+
+        self.assertEqual(
+            set(Reservation.objects.values_list('user_id', flat=True)),
+            {waiter.id for waiter in self.waiters[:3]})
+        self.assertEqual(Waitlist.objects.count(), 17)
+        self.assertEqual(TimeSlot.objects.get(id=self.timeslot.id).capacity, 0)
+
+    def test_promotion_cost_follows_seats_freed(self):
+        """
+        Test that promotion runs a fixed number of queries whatever the
+        length of the waitlist.
+        """
+        for waiter in self.waiters:
+            join_waitlist(waiter, self.timeslot)
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=2)
+
+        # Savepoint, lock, waiters, their reservations, insert, delete,
+        # seats and release
+        with self.assertNumQueries(8):
+            promote_waitlist(self.timeslot)
+
+    def test_promotion_skips_waiters_with_a_reservation(self):
+        """
+        Test that waiters who got a seat on their own are dropped from the
+        waitlist and the seat goes to the next waiter.
+        """
+        for waiter in self.waiters[:3]:
+            join_waitlist(waiter, self.timeslot)
+        Reservation.objects.create(user=self.waiters[0], timeslot=self.timeslot)
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=1)
+
+        self.assertEqual(promote_waitlist(self.timeslot), [self.waiters[1].id])
+        self.assertEqual(
+            list(Waitlist.objects.values_list('user_id', flat=True)), [self.waiters[2].id])
+
+    def test_promotion_into_sharded_timeslot(self):
+        """
+        Test that promoted waiters take their seats from the shards.
+        """
+        for waiter in self.waiters[:5]:
+            join_waitlist(waiter, self.timeslot)
+        self.timeslot.shard_count = 2
+        self.timeslot.reshard(3)
+
+        self.assertEqual(len(promote_waitlist(self.timeslot)), 3)
+        self.assertEqual(
+            TimeSlot.objects.with_remaining().get(id=self.timeslot.id).remaining, 0)
+
+
+class CapacityAccountingTests(TestCase):
+
+    def setUp(self):
+        # Create a test user and log in
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=(datetime.today() + timedelta(days=1)).date(),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=5
+        )
+
+    def _counters(self):
+        timeslot = TimeSlot.objects.with_remaining().with_booked().get(id=self.timeslot.id)
+        return timeslot.total_capacity, timeslot.booked, timeslot.remaining
+
+    def test_reserve_counts_booking(self):
+        """
+        Test that a reservation moves a seat from the seats left to the
+        booked seats and keeps the total capacity.
+        """
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        self.assertEqual(self._counters(), (5, 1, 4))
+
+    def test_cancel_view_restores_seat(self):
+        """
+        Test that cancelling a reservation removes it and gives the seat back.
+        """
+        reserve_timeslot(self.user, self.timeslot)
+
+        response = self.client.post(reverse('cancel', args=[self.timeslot.id]))
+
+        self.assertRedirects(response, reverse('home'))
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(self._counters(), (5, 0, 5))
+
+    def test_cancel_view_without_reservation(self):
+        """
+        Test that cancelling a timeslot the user has not reserved leaves the
+        counters alone.
+        """
+        response = self.client.post(reverse('cancel', args=[self.timeslot.id]))
+
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(messages[0].tags, 'error')
+        self.assertEqual(self._counters(), (5, 0, 5))
+
+    def test_cancel_promotes_waiter(self):
+        """
+        Test that the seat freed by a cancellation goes to the first waiter.
+        """
+        waiter = get_user_model().objects.create_user(username='waiter')
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=1)
+        reserve_timeslot(self.user, self.timeslot)
+        join_waitlist(waiter, self.timeslot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_reservation(self.user, self.timeslot)
+
+        self.assertEqual(
+            list(Reservation.objects.values_list('user_id', flat=True)), [waiter.id])
+        self.assertFalse(Waitlist.objects.exists())
+
+    def test_sharded_counters(self):
+        """
+        Test that sharded timeslots count bookings on their shards and keep
+        them when the shards are rebuilt.
+        """
+        self.timeslot.shard_count = 3
+        self.timeslot.set_total_capacity(5)
+        reserve_timeslot(self.user, self.timeslot)
+        self.assertEqual(self._counters(), (5, 1, 4))
+
+        self.timeslot.set_total_capacity(8)
+        self.assertEqual(self._counters(), (8, 1, 7))
+
+        cancel_reservation(self.user, self.timeslot)
+        self.assertEqual(self._counters(), (8, 0, 8))
+
+    def test_reconcile_capacity_command(self):
+        """
+        Test that drifted counters are found with one query and rebuilt from
+        the reservations, and that a dry run only reports them.
+        """
+        reserve_timeslot(self.user, self.timeslot)
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=5, booked_count=3)
+        day = self.timeslot.date.isoformat()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(find_capacity_drift(self.timeslot.date, self.timeslot.date)), 1)
+
+        out = StringIO()
+        call_command('reconcile_capacity', day, day, '--dry-run', stdout=out)
+        self.assertIn('Found 1 drifted timeslots', out.getvalue())
+        self.assertEqual(self._counters(), (5, 3, 5))
+
+        call_command('reconcile_capacity', day, day, stdout=StringIO())
+        self.assertEqual(self._counters(), (5, 1, 4))
+        self.assertFalse(find_capacity_drift(self.timeslot.date, self.timeslot.date).exists())
+
+
+class HoldTests(TestCase):
+
+    def setUp(self):
+        # Create a test user and log in
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        # Create two test timeslots
+        self.timeslot = TimeSlot.objects.create(
+            date=(datetime.today() + timedelta(days=1)).date(),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=100
+        )
+        self.other = TimeSlot.objects.create(
+            date=self.timeslot.date,
+            start_time=(datetime.now() + timedelta(hours=3)).time(),
+            end_time=(datetime.now() + timedelta(hours=4)).time(),
+            capacity=100
+        )
+
+    def _counters(self, timeslot):
+        timeslot = TimeSlot.objects.with_remaining().with_booked().get(id=timeslot.id)
+        return timeslot.booked, timeslot.remaining
+
+    def _hold(self, users, timeslot, ttl):
+        for user in users:
+            self.assertEqual(hold_timeslot(user, timeslot, ttl=ttl)[0], CREATED)
+
+    def test_hold_and_confirm(self):
+        """
+        Test that a hold takes a seat and is confirmed into a reservation.
+        """
+        response = self.client.post(reverse('hold', args=[self.timeslot.id]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Reservation.objects.get().status, Reservation.HELD)
+        self.assertEqual(self._counters(self.timeslot), (1, 99))
+
+        response = self.client.post(reverse('confirm_hold', args=[self.timeslot.id]))
+        self.assertEqual(response.json(), {'confirmed': True})
+        reservation = Reservation.objects.get()
+        self.assertEqual(reservation.status, Reservation.CONFIRMED)
+        self.assertIsNone(reservation.expires_at)
+        self.assertEqual(self._counters(self.timeslot), (1, 99))
+
+    def test_confirm_expired_hold(self):
+        """
+        Test that an expired hold can no longer be confirmed.
+        """
+        self._hold([self.user], self.timeslot, ttl=-1)
+
+        response = self.client.post(reverse('confirm_hold', args=[self.timeslot.id]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_hold_fully_booked(self):
+        """
+        Test that a fully booked timeslot cannot be held.
+        """
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=0)
+
+        response = self.client.post(reverse('hold', args=[self.timeslot.id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'outcome': FULL})
+
+    def test_release_hold(self):
+        """
+        Test that releasing a hold gives the seat back, and that confirmed
+        reservations are not released.
+        """
+        self._hold([self.user], self.timeslot, ttl=300)
+        reserve_timeslot(self.user, self.other)
+
+        for timeslot, released in ((self.timeslot, True), (self.other, False)):
+            response = self.client.post(reverse('release_hold', args=[timeslot.id]))
+            self.assertEqual(response.json(), {'released': released})
+        self.assertEqual(self._counters(self.timeslot), (0, 100))
+        self.assertEqual(self._counters(self.other), (1, 99))
+
+    def test_release_expired_holds_in_bulk(self):
+        """
+        Test that the sweeper releases only expired holds, with a number of
+        queries that does not depend on the number of holds.
+        """
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(username=f'user{i}') for i in range(60))
+        self._hold(users[:30], self.timeslot, ttl=-1)
+        self._hold(users[30:50], self.other, ttl=-1)
+        self._hold(users[50:], self.other, ttl=300)
+        reserve_timeslot(self.user, self.timeslot)
+
+        # Savepoint, batch, timeslots, seats, delete and release
+        with self.assertNumQueries(6):
+            self.assertEqual(release_expired_holds(), 50)
+
+        self.assertEqual(self._counters(self.timeslot), (1, 99))
+        self.assertEqual(self._counters(self.other), (10, 90))
+        self.assertEqual(Reservation.objects.filter(status=Reservation.HELD).count(), 10)
+
+    def test_release_expired_holds_command_sharded(self):
+        """
+        Test that the sweeper command rebuilds the counters of sharded
+        timeslots it released holds from.
+        """
+        self.timeslot.shard_count = 3
+        self.timeslot.set_total_capacity(10)
+        self._hold([self.user], self.timeslot, ttl=-1)
+        self.assertEqual(self._counters(self.timeslot), (1, 9))
+
+        out = StringIO()
+        call_command('release_expired_holds', stdout=out)
+
+        self.assertIn('Released 1 expired holds', out.getvalue())
+        self.assertEqual(self._counters(self.timeslot), (0, 10))
+
+
+@override_settings(
+    RESERVATION_THROTTLE_CACHE='default', RESERVATION_THROTTLE_WINDOW=60,
+    RESERVATION_USER_RATE_LIMIT=3, RESERVATION_USER_CONCURRENCY=1,
+    RESERVATION_TIMESLOT_RATE_LIMIT=100, RESERVATION_TIMESLOT_CONCURRENCY=1)
+class ThrottleMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # Create a test user and log in
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=5
+        )
+
+    def test_user_rate_limit(self):
+        """
+        Test that requests over the user's rate are shed with a 429 and do
+        not reach the database, and that they are counted.
+        """
+        url = reverse('reserve', args=[self.timeslot.id])
+        for _ in range(3):
+            self.assertEqual(self.client.post(url).status_code, 302)
+
+        with self.assertNumQueries(2):
+            # Only the session and the user are loaded
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['reason'], USER_RATE)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(get_shed_stats()[USER_RATE], 1)
+        self.assertEqual(get_shed_stats()['admitted'], 3)
+
+    def test_timeslot_concurrency_limit(self):
+        """
+        Test that a request is shed while the timeslot has as many requests
+        in flight as allowed, and admitted once they are done.
+        """
+        url = reverse('reserve', args=[self.timeslot.id])
+        slot = acquire(cache, f'timeslot:{self.timeslot.id}', 1)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['reason'], TIMESLOT_CONCURRENCY)
+
+        release(cache, slot)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(self.client.post(url).status_code, 302)
+
+    def test_concurrency_counter_lives_while_in_use(self):
+        """
+        Test that taking a slot restarts the timeout of the concurrency
+        counter, so it does not expire under requests in flight.
+        """
+        scope = f'timeslot:{self.timeslot.id}'
+        with patch('reservation.throttling.CONCURRENCY_TIMEOUT', 1):
+            first = acquire(cache, scope, 2)
+            time.sleep(0.6)
+            self.assertIsNotNone(acquire(cache, scope, 2))
+            time.sleep(0.6)
+            # Both slots are still taken after the first timeout passed
+            self.assertIsNone(acquire(cache, scope, 2))
+        release(cache, first)
+
+    def test_reserve_only_on_post(self):
+        """
+        Test that a GET to the reserve URLs is refused before any seat is
+        taken, so it cannot get around the throttling of POST requests.
+        """
+        for name in ('reserve', 'reserve_async'):
+            response = self.client.get(reverse(name, args=[self.timeslot.id]))
+            self.assertEqual(response.status_code, 405)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(TimeSlot.objects.get(id=self.timeslot.id).capacity, 5)
+
+    def test_other_views_are_not_throttled(self):
+        """
+        Test that pages which do not take seats are never shed.
+        """
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(get_shed_stats()['admitted'], 0)
+
+    def test_sliding_window(self):
+        """
+        Test that the previous window counts in proportion to its overlap
+        with the sliding window.
+        """
+        for _ in range(10):
+            self.assertTrue(within_rate(cache, 'user:1', 10, 60, now=5990.0))
+
+        # Right after the window boundary almost all of them still count
+        self.assertFalse(within_rate(cache, 'user:1', 10, 60, now=6001.0))
+        self.assertTrue(within_rate(cache, 'user:1', 10, 60, now=6059.0))
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        # Create a test user and log in
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.client.login(username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot with a single seat
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=1
+        )
+        self.url = reverse('reserve', args=[self.timeslot.id])
+
+    def _last_message(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)][-1]
+
+    def test_retry_replays_outcome(self):
+        """
+        Test that a retried request gets the outcome of the first one without
+        reading the timeslot or taking another seat.
+        """
+        first = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertIn('Reservation created successfully', self._last_message(first))
+
+        # Only the session, the user and the stored key are read
+        with self.assertNumQueries(3):
+            retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertRedirects(retry, reverse('home'))
+        self.assertIn('Reservation created successfully', self._last_message(retry))
+
+        self.timeslot.refresh_from_db()
+        self.assertEqual(self.timeslot.capacity, 0)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        # Without the key the same request is a duplicate
+        response = self.client.post(self.url)
+        self.assertIn('Reservation already exists', self._last_message(response))
+
+    def test_form_field_key(self):
+        """
+        Test that the key can be sent as a form field, and that different
+        keys are different requests.
+        """
+        self.client.post(self.url, {'idempotency_key': 'abc'})
+        response = self.client.post(self.url, {'idempotency_key': 'abc'})
+        self.assertIn('Reservation created successfully', self._last_message(response))
+
+        response = self.client.post(self.url, {'idempotency_key': 'def'})
+        self.assertIn('Reservation already exists', self._last_message(response))
+        self.assertEqual(IdempotencyKey.objects.filter(user=self.user).count(), 2)
+
+    def test_batch_replay(self):
+        """
+        Test that a retried batch request gets the first response.
+        """
+        url = reverse('reserve_batch')
+        data = {'timeslot_ids': [self.timeslot.id]}
+        first = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='batch')
+        retry = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertTrue(first.json()['reserved'])
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_expired_key(self):
+        """
+        Test that an expired key no longer replays and is reused, and that
+        the purge command only deletes expired keys.
+        """
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertIn('Reservation already exists', self._last_message(response))
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertGreater(IdempotencyKey.objects.get().expires_at, timezone.now())
+
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='def')
+        IdempotencyKey.objects.filter(key='def').update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_keys', batch_size=1, stdout=out)
+        self.assertIn('Purged 1 expired', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['abc'])
+
+
+@override_settings(RESERVATION_METRICS_CACHE='default', RESERVATION_METRICS_FLUSH_INTERVAL=0,
+                   RESERVATION_METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # Create a test user and a staff user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.staff = get_user_model().objects.create_user(
+            username='staffuser', password='Testpassword123!', is_staff=True)
+
+        # Create a test timeslot with a single seat
+        self.timeslot = TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=1
+        )
+
+    def _metrics(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def test_request_and_outcome_metrics(self):
+        """
+        Test that latency, SQL queries and reservation outcomes are recorded
+        per view.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+        self.client.get(reverse('home'))
+
+        metrics = self._metrics()
+        self.assertEqual(metrics['reservation_outcomes_total{outcome="created"}'], '1')
+        self.assertEqual(metrics['reservation_outcomes_total{outcome="duplicate"}'], '1')
+        self.assertEqual(
+            metrics['reservation_request_duration_seconds_count{view="reserve"}'], '2')
+        self.assertEqual(
+            metrics['reservation_request_duration_seconds_bucket{view="reserve",le="+Inf"}'], '2')
+        self.assertEqual(metrics['reservation_responses_total{view="reserve",status="3xx"}'], '2')
+        self.assertEqual(metrics['reservation_responses_total{view="home",status="2xx"}'], '1')
+        self.assertGreater(int(metrics['reservation_db_queries_total{view="reserve"}']), 2)
+        self.assertGreater(
+            float(metrics['reservation_db_query_seconds_total{view="reserve",statement="write"}']), 0)
+
+    def test_counts_add_up_in_the_cache(self):
+        """
+        Test that the counts of every process add up, by flushing on top of
+        counts another process already flushed.
+        """
+        cache.set('reservation:metrics:reservation_outcomes_total{outcome="full"}', 5, None)
+        cache.set('reservation:metrics:series', {'reservation_outcomes_total{outcome="full"}'}, None)
+
+        self.client.login(username='testuser', password='Testpassword123!')
+        self.timeslot.set_total_capacity(0)
+        self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        self.assertEqual(self._metrics()['reservation_outcomes_total{outcome="full"}'], '6')
+
+    @override_settings(RESERVATION_THROTTLE_CACHE='default', RESERVATION_USER_RATE_LIMIT=1)
+    def test_throttle_metrics(self):
+        """
+        Test that the admitted and shed requests of the throttle are served
+        with the other metrics, while throttle_stats refuses to read the
+        counters of a local memory cache it does not share with the workers.
+        """
+        self.client.login(username='testuser', password='Testpassword123!')
+        for _ in range(2):
+            self.client.post(reverse('reserve', args=[self.timeslot.id]))
+
+        metrics = self._metrics()
+        self.assertEqual(metrics['reservation_throttle_admitted_total'], '1')
+        self.assertEqual(metrics['reservation_throttle_shed_total{reason="user_rate"}'], '1')
+        with self.assertRaisesMessage(CommandError, 'metrics endpoint'):
+            call_command('throttle_stats', stdout=StringIO())
+
+    def test_metrics_access(self):
+        """
+        Test that only staff users and scrapers with the token can read the
+        metrics, and that they are not served while disabled.
+        """
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        self.client.login(username='testuser', password='Testpassword123!')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.login(username='staffuser', password='Testpassword123!')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE reservation_request_duration_seconds histogram', response.content)
+
+        with self.settings(RESERVATION_METRICS_CACHE=''):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        today = datetime.today().date()
+
+        # Three timeslots past the cutoff, one recent and one upcoming, each
+        # with one seat booked
+        self.timeslots = [
+            TimeSlot.objects.create(
+                date=today + timedelta(days=offset), start_time='09:00', end_time='10:00',
+                capacity=1, total_capacity=2, booked_count=1)
+            for offset in (-40, -35, -31, -5, 1)
+        ]
+        for timeslot in self.timeslots:
+            Reservation.objects.create(user=self.user, timeslot=timeslot)
+        Waitlist.objects.create(user=self.user, timeslot=self.timeslots[0])
+
+    def test_archive_command_moves_old_timeslots(self):
+        """
+        Test that timeslots older than the cutoff move to the archive with
+        their reservations in batches, and that newer ones stay.
+        """
+        out = StringIO()
+        call_command('archive_timeslots', days=30, batch_size=2, stdout=out)
+
+        self.assertIn('Archived 3 timeslots and 3 reservations in 2 batches', out.getvalue())
+        self.assertEqual(list(TimeSlot.objects.order_by('date')), self.timeslots[3:])
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertFalse(Waitlist.objects.exists())
+
+        archived = ArchivedTimeSlot.objects.order_by('date')
+        self.assertEqual([timeslot.id for timeslot in archived],
+                         [timeslot.id for timeslot in self.timeslots[:3]])
+        self.assertEqual((archived[0].total_capacity, archived[0].booked, archived[0].remaining),
+                         (2, 1, 1))
+        self.assertEqual(archived[0].reservations.get().user, self.user)
+
+    def test_interrupted_archive_resumes(self):
+        """
+        Test that a failed batch is rolled back completely, and that the
+        next run archives what is left.
+        """
+        call_command('archive_timeslots', batch_size=1, max_batches=1, stdout=StringIO())
+        self.assertEqual(ArchivedTimeSlot.objects.count(), 1)
+
+        with patch.object(ArchivedReservation.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                call_command('archive_timeslots', batch_size=1, stdout=StringIO())
+        self.assertEqual(ArchivedTimeSlot.objects.count(), 1)
+        self.assertEqual(TimeSlot.objects.count(), 4)
+
+        out = StringIO()
+        call_command('archive_timeslots', batch_size=1, stdout=out)
+        self.assertIn('Archived 2 timeslots and 2 reservations', out.getvalue())
+        self.assertEqual(ArchivedReservation.objects.count(), 3)
+
+    def test_archive_admin_is_read_only(self):
+        """
+        Test that staff can browse archived timeslots and reservations but
+        not add, change or delete them.
+        """
+        call_command('archive_timeslots', stdout=StringIO())
+        self.client.force_login(get_user_model().objects.create_superuser(
+            username='admin', password='Testpassword123!'))
+        archived = ArchivedTimeSlot.objects.first()
+
+        response = self.client.get(reverse('admin:reservation_archivedtimeslot_changelist'))
+        self.assertContains(response, '3 archived time slots')
+        response = self.client.get(
+            reverse('admin:reservation_archivedtimeslot_change', args=[archived.id]))
+        self.assertContains(response, 'testuser')
+        self.assertNotContains(response, 'name="_save"')
+        response = self.client.get(reverse('admin:reservation_archivedreservation_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(
+            reverse('admin:reservation_archivedtimeslot_add')).status_code, 403)
+        self.assertEqual(self.client.post(
+            reverse('admin:reservation_archivedtimeslot_delete', args=[archived.id]),
+            {'post': 'yes'}).status_code, 403)
+        self.assertTrue(ArchivedTimeSlot.objects.filter(id=archived.id).exists())
+
+
+# Streams only read the primary, which is the only database of these tests
+@override_settings(REPLICA_DATABASES=[])
+class CapacityEventTests(TransactionTestCase):
+
+    def setUp(self):
+        # Create a test user
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+
+        # Create a test timeslot
+        self.timeslot = TimeSlot.objects.create(
+            date=(datetime.today() + timedelta(days=1)).date(),
+            start_time=(datetime.now() + timedelta(hours=2)).time(),
+            end_time=(datetime.now() + timedelta(hours=3)).time(),
+            capacity=5
+        )
+        self.url = reverse('capacity_events', args=[self.timeslot.date.isoformat()])
+
+    async def test_reservation_is_streamed_to_subscribers(self):
+        """
+        Test that a reservation reaches every subscriber of the date with the
+        new capacity.
+        """
+        streams = []
+        for _ in range(3):
+            response = await self.async_client.get(self.url)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            streams.append(response.streaming_content)
+        for stream in streams:
+            self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        self.assertEqual(broadcaster.subscriber_count(self.timeslot.date), 3)
+
+        await sync_to_async(reserve_timeslot)(self.user, self.timeslot)
+
+        for stream in streams:
+            event = await asyncio.wait_for(anext(stream), 5)
+            self.assertTrue(event.startswith(b'event: capacity\n'))
+            self.assertEqual(json.loads(event.split(b'data: ')[1]), {
+                'date': self.timeslot.date.isoformat(),
+                'timeslots': [{'id': self.timeslot.id, 'capacity': 4}],
+            })
+
+    async def test_poll_without_changes(self):
+        """
+        Test that a long-poll without changes on its date answers 204, and
+        that changes on other dates do not wake it up.
+        """
+        other = await TimeSlot.objects.acreate(
+            date=self.timeslot.date + timedelta(days=1), start_time=self.timeslot.start_time,
+            end_time=self.timeslot.end_time, capacity=5)
+
+        with patch('reservation.views.EVENTS_POLL_TIMEOUT', 0.5):
+            poll = asyncio.ensure_future(self.async_client.get(
+                reverse('capacity_poll', args=[self.timeslot.date.isoformat()])))
+            await asyncio.sleep(0.1)
+            await sync_to_async(reserve_timeslot)(self.user, other)
+            response = await poll
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_deleted_timeslots_are_reported_full(self):
+        """
+        Test that a deleted timeslot is reported with no seats on its date.
+        """
+        timeslot_id = self.timeslot.id
+        self.timeslot.delete()
+
+        self.assertEqual(
+            [json.loads(message) for message in capacity_messages([timeslot_id], [self.timeslot.date])],
+            [{'date': self.timeslot.date.isoformat(),
+              'timeslots': [{'id': timeslot_id, 'capacity': 0}]}])
+
+    def test_invalid_date(self):
+        """
+        Test that a malformed date returns a 404.
+        """
+        response = self.client.get(reverse('capacity_events', args=['tomorrow']))
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReserveTests(TransactionTestCase):
+
+    workers = 16
+
+    def setUp(self):
+        # Create the users competing for one hot timeslot
+        self.users = get_user_model().objects.bulk_create(
+            get_user_model()(username=f'user{i}') for i in range(200))
+
+    def _create_timeslot(self, capacity):
+        return TimeSlot.objects.create(
+            date=datetime.today() + timedelta(days=1),
+            start_time=datetime.now().time(),
+            end_time=(datetime.now() + timedelta(hours=1)).time(),
+            capacity=capacity
+        )
+
+    def _run_concurrently(self, attempt, items):
+        """
+        Run ``attempt`` on each item from the worker threads, each on its own
+        connection, and return the results.
+        """
+        return run_in_threads(attempt, items, self.workers)[0]
+
+    def test_hot_timeslot_is_not_oversold(self):
+        """
+        Test that concurrent attempts never oversell a timeslot or create
+        duplicate reservations, even when every user tries twice.
+        """
+        timeslot = self._create_timeslot(capacity=50)
+        users = self.users[:100] * 2
+
+        outcomes = self._run_concurrently(lambda user: reserve_timeslot(user, timeslot), users)
+
+        timeslot.refresh_from_db()
+        self.assertEqual(timeslot.capacity, 0)
+        self.assertEqual(outcomes.count(CREATED), 50)
+        self.assertEqual(
+            Reservation.objects.filter(timeslot=timeslot).count(), 50)
+        self.assertEqual(
+            Reservation.objects.filter(timeslot=timeslot)
+            .values('user').distinct().count(), 50)
+        self.assertEqual(
+            outcomes.count(FULL) + outcomes.count(DUPLICATE), 150)
+
+    def test_overlapping_batches_do_not_deadlock(self):
+        """
+        Test that concurrent batches over the same timeslots, given in
+        opposite orders, complete without deadlocks or overselling.
+        """
+        first = self._create_timeslot(capacity=60)
+        second = self._create_timeslot(capacity=60)
+
+        def attempt(index_user):
+            index, user = index_user
+            batch = [first, second] if index % 2 else [second, first]
+            return reserve_timeslots(user, batch)
+
+        results = self._run_concurrently(attempt, list(enumerate(self.users[:100])))
+
+        booked = sum(all(outcome == CREATED for outcome in result.values())
+                     for result in results)
+        self.assertEqual(booked, 60)
+        for timeslot in (first, second):
+            timeslot.refresh_from_db()
+            self.assertEqual(timeslot.capacity, 0)
+            self.assertEqual(Reservation.objects.filter(timeslot=timeslot).count(), 60)
+
+    def test_promotion_and_reservations_do_not_deadlock(self):
+        """
+        Test that waiters reserving a timeslot while it is being promoted
+        into complete without deadlocks or overselling.
+        """
+        timeslot = self._create_timeslot(capacity=0)
+        waiters = self.users[:60]
+        Waitlist.objects.bulk_create(Waitlist(user=user, timeslot=timeslot) for user in waiters)
+        timeslot.set_total_capacity(30)
+
+        def attempt(index_user):
+            index, user = index_user
+            if index % 3 == 0:
+                return promote_waitlist(timeslot)
+            return reserve_timeslot(user, timeslot)
+
+        self._run_concurrently(attempt, list(enumerate(waiters)))
+
+        timeslot = TimeSlot.objects.with_booked().get(id=timeslot.id)
+        reserved = Reservation.objects.filter(timeslot=timeslot).count()
+        self.assertEqual(reserved, 30)
+        self.assertEqual(timeslot.booked, 30)
+        self.assertEqual(timeslot.capacity, 0)
+
+    def test_benchmark_reserve_command(self):
+        """
+        Test that the benchmark reports the rate of both reserve paths and
+        removes its users and timeslots.
+        """
+        out = StringIO()
+        call_command('benchmark_reserve', users=40, workers=4, runs=1, stdout=out)
+
+        self.assertIn('row lock', out.getvalue())
+        self.assertIn('conditional update', out.getvalue())
+        self.assertFalse(get_user_model().objects.filter(
+            username__startswith='benchmark-reserve-').exists())
+        self.assertEqual(TimeSlot.objects.count(), 0)
+
+    def test_loadtest_command(self):
+        """
+        Test that the load test command runs every scenario and reports
+        consistent bookings as JSON.
+        """
+        out = StringIO()
+        call_command('loadtest_reservations', users=60, timeslots=30, capacity=3,
+                     workers=self.workers, json='-', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual([result['scenario'] for result in report['scenarios']],
+                         ['hot', 'uniform', 'mixed'])
+        for result in report['scenarios']:
+            self.assertTrue(result['consistent'], result['violations'])
+            self.assertEqual(sum(result['outcomes'].values()), 120)
+            self.assertEqual(set(result['latency_ms']['reserve']), {'p50', 'p95', 'p99', 'max'})
+        self.assertEqual(report['scenarios'][0]['outcomes'][CREATED], 3)
+        self.assertIn('read', report['scenarios'][2]['latency_ms'])
+
+        # The seeded users and timeslots are removed
+        self.assertFalse(get_user_model().objects.filter(
+            username__startswith='loadtest-reservations-').exists())
+        self.assertEqual(TimeSlot.objects.count(), 0)
+
+    def test_loadtest_command_detects_overselling(self):
+        """
+        Test that the load test command fails when bookings do not take
+        seats.
+        """
+        def reserve_without_seat(user, timeslot):
+            Reservation.objects.get_or_create(user=user, timeslot=timeslot)
+            return CREATED
+
+        with patch('reservation.management.commands.loadtest_reservations.reserve_timeslot',
+                   reserve_without_seat):
+            with self.assertRaisesMessage(CommandError, 'Inconsistent bookings in scenarios: hot'):
+                call_command('loadtest_reservations', scenario=['hot'], users=10,
+                             capacity=2, workers=self.workers, stdout=StringIO())
+
+
+@override_settings(REPLICA_DATABASES=[])
+class ConnectionProfileTests(TransactionTestCase):
+
+    def test_benchmark_connections_command(self):
+        """
+        Test that the benchmark opens a connection per request only when
+        connections are not persistent, and restores the connection
+        settings afterwards.
+        """
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        out = StringIO()
+        call_command('benchmark_connections', requests=5, stdout=out)
+
+        rows = {line.split()[0]: line.split()[1:] for line in out.getvalue().splitlines()[1:4]}
+        self.assertEqual(list(rows), ['per-request', 'persistent', 'health-checked'])
+        # In-memory SQLite databases are never closed, so never reopened
+        if not (connection.vendor == 'sqlite' and connection.is_in_memory_db()):
+            self.assertEqual(rows['per-request'][1], '5')
+            self.assertEqual(rows['persistent'][1], '1')
+            self.assertEqual(rows['health-checked'][1], '1')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], conn_max_age)
+        self.assertFalse(TimeSlot.objects.exists())
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def _route(self, request, write=False):
+        """
+        Pass a request through the middleware and return where a read made
+        by its view went, together with the response.
+        """
+        routed = []
+
+        def view(request):
+            if write:
+                router.db_for_write(TimeSlot)
+            routed.append(router.db_for_read(TimeSlot))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return routed[0], response
+
+    def test_safe_request_reads_replica(self):
+        """
+        Test that the reads of a GET request go to the replica, and that
+        reads outside of requests go to the primary.
+        """
+        db, response = self._route(RequestFactory().get('/'))
+        self.assertEqual(db, 'replica1')
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(TimeSlot), 'default')
+
+    def test_unsafe_request_reads_primary(self):
+        """
+        Test that the reads of a POST request go to the primary.
+        """
+        db, _ = self._route(RequestFactory().post('/'))
+        self.assertEqual(db, 'default')
+
+    def test_reads_after_write_stick_to_primary(self):
+        """
+        Test that a request that wrote reads the primary and pins the reads
+        of the following requests of its client with a cookie.
+        """
+        db, response = self._route(RequestFactory().post('/'), write=True)
+        self.assertEqual(db, 'default')
+        cookie = response.cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.RESERVATION_REPLICA_STICKY_SECONDS)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PRIMARY_COOKIE] = cookie.value
+        db, _ = self._route(request)
+        self.assertEqual(db, 'default')
+
+    def test_transactions_read_primary(self):
+        """
+        Test that reads inside a transaction on the primary go to the
+        primary, so rows are locked and updated from current data.
+        """
+        def view(request):
+            with patch.object(connection, 'in_atomic_block', True):
+                db = router.db_for_read(TimeSlot)
+            return HttpResponse(db)
+
+        response = ReplicaRoutingMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'default')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        """
+        Test that without replicas every read goes to the primary.
+        """
+        db, _ = self._route(RequestFactory().get('/'))
+        self.assertEqual(db, 'default')
+
+
+@skipUnless(settings.REPLICA_DATABASES, 'No replica database configured.')
+class ReplicaLagTests(TransactionTestCase):
+
+    databases = {'default', *settings.REPLICA_DATABASES[:1]}
+
+    def setUp(self):
+        self.replica = settings.REPLICA_DATABASES[0]
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='Testpassword123!')
+        self.timeslot = TimeSlot.objects.create(
+            date=(datetime.today() + timedelta(days=1)).date(),
+            start_time=datetime.now().time(),
+            end_time=(datetime.now() + timedelta(hours=1)).time(),
+            capacity=5
+        )
+        self.client.force_login(self.user)
+        self.url = f'{reverse("home")}?date={self.timeslot.date.isoformat()}'
+        self._replicate()
+
+    def _replicate(self):
+        """
+        Copy the rows the replica has not received yet, as replication
+        catching up. Until then the replica lags behind the primary.
+        """
+        for model in (get_user_model(), Session, TimeSlot, Reservation):
+            copied = model.objects.using(self.replica).values_list('pk', flat=True)
+            model.objects.using(self.replica).bulk_create(
+                model.objects.exclude(pk__in=list(copied)))
+
+    def test_reservation_is_read_back_from_primary(self):
+        """
+        Test that a user sees their reservation right after making it while
+        the replica lags, and that other reads are served by the replica.
+        """
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Reserved by you')
+
+        response = self.client.post(reverse('reserve', args=[self.timeslot.id]))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertFalse(Reservation.objects.using(self.replica).exists())
+
+        # Within the sticky window the user reads the primary
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Reserved by you', count=1)
+
+        # Once the cookie expired the lagging replica is read again
+        del self.client.cookies[PRIMARY_COOKIE]
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Reserved by you')
+
+        self._replicate()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Reserved by you', count=1)
+
+    @override_settings(RESERVATION_AVAILABILITY_CACHE='default')
+    def test_cached_availability_is_refilled_from_primary(self):
+        """
+        Test that a GET refilling the availability cache reads the primary,
+        so seats taken meanwhile are not cached from the lagging replica.
+        """
+        cache.clear()
+        TimeSlot.objects.filter(id=self.timeslot.id).update(capacity=2)
+
+        response = self.client.get(self.url)
+        self.assertEqual([timeslot.remaining for timeslot in response.context['timeslots']], [2])
+        self.assertEqual(TimeSlot.objects.using(self.replica).get(id=self.timeslot.id).capacity, 5)
+
+        # Later readers are served the primary's seats from the cache
+        self.assertEqual(
+            [timeslot.remaining for timeslot in get_available_timeslots(self.timeslot.date)], [2])
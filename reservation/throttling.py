@@ -0,0 +1,125 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+KEY_PREFIX = 'reservation:throttle'
+
+# Reasons a request can be shed for, as reported by get_shed_stats()
+USER_RATE = 'user_rate'
+TIMESLOT_RATE = 'timeslot_rate'
+USER_CONCURRENCY = 'user_concurrency'
+TIMESLOT_CONCURRENCY = 'timeslot_concurrency'
+SHED_REASONS = (USER_RATE, TIMESLOT_RATE, USER_CONCURRENCY, TIMESLOT_CONCURRENCY)
+
+# Concurrency counters expire so a worker that died mid-request cannot
+# block a user or timeslot for good. Every acquire() restarts the timeout,
+# so a counter only expires once no request took a slot for this long.
+CONCURRENCY_TIMEOUT = 60
+
+
+def get_throttle_cache():
+    """
+    Return the cache configured by RESERVATION_THROTTLE_CACHE, or None if
+    throttling is disabled.
+    """
+    alias = getattr(settings, 'RESERVATION_THROTTLE_CACHE', '')
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _incr(cache, key, timeout):
+    """
+    Increment a counter, creating it on first use.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout)
+        return cache.incr(key)
+
+
+def within_rate(cache, scope, limit, window, now=None):
+    """
+    Count a request against a sliding window limit.
+
+    The window is approximated from two fixed windows: the count of the
+    previous one is weighted by how much of it still overlaps the sliding
+    window. Rejected requests count too, so clients that keep hammering
+    stay limited.
+
+    Args:
+        cache: The cache holding the counters.
+        scope: Key of the limited user or timeslot.
+        limit: Number of requests allowed per window.
+        window: Length of the window in seconds.
+        now: The current UNIX time, defaults to time.time().
+
+    Returns:
+        True if the request is within the limit.
+    """
+    now = now or time.time()
+    index, offset = divmod(now, window)
+    key = f'{KEY_PREFIX}:rate:{scope}'
+    current = _incr(cache, f'{key}:{int(index)}', window * 2)
+    previous = cache.get(f'{key}:{int(index) - 1}', 0)
+    return previous * (1 - offset / window) + current <= limit
+
+
+def acquire(cache, scope, limit):
+    """
+    Take one of ``limit`` concurrent request slots.
+
+    Returns:
+        The counter key to pass to release(), or None if every slot is
+        taken.
+    """
+    key = f'{KEY_PREFIX}:concurrency:{scope}'
+    taken = _incr(cache, key, CONCURRENCY_TIMEOUT)
+    # Incrementing keeps the timeout set when the counter was created, a
+    # busy counter would expire under the requests still holding slots
+    cache.touch(key, CONCURRENCY_TIMEOUT)
+    if taken > limit:
+        release(cache, key)
+        return None
+    return key
+
+
+def release(cache, key):
+    """
+    Give back a concurrent request slot taken by acquire().
+    """
+    try:
+        cache.decr(key)
+    except ValueError:
+        # The counter expired in the meantime
+        pass
+
+
+def count_shed(cache, reason):
+    _incr(cache, f'{KEY_PREFIX}:shed:{reason}', None)
+
+
+def count_admitted(cache):
+    _incr(cache, f'{KEY_PREFIX}:admitted', None)
+
+
+def get_shed_stats():
+    """
+    Return the number of admitted requests and of requests shed per reason.
+    """
+    cache = get_throttle_cache()
+    keys = [f'{KEY_PREFIX}:admitted'] + [f'{KEY_PREFIX}:shed:{reason}' for reason in SHED_REASONS]
+    values = cache.get_many(keys) if cache is not None else {}
+    stats = {'admitted': values.get(keys[0], 0)}
+    stats.update({reason: values.get(key, 0) for reason, key in zip(SHED_REASONS, keys[1:])})
+    return stats
+
+
+def reset_shed_stats():
+    cache = get_throttle_cache()
+    if cache is not None:
+        cache.delete_many([f'{KEY_PREFIX}:admitted'] + [
+            f'{KEY_PREFIX}:shed:{reason}' for reason in SHED_REASONS])
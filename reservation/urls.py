@@ -1,8 +1,25 @@
 from django.urls import path
-from .views import home_view, reserve_view
+from .views import (
+    availability_view, cancel_view, capacity_events_view, capacity_poll_view, confirm_hold_view,
+    hold_view, home_async_view, home_view, join_waitlist_view, metrics_view, release_hold_view,
+    reserve_async_view, reserve_batch_view, reserve_view,
+)
 
 
 urlpatterns = [
     path('', home_view, name='home'),
     path('reserve/<int:timeslot_id>', reserve_view, name='reserve'),
+    path('reserve/batch', reserve_batch_view, name='reserve_batch'),
+    path('cancel/<int:timeslot_id>', cancel_view, name='cancel'),
+    path('holds/<int:timeslot_id>', hold_view, name='hold'),
+    path('holds/<int:timeslot_id>/confirm', confirm_hold_view, name='confirm_hold'),
+    path('holds/<int:timeslot_id>/release', release_hold_view, name='release_hold'),
+    path('waitlist/<int:timeslot_id>', join_waitlist_view, name='join_waitlist'),
+    path('api/availability', availability_view, name='availability'),
+    path('events/<str:day>', capacity_events_view, name='capacity_events'),
+    path('events/<str:day>/poll', capacity_poll_view, name='capacity_poll'),
+    path('metrics', metrics_view, name='metrics'),
+    # Async versions of the pages above for ASGI servers
+    path('async/', home_async_view, name='home_async'),
+    path('async/reserve/<int:timeslot_id>', reserve_async_view, name='reserve_async'),
 ]
@@ -1,11 +1,53 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.shortcuts import redirect, render
-from .models import TimeSlot, Reservation
-from datetime import datetime
-from django.db import transaction
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET, require_POST
+from .availability import get_availability_cache, get_available_timeslots, mark_reserved
+from .events import broadcaster, start_listener
+from .idempotency import get_idempotency_key, lookup, remember
+from .metrics import get_metrics_cache, render as render_metrics
+from .models import TimeSlot
+from .services import (
+    CREATED, DUPLICATE, FULL, WAITLISTED, cancel_reservation, confirm_hold, hold_timeslot,
+    join_waitlist, release_hold, reserve_timeslot, reserve_timeslots,
+)
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time
+from hashlib import sha1
+from operator import attrgetter
 from django.contrib.auth.decorators import login_required
 
 
+# Fields the home page can be sorted by
+SORT_FIELDS = ('start_time', 'end_time')
+
+# Maximum number of timeslots reserved in one batch
+BATCH_MAX_SIZE = 50
+
+# Default and maximum number of timeslots per availability API page
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Seconds between keep-alive comments on idle event streams, how long a
+# stream stays open before the browser has to reconnect, and how long a
+# long-poll request waits for a change before answering 204
+EVENTS_KEEPALIVE = 15
+EVENTS_MAX_AGE = 300
+EVENTS_POLL_TIMEOUT = 25
+
+
 def home_view(request):
     """
     View function for the home page. It retrieves and filters time slots based on the selected date and user's reservations.
@@ -21,47 +63,150 @@ def home_view(request):
     # Check if the user is authenticated
     if request.user.is_authenticated:
 
-        # Get the selected date from the request, default to today's date
-        selected_date = request.GET.get(
-            'date', datetime.today().strftime('%Y-%m-%d'))
-
-        # Get timeslots for the selected date
-        timeslots = TimeSlot.objects.filter(
-            date__gte=datetime.today().strftime('%Y-%m-%d'),
-            date=selected_date, capacity__gt=0)
-
-        # Exclude past timeslots if the selected date is today
-        if selected_date == datetime.today().strftime('%Y-%m-%d'):
-            timeslots = timeslots.exclude(
-                start_time__lt=datetime.now().time())
-
-        # Handle sorting by start time or end time
-        # Default to sorting by start_time
-        sort_by = request.GET.get('sort_by', 'start_time')
-        sort_order = request.GET.get('sort_order', 'asc')
-        # Determine the sorting order
-        if sort_order == 'desc':
-            sort_by = f'-{sort_by}'
-        timeslots = timeslots.order_by(sort_by)
-
-        # Get the user's reserved timeslots
-        user_timeslots = TimeSlot.objects.filter(
-            reservations__user=request.user)
+        # Get the selected date and sorting from the request
+        selected_date, day, sort_by, sort_order = _home_params(request)
+
+        # Get the bookable and the fully booked timeslots for the selected date
+        if day is None:
+            timeslots = full_timeslots = []
+        else:
+            if get_availability_cache() is not None:
+                timeslots = _cached_timeslots(day, request.user, sort_by, sort_order)
+            else:
+                timeslots = _timeslots_queryset(day, request.user, sort_by, sort_order)
+            full_timeslots = _full_timeslots_queryset(day, request.user, sort_by, sort_order)
 
         # Create the context dictionary to be passed to the template
         context = {
             'timeslots': timeslots,
-            'user_timeslots': user_timeslots,
+            'full_timeslots': full_timeslots,
             'selected_date': selected_date,
-            'sort_by': sort_by.lstrip('-'),
+            'sort_by': sort_by,
             'sort_order': sort_order,
+            # Long-polls hold a request open, which would tie up a thread of
+            # a WSGI worker, so only follow changes under ASGI
+            'live_updates': isinstance(request, ASGIRequest),
         }
 
     # Rnder the home.html template with the context
     return render(request, 'home.html', context)
 
 
+async def home_async_view(request):
+    """
+    Async version of home_view for ASGI servers. Timeslots are read with
+    the async ORM, so the worker serves other connections while waiting.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object.
+
+    Returns:
+    HttpResponse: The rendered home.html template.
+    """
+    context = {'reserve_url_name': 'reserve_async', 'stream_events': True, 'live_updates': True}
+
+    # Check if the user is authenticated
+    user = await _aget_user(request)
+    if user.is_authenticated:
+
+        # Get the selected date and sorting from the request
+        selected_date, day, sort_by, sort_order = _home_params(request)
+
+        # Get the bookable and the fully booked timeslots for the selected date
+        if day is None:
+            timeslots = full_timeslots = []
+        else:
+            if get_availability_cache() is not None:
+                timeslots = await sync_to_async(_cached_timeslots)(day, user, sort_by, sort_order)
+            else:
+                timeslots = [
+                    timeslot async for timeslot in
+                    _timeslots_queryset(day, user, sort_by, sort_order)
+                ]
+            full_timeslots = [
+                timeslot async for timeslot in
+                _full_timeslots_queryset(day, user, sort_by, sort_order)
+            ]
+
+        context.update({
+            'timeslots': timeslots,
+            'full_timeslots': full_timeslots,
+            'selected_date': selected_date,
+            'sort_by': sort_by,
+            'sort_order': sort_order,
+        })
+
+    # Rendering reads the flash messages from the session, which is sync
+    return await sync_to_async(render)(request, 'home.html', context)
+
+
+def _home_params(request):
+    """
+    Get the selected date and the sorting of the home page from the query
+    string.
+
+    Returns:
+        The selected date as given, the parsed date or None if it is
+        malformed, the sort field and the sort order.
+    """
+    # Default to today's date
+    selected_date = request.GET.get(
+        'date', datetime.today().strftime('%Y-%m-%d'))
+    try:
+        day = datetime.strptime(selected_date, '%Y-%m-%d').date()
+    except ValueError:
+        day = None
+
+    # Default to sorting by start_time
+    sort_by = request.GET.get('sort_by', 'start_time')
+    if sort_by not in SORT_FIELDS:
+        sort_by = 'start_time'
+    sort_order = request.GET.get('sort_order', 'asc')
+
+    return selected_date, day, sort_by, sort_order
+
+
+def _cached_timeslots(day, user, sort_by, sort_order):
+    """
+    Read the bookable timeslots of a day from the availability cache, then
+    sort them and flag the user's reservations with one query.
+    """
+    timeslots = get_available_timeslots(day)
+    timeslots.sort(key=attrgetter(sort_by), reverse=sort_order == 'desc')
+    mark_reserved(timeslots, user)
+    return timeslots
+
+
+def _timeslots_queryset(day, user, sort_by, sort_order):
+    """
+    Query the bookable timeslots of a day, past timeslots are excluded and
+    sharded timeslots sum their shards into ``remaining``. Sorting and the
+    user's reservations are handled in the same query.
+    """
+    order_by = f'-{sort_by}' if sort_order == 'desc' else sort_by
+    return TimeSlot.objects.available_on(day).order_by(order_by).with_reserved_by(user)
+
+
+def _full_timeslots_queryset(day, user, sort_by, sort_order):
+    """
+    Query the fully booked timeslots of a day that have not started yet.
+    They are listed after the bookable ones with their waitlist.
+    """
+    order_by = f'-{sort_by}' if sort_order == 'desc' else sort_by
+    return TimeSlot.objects.full_on(day).order_by(order_by).with_reserved_by(user)
+
+
+async def _aget_user(request):
+    """
+    Resolve the lazy request.user outside the event loop, loading it reads
+    the session and the user synchronously.
+    """
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
 @login_required
+@require_POST
 def reserve_view(request, timeslot_id):
     """
     View function for reserving a timeslot.
@@ -74,41 +219,484 @@ def reserve_view(request, timeslot_id):
         Redirects to the home page if reservation is successful or if the timeslot is already reserved.
         Otherwise, displays an error message.
     """
-    # Get the authenticated user
-    user = request.user
+    # Replay the outcome of a retried request without touching the timeslot
+    key = get_idempotency_key(request)
+    if key:
+        message = lookup(request.user, request.path, key)
+        if message is not None:
+            messages.add_message(request, *message)
+            return redirect('home')
 
-    # Use transaction.atomic to ensure atomicity of database operations
-    with transaction.atomic():
-        # Get the timeslot with the given ID
-        timeslot = TimeSlot.objects.select_for_update().get(id=timeslot_id)
+    # Get the timeslot with the given ID (no lock is taken here)
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
 
-        # Check if the timeslot is fully booked
-        if timeslot.capacity == 0:
-            # Display an error message if the timeslot is fully booked
-            messages.error(
-                request,
-                f'Timeslot is fully booked on {timeslot.date} at {timeslot.start_time}')
-            return redirect('home')
+    # Take a seat and insert the reservation in one short transaction
+    outcome = reserve_timeslot(request.user, timeslot)
+    message = _outcome_message(timeslot, outcome)
+    if key:
+        message = remember(request.user, request.path, key, message)
+    messages.add_message(request, *message)
 
-        # Get or create a reservation for the user and timeslot
-        reservation, created = Reservation.objects.select_for_update().get_or_create(
-            user=user, timeslot=timeslot)
+    return redirect('home')
 
-        # If reservation is created, update the timeslot capacity and save the reservation
-        if created:
-            timeslot.capacity -= 1
-            timeslot.save()
-            reservation.save()
 
-            # Display a success message
-            messages.success(
-                request,
-                f'Reservation created successfully for you on {timeslot.date} at {timeslot.start_time}')
-            return redirect('home')
+async def reserve_async_view(request, timeslot_id):
+    """
+    Async version of reserve_view for ASGI servers.
 
-        # If reservation already exists, display an error message
-        else:
-            messages.error(
-                request,
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the timeslot to reserve.
+
+    Returns:
+        Redirects to the async home page with a message about the outcome.
+    """
+    # Redirect anonymous users to the login page
+    user = await _aget_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    # Only POST takes a seat, as with require_POST on reserve_view, which
+    # does not wrap async views in this Django version
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    # Replay the outcome of a retried request without touching the timeslot
+    key = await sync_to_async(get_idempotency_key)(request)
+    if key:
+        message = await sync_to_async(lookup)(user, request.path, key)
+        if message is not None:
+            messages.add_message(request, *message)
+            return redirect('home_async')
+
+    # Get the timeslot with the given ID (no lock is taken here)
+    try:
+        timeslot = await TimeSlot.objects.aget(id=timeslot_id)
+    except TimeSlot.DoesNotExist:
+        raise Http404('No TimeSlot matches the given query.')
+
+    # The reservation transaction runs in a thread, atomic blocks are sync
+    outcome = await sync_to_async(reserve_timeslot)(user, timeslot)
+    message = _outcome_message(timeslot, outcome)
+    if key:
+        message = await sync_to_async(remember)(user, request.path, key, message)
+    messages.add_message(request, *message)
+
+    return redirect('home_async')
+
+
+def _add_outcome_message(request, timeslot, outcome):
+    """
+    Display a message about the outcome of a reservation attempt.
+    """
+    messages.add_message(request, *_outcome_message(timeslot, outcome))
+
+
+def _outcome_message(timeslot, outcome):
+    """
+    Return the level and the text of the message about the outcome of a
+    reservation attempt.
+    """
+    # An error message if the timeslot is fully booked
+    if outcome == FULL:
+        return messages.ERROR, f'Timeslot is fully booked on {timeslot.date} at {timeslot.start_time}'
+
+    # An error message if the reservation already exists
+    if outcome == DUPLICATE:
+        return (messages.ERROR,
                 f'Reservation already exists for you on {timeslot.date} at {timeslot.start_time}')
-            return redirect('home')
+
+    # An info message if the user was put on the waitlist
+    if outcome == WAITLISTED:
+        return (messages.INFO,
+                f'Timeslot is fully booked on {timeslot.date} at {timeslot.start_time}, '
+                f'you are on the waitlist and will get a seat when one frees up')
+
+    # Otherwise the reservation was created, a success message
+    return (messages.SUCCESS,
+            f'Reservation created successfully for you on {timeslot.date} at {timeslot.start_time}')
+
+
+@login_required
+@require_POST
+def cancel_view(request, timeslot_id):
+    """
+    View function for cancelling a reservation. The seat is given back in
+    the same transaction.
+
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the reserved timeslot.
+
+    Returns:
+        Redirects to the home page with a message about the outcome.
+    """
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
+
+    if cancel_reservation(request.user, timeslot):
+        messages.success(
+            request,
+            f'Reservation cancelled for you on {timeslot.date} at {timeslot.start_time}')
+    else:
+        messages.error(
+            request,
+            f'You have no reservation on {timeslot.date} at {timeslot.start_time}')
+
+    return redirect('home')
+
+
+@login_required
+@require_POST
+def hold_view(request, timeslot_id):
+    """
+    View function for holding a seat in a timeslot, e.g. during checkout.
+    The seat counts against the capacity until the hold is confirmed,
+    released or expires after RESERVATION_HOLD_TTL seconds.
+
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the timeslot to hold a seat in.
+
+    Returns:
+        JsonResponse: The outcome and the expiry time of the hold, with a
+            409 status if no seat could be held.
+    """
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
+
+    outcome, expires_at = hold_timeslot(request.user, timeslot)
+    if outcome != CREATED:
+        return JsonResponse({'outcome': outcome}, status=409)
+    return JsonResponse({'outcome': outcome, 'expires_at': expires_at}, status=201)
+
+
+@login_required
+@require_POST
+def confirm_hold_view(request, timeslot_id):
+    """
+    View function for confirming a hold into a reservation.
+
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the held timeslot.
+
+    Returns:
+        JsonResponse: Whether the hold was confirmed, with a 409 status if
+            there was no hold or it has expired.
+    """
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
+
+    if not confirm_hold(request.user, timeslot):
+        return JsonResponse({'error': 'No hold to confirm, it may have expired.'}, status=409)
+    return JsonResponse({'confirmed': True})
+
+
+@login_required
+@require_POST
+def release_hold_view(request, timeslot_id):
+    """
+    View function for releasing a hold before it expires.
+
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the held timeslot.
+
+    Returns:
+        JsonResponse: Whether a hold was released.
+    """
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
+
+    return JsonResponse({'released': release_hold(request.user, timeslot)})
+
+
+@login_required
+@require_POST
+def join_waitlist_view(request, timeslot_id):
+    """
+    View function for reserving a timeslot, or joining its waitlist if it is
+    fully booked. Waiters get a reservation as soon as a seat frees up.
+
+    Args:
+        request: HTTP request object.
+        timeslot_id: ID of the timeslot to reserve or wait for.
+
+    Returns:
+        Redirects to the home page with a message about the outcome.
+    """
+    timeslot = get_object_or_404(TimeSlot, id=timeslot_id)
+
+    outcome = join_waitlist(request.user, timeslot)
+    _add_outcome_message(request, timeslot, outcome)
+
+    return redirect('home')
+
+
+@login_required
+@require_POST
+def reserve_batch_view(request):
+    """
+    View function for reserving several timeslots in one transaction.
+
+    All timeslots are reserved or none are, unless ``best_effort`` is set,
+    in which case every timeslot that can be reserved is.
+
+    A request sent with an Idempotency-Key gets the response of the first
+    request with that key, without the timeslots being read again.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object, with the POST fields
+        ``timeslot_ids`` (repeated) and optionally ``best_effort``.
+
+    Returns:
+    JsonResponse: Whether every timeslot was reserved, and the outcome per
+        timeslot.
+    """
+    # Replay the response to a retried request
+    key = get_idempotency_key(request)
+    if key:
+        stored = lookup(request.user, request.path, key)
+        if stored is not None:
+            return JsonResponse(stored)
+
+    # Get the requested timeslot IDs
+    try:
+        timeslot_ids = {int(timeslot_id) for timeslot_id in request.POST.getlist('timeslot_ids')}
+    except ValueError:
+        return JsonResponse({'error': 'Timeslot IDs must be integers.'}, status=400)
+    if not 0 < len(timeslot_ids) <= BATCH_MAX_SIZE:
+        return JsonResponse(
+            {'error': f'Between 1 and {BATCH_MAX_SIZE} timeslots can be reserved at once.'},
+            status=400)
+
+    # Get the timeslots, no lock is taken here
+    timeslots = list(TimeSlot.objects.filter(id__in=timeslot_ids).only('id', 'date', 'shard_count'))
+    missing = timeslot_ids - {timeslot.id for timeslot in timeslots}
+    if missing:
+        return JsonResponse({'error': 'Unknown timeslots.', 'missing': sorted(missing)}, status=404)
+
+    # Reserve the timeslots in one transaction
+    best_effort = request.POST.get('best_effort', '').lower() in ('1', 'true', 'on')
+    results = reserve_timeslots(request.user, timeslots, all_or_nothing=not best_effort)
+
+    data = {
+        'reserved': all(outcome == CREATED for outcome in results.values()),
+        'results': [
+            {'timeslot_id': timeslot_id, 'outcome': outcome}
+            for timeslot_id, outcome in results.items()
+        ],
+    }
+    if key:
+        data = remember(request.user, request.path, key, data)
+    return JsonResponse(data)
+
+
+def _encode_cursor(day, start_time, timeslot_id):
+    """
+    Encode the position of a timeslot as an opaque pagination cursor.
+    """
+    position = f'{day.isoformat()},{start_time.isoformat()},{timeslot_id}'
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """
+    Decode a pagination cursor into (date, start_time, id).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        day, start_time, timeslot_id = urlsafe_b64decode(
+            cursor.encode()).decode().split(',')
+    except (TypeError, UnicodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    return date.fromisoformat(day), time.fromisoformat(start_time), int(timeslot_id)
+
+
+@require_GET
+def availability_view(request):
+    """
+    Read-only JSON API listing the bookable timeslots of a date or a date
+    range, with the same rules as the home page: past timeslots and
+    timeslots without seats left are left out.
+
+    Pages are ordered by (date, start_time, id) and continue from the
+    ``next_cursor`` of the previous page. Every response carries a strong
+    ETag of its rows, so a poll with a matching If-None-Match gets a 304
+    without the page being serialized.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object, with the query parameters
+        ``date`` or ``start`` and ``end`` (YYYY-MM-DD, defaults to today),
+        ``limit`` and ``cursor``.
+
+    Returns:
+    JsonResponse: The page of timeslots, or HttpResponseNotModified.
+    """
+    try:
+        # Get the date range, a single date is a range of one day
+        if 'start' in request.GET or 'end' in request.GET:
+            first_day = date.fromisoformat(request.GET['start'])
+            last_day = date.fromisoformat(request.GET['end'])
+        else:
+            first_day = last_day = date.fromisoformat(
+                request.GET.get('date', date.today().isoformat()))
+
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+        if not 0 < limit <= API_MAX_PAGE_SIZE:
+            raise ValueError('Invalid limit')
+
+        cursor = request.GET.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid date range, limit or cursor.'}, status=400)
+
+    timeslots = TimeSlot.objects.available_between(first_day, last_day)
+
+    # Continue after the last timeslot of the previous page
+    if after is not None:
+        day, start_time, timeslot_id = after
+        timeslots = timeslots.filter(date__gte=day).filter(
+            Q(date__gt=day)
+            | Q(date=day, start_time__gt=start_time)
+            | Q(date=day, start_time=start_time, id__gt=timeslot_id))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(timeslots.order_by('date', 'start_time', 'id').values_list(
+        'id', 'date', 'start_time', 'end_time', 'remaining')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        timeslot_id, day, start_time = rows[-1][:3]
+        next_cursor = _encode_cursor(day, start_time, timeslot_id)
+
+    # Answer unchanged polls before serializing anything
+    etag = f'"{sha1(repr((rows, next_cursor)).encode()).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({
+            'results': [
+                {
+                    'id': timeslot_id,
+                    'date': day,
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'capacity': remaining,
+                }
+                for timeslot_id, day, start_time, end_time, remaining in rows
+            ],
+            'next_cursor': next_cursor,
+        })
+    response['ETag'] = etag
+    return response
+
+
+def _events_day(day):
+    """
+    Parse the date of an event stream, raising Http404 if it is malformed.
+    """
+    try:
+        return date.fromisoformat(day)
+    except ValueError:
+        raise Http404('Invalid date.')
+
+
+async def capacity_events_view(request, day):
+    """
+    Server-Sent Events stream of the capacity changes of one date, for ASGI
+    servers. Each ``capacity`` event carries a JSON object with the date and
+    the new remaining seats of the changed timeslots.
+
+    Streams wait on an in-process queue fed by one notification per change,
+    they neither query the database nor load the session, so thousands of
+    idle subscribers cost no more than their open connections.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object.
+    day (str): The date to follow, as YYYY-MM-DD.
+
+    Returns:
+    StreamingHttpResponse: The ``text/event-stream`` response.
+    """
+    day = _events_day(day)
+    await start_listener()
+
+    async def stream():
+        queue = broadcaster.subscribe(day)
+        loop = asyncio.get_running_loop()
+        # Django 4.2 does not notice clients that went away mid-stream, so
+        # streams end after a while and the browser opens a new one
+        closes_at = loop.time() + EVENTS_MAX_AGE
+        try:
+            # Tell the browser how soon to reconnect after the stream ends
+            yield f'retry: {EVENTS_KEEPALIVE * 1000}\n\n'
+            while loop.time() < closes_at:
+                try:
+                    message = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing the idle connection
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f'event: capacity\ndata: {message}\n\n'
+        finally:
+            broadcaster.unsubscribe(day, queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def capacity_poll_view(request, day):
+    """
+    Long-poll fallback for clients that cannot use capacity_events_view:
+    waits for the next capacity change of one date.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object.
+    day (str): The date to follow, as YYYY-MM-DD.
+
+    Returns:
+    HttpResponse: The JSON message of the change, or 204 if nothing changed
+        within EVENTS_POLL_TIMEOUT seconds.
+    """
+    day = _events_day(day)
+    await start_listener()
+
+    queue = broadcaster.subscribe(day)
+    try:
+        message = await asyncio.wait_for(queue.get(), EVENTS_POLL_TIMEOUT)
+    except asyncio.TimeoutError:
+        return HttpResponse(status=204)
+    finally:
+        broadcaster.unsubscribe(day, queue)
+
+    response = HttpResponse(message, content_type='application/json')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Expose the request, SQL and reservation outcome metrics of all workers
+    in the Prometheus text format. Only staff users, or scrapers sending
+    RESERVATION_METRICS_TOKEN as a bearer token, may read them.
+
+    Parameters:
+    request (HttpRequest): The HTTP request object.
+
+    Returns:
+    HttpResponse: The metrics, 403 for other users, or 404 if metrics are
+        disabled.
+    """
+    if get_metrics_cache() is None:
+        raise Http404('Metrics are disabled.')
+
+    token = settings.RESERVATION_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff
+            or token and constant_time_compare(authorization, f'Bearer {token}')):
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -26,6 +26,15 @@ SECRET_KEY = env.str('DJANGO_SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = env.bool('DJANGO_DEBUG')
 
+# 'development' or 'production'. The production profile keeps database
+# connections open between requests and serves the collected static files,
+# each can still be set on its own below. DJANGO_SERVER picks the server
+# entrypoint.sh starts in production: 'gunicorn' runs WSGI workers, 'uvicorn'
+# runs ASGI workers for the async pages and event streams.
+DJANGO_PROFILE = env.str('DJANGO_PROFILE', default='development')
+DJANGO_SERVER = env.str('DJANGO_SERVER', default='gunicorn')
+PRODUCTION = DJANGO_PROFILE == 'production'
+
 ALLOWED_HOSTS = [
     'api.tasksphere.ir',
     '127.0.0.1',
@@ -52,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'reservation.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -60,6 +70,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'reservation.middleware.ReplicaRoutingMiddleware',
+    'reservation.middleware.ThrottleMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -96,9 +108,152 @@ DATABASES = {
         'PASSWORD': env.str('POSTGRES_PASSWORD'),
         'HOST': env.str('POSTGRES_HOST'),
         'PORT': env.str('POSTGRES_PORT'),
+        # Seconds a connection is reused for before it is closed, 0 closes it
+        # after every request. ASGI servers run each request in a new thread
+        # and would leak persistent connections, use a pooler such as
+        # PgBouncer with them instead.
+        'CONN_MAX_AGE': env.int(
+            'POSTGRES_CONN_MAX_AGE', default=60 if PRODUCTION and DJANGO_SERVER == 'gunicorn' else 0),
+        # Check a reused connection before the first query of each request,
+        # so a connection dropped by the database does not fail the request
+        'CONN_HEALTH_CHECKS': env.bool('POSTGRES_CONN_HEALTH_CHECKS', default=PRODUCTION),
     }
 }
 
+# Comma separated host[:port] of read replicas of the primary, with the
+# credentials of the primary. The reads of GET requests go to one of them,
+# writes and transactions always go to the primary.
+POSTGRES_REPLICA_HOSTS = [host for host in env.list('POSTGRES_REPLICA_HOSTS', default=[]) if host]
+for number, replica_host in enumerate(POSTGRES_REPLICA_HOSTS, 1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        # Tests give each replica a database of its own that only holds the
+        # rows they copy to it, standing in for a lagging replica
+        'TEST': {'NAME': f'test_{DATABASES["default"]["NAME"]}_replica{number}'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['reservation.routers.PrimaryReplicaRouter']
+
+# Seconds the reads of a client stick to the primary after it wrote, so it
+# sees its own reservations before they reach the replicas. Keep it above
+# the replication lag.
+RESERVATION_REPLICA_STICKY_SECONDS = env.int('RESERVATION_REPLICA_STICKY_SECONDS', default=5)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Use Redis when REDIS_URL is set so caches are shared between workers,
+# otherwise fall back to a per-process in-memory cache
+REDIS_URL = env.str('REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Cache alias holding the remaining seats of timeslots in front of the
+# database, so sold-out reservations are rejected early. Empty disables it.
+RESERVATION_ADMISSION_CACHE = env.str('RESERVATION_ADMISSION_CACHE', default='')
+
+# Cache alias holding the bookable timeslots per date for the home page.
+# Empty disables it. Entries are invalidated on every change made through
+# the reservation app, the timeout bounds staleness for any other change.
+RESERVATION_AVAILABILITY_CACHE = env.str('RESERVATION_AVAILABILITY_CACHE', default='')
+RESERVATION_AVAILABILITY_CACHE_TIMEOUT = env.int('RESERVATION_AVAILABILITY_CACHE_TIMEOUT', default=30)
+
+# Seconds a held seat stays reserved before it has to be confirmed
+RESERVATION_HOLD_TTL = env.int('RESERVATION_HOLD_TTL', default=300)
+
+# Seconds the outcome of a reservation request sent with an Idempotency-Key
+# is replayed to retries of the same request
+RESERVATION_IDEMPOTENCY_TTL = env.int('RESERVATION_IDEMPOTENCY_TTL', default=60 * 60 * 24)
+
+# Cache alias holding the counters used to shed excess reservation requests
+# with a 429. Empty disables throttling. Rate limits count requests per
+# sliding window of RESERVATION_THROTTLE_WINDOW seconds, concurrency limits
+# count requests in flight. 0 disables a limit.
+RESERVATION_THROTTLE_CACHE = env.str('RESERVATION_THROTTLE_CACHE', default='')
+RESERVATION_THROTTLE_WINDOW = env.int('RESERVATION_THROTTLE_WINDOW', default=10)
+RESERVATION_USER_RATE_LIMIT = env.int('RESERVATION_USER_RATE_LIMIT', default=10)
+RESERVATION_USER_CONCURRENCY = env.int('RESERVATION_USER_CONCURRENCY', default=2)
+RESERVATION_TIMESLOT_RATE_LIMIT = env.int('RESERVATION_TIMESLOT_RATE_LIMIT', default=500)
+RESERVATION_TIMESLOT_CONCURRENCY = env.int('RESERVATION_TIMESLOT_CONCURRENCY', default=50)
+
+# Cache alias the request and SQL metrics of all workers are added up in,
+# served in the Prometheus format at /metrics. Empty disables metrics. Each
+# worker flushes its counts every RESERVATION_METRICS_FLUSH_INTERVAL seconds.
+# Scrapers authenticate with a staff session or RESERVATION_METRICS_TOKEN
+# as a bearer token, empty disables the token.
+RESERVATION_METRICS_CACHE = env.str('RESERVATION_METRICS_CACHE', default='')
+RESERVATION_METRICS_FLUSH_INTERVAL = env.int('RESERVATION_METRICS_FLUSH_INTERVAL', default=5)
+RESERVATION_METRICS_TOKEN = env.str('RESERVATION_METRICS_TOKEN', default='')
+
+
+# Sessions and messages
+# https://docs.djangoproject.com/en/4.2/topics/http/sessions/#configuring-the-session-engine
+
+# Where sessions are stored: 'db' reads the session table on every request,
+# 'cached_db' reads it from the cache named by SESSION_CACHE_ALIAS and only
+# writes through to the table, 'signed_cookies' keeps the session in a
+# signed cookie and never touches the database. Signed cookie sessions are
+# readable by the client and cannot be revoked on the server before they
+# expire. Except with 'db', flash messages are kept in a cookie too, so
+# showing them does not load or save the session.
+SESSION_STORAGE = env.str('SESSION_STORAGE', default='db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_STORAGE]
+SESSION_CACHE_ALIAS = env.str('SESSION_CACHE_ALIAS', default='default')
+if SESSION_STORAGE != 'db':
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+# Users log in with their username or their email, in any case
+AUTHENTICATION_BACKENDS = ['authentication.backends.EmailOrUsernameBackend']
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+
+# Hasher new passwords are hashed with: 'pbkdf2' with
+# PASSWORD_PBKDF2_ITERATIONS iterations, 'scrypt', or 'argon2' which needs
+# the argon2-cffi package. Hashes made with the other hashers still verify
+# and are rehashed with the selected one when their user logs in. Compare
+# the cost of each with the benchmark_login command.
+PASSWORD_HASHER_PROFILE = env.str('PASSWORD_HASHER_PROFILE', default='pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = env.int('PASSWORD_PBKDF2_ITERATIONS', default=600000)
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'authentication.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in _PASSWORD_HASHERS.items() if profile != PASSWORD_HASHER_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Cache alias counting failed logins. Empty disables login throttling. A
+# username or a client IP with as many failures within LOGIN_FAILURE_WINDOW
+# seconds as its limit is rejected before the password is hashed. 0
+# disables a limit.
+LOGIN_THROTTLE_CACHE = env.str('LOGIN_THROTTLE_CACHE', default='default')
+LOGIN_FAILURE_WINDOW = env.int('LOGIN_FAILURE_WINDOW', default=900)
+LOGIN_USERNAME_FAILURE_LIMIT = env.int('LOGIN_USERNAME_FAILURE_LIMIT', default=5)
+LOGIN_IP_FAILURE_LIMIT = env.int('LOGIN_IP_FAILURE_LIMIT', default=50)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -119,6 +274,10 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Where login_required sends anonymous users
+LOGIN_URL = 'login'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -135,6 +294,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Serve the files collected into STATIC_ROOT from the application with
+# WhiteNoise, compressed and with far-future cache headers on their hashed
+# names, so no separate static file server is needed
+DJANGO_SERVE_STATIC = env.bool('DJANGO_SERVE_STATIC', default=PRODUCTION)
+if DJANGO_SERVE_STATIC:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'whitenoise.middleware.WhiteNoiseMiddleware')
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field